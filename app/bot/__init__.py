@@ -2,14 +2,18 @@ import logging
 
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 
-from app.bot.config import BOT_TOKEN
+from app.bot.config import BOT_TOKEN, TELEGRAM_API_SERVER
+from app.bot.utils.logs import configure_logging
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(filename)s:%(lineno)d #%(levelname)-8s [%(asctime)s] - %(name)s - %(message)s",
-)
+# levels, format and payload limits come from LOG_* in the config
+configure_logging()
 
 logger = logging.getLogger(__name__)
-bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
\ No newline at end of file
+
+# a self-hosted Bot API server (or a fake one in load tests) instead of api.telegram.org
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER)) if TELEGRAM_API_SERVER else None
+bot = Bot(BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
\ No newline at end of file
@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+from app.bot import logger
+from app.bot.config import HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST, HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT
+from app.bot.utils.metrics import registry, CallbackMetric
+from app.bot.utils.singleton import singleton
+
+
+@dataclass
+class ConnectionStats:
+    requests: int = 0
+    connections_created: int = 0
+    connections_reused: int = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        """
+        Share of requests served over an already open connection.
+        """
+        total = self.connections_created + self.connections_reused
+        return self.connections_reused / total if total else 0.0
+
+
+@singleton
+class HttpClient:
+    """
+    Long-lived aiohttp session shared by the API clients.
+
+    Created on startup and closed on shutdown by Startup, so keep-alive connections
+    to the backends survive between user requests.
+    """
+
+    def __init__(self, limit: int = HTTP_POOL_LIMIT, limit_per_host: int = HTTP_POOL_LIMIT_PER_HOST,
+                 dns_cache_ttl: int = HTTP_DNS_CACHE_TTL, keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT):
+        """
+        Args:
+            limit (int): Maximum number of open connections.
+            limit_per_host (int): Maximum number of open connections to one host.
+            dns_cache_ttl (int): Seconds a resolved address is reused.
+            keepalive_timeout (float): Seconds an idle connection is kept open.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.stats = ConnectionStats()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        The shared session. Opened lazily if start() was not called, e.g. in scripts.
+        """
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    async def start(self) -> None:
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        logger.info(f"HTTP client started (limit={self.limit}, limit_per_host={self.limit_per_host})")
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        logger.info(
+            f"HTTP client closed: {self.stats.requests} requests, {self.stats.connections_created} connections opened, "
+            f"reuse ratio {self.stats.reuse_ratio:.2f}"
+        )
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        return aiohttp.ClientSession(connector=connector, trace_configs=[self._trace_config()])
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.stats.requests += 1
+
+        async def on_connection_create_end(session, context, params):
+            self.stats.connections_created += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.stats.connections_reused += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+
+registry.register(CallbackMetric(
+    "http_client_requests_total", "Requests made through the shared HTTP client.", "counter",
+    lambda: {(): HttpClient().stats.requests}))
+registry.register(CallbackMetric(
+    "http_client_connections_total", "Connections used by the shared HTTP client, new or reused from the pool.",
+    "counter",
+    lambda: {("created",): HttpClient().stats.connections_created, ("reused",): HttpClient().stats.connections_reused},
+    ["state"]))
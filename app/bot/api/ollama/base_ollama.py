@@ -1,14 +1,16 @@
 from abc import ABC, abstractmethod
 from typing import Optional, AsyncGenerator
 
-from app.bot.config import available_llm_models
+from app.bot.api.http_client import HttpClient
+from app.bot.config import available_llm_models, OLLAMA_KEEP_ALIVE
 
 
 class BaseOllama(ABC):
     def __init__(self, prompt: str, model: available_llm_models = available_llm_models,
-                 stream: bool = False, endpoint: str = "http://ollama:11434/api/generate",
+                 stream: bool = False, endpoint: Optional[str] = None,
                  system_prompt: Optional[str] = None, temperature: float = 0,
-                 max_context: int = 32768, jsonify: bool = False):
+                 max_context: Optional[int] = None, jsonify: bool = False, http_client: Optional[HttpClient] = None,
+                 keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE, num_predict: Optional[int] = None):
         """
         Initialize the BaseLlama class.
 
@@ -16,8 +18,13 @@ class BaseOllama(ABC):
             prompt (str): The input prompt for the model.
             model (Literal["qwen2"], optional): The model to use. Defaults to "qwen2".
             stream (bool, optional): Whether to stream the response. Defaults to False.
-            endpoint (str, optional): The API endpoint to send the request to. Defaults to "http://ollama:11434/api/generate".
+            endpoint (str, optional): The API endpoint to send the request to. By default a backend of OLLAMA_BACKENDS is picked per request.
             system_prompt (str, optional): System prompt for the model.
+            max_context (int, optional): num_ctx of the request, or the bigger one the backend has the model loaded with.
+                By default the smallest bucket that fits the prompt and the answer.
+            http_client (HttpClient, optional): Pooled HTTP client. Defaults to the application-wide one.
+            keep_alive (str, optional): How long Ollama keeps the model in memory after the request, e.g. "30m".
+            num_predict (int, optional): Maximum number of tokens to generate.
         """
         self.prompt = prompt
         self.model = model
@@ -27,6 +34,9 @@ class BaseOllama(ABC):
         self.temperature = temperature
         self.max_context = max_context
         self.jsonify = jsonify
+        self.http_client = http_client or HttpClient()
+        self.keep_alive = keep_alive
+        self.num_predict = num_predict
         self.response = None
 
     @abstractmethod
@@ -38,6 +48,15 @@ class BaseOllama(ABC):
         and store the response in self.response.
         """
 
+    @abstractmethod
+    async def warm_up(self) -> None:
+        """
+        Load the model into memory without generating anything.
+
+        This method should be implemented by subclasses so the first real request
+        does not pay for loading the model.
+        """
+
     @abstractmethod
     async def stream_response(self) -> AsyncGenerator[str, None]:
         """
@@ -0,0 +1,179 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from app.bot import logger
+from app.bot.config import NUM_CTX_BUCKETS, LLM_TOKENIZER, OLLAMA_KEEP_ALIVE
+from app.bot.utils.singleton import singleton
+
+# rough ratio for russian text with the qwen tokenizer, used until there are samples to calibrate on
+CHARS_PER_TOKEN = 3.0
+
+# special tokens of the chat template around the system prompt and the prompt
+TEMPLATE_TOKENS = 32
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(h|ms|m|s)")
+_DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+
+def keep_alive_seconds(keep_alive: Optional[str]) -> float:
+    """
+    Converts an Ollama keep_alive value ("30m", "1h30m", "300", "-1") into seconds.
+    Negative values keep the model loaded forever, no value means Ollama's default of five minutes.
+    """
+    if keep_alive is None:
+        return 300.0
+
+    try:
+        seconds = float(keep_alive)
+    except ValueError:
+        seconds = sum(float(value) * _DURATION_UNITS[unit] for value, unit in _DURATION_PART.findall(keep_alive))
+        if keep_alive.startswith('-'):
+            seconds = -seconds
+
+    return math.inf if seconds < 0 else seconds
+
+
+@singleton
+class ContextWindow:
+    """
+    Counts prompt tokens and picks num_ctx for requests to Ollama.
+
+    Tokens are counted with the model tokenizer when LLM_TOKENIZER is set. Otherwise they are estimated
+    from a chars-per-token ratio calibrated on the responses of Ollama: the final chunk carries the tokens
+    of the whole prompt (`context` minus the generated tokens), so the ratio is learned per model even when
+    the system prompt came from the KV cache and prompt_eval_count is small. A low quantile of the recent
+    ratios is used, as underestimating a prompt makes Ollama cut its beginning, the system prompt.
+
+    num_ctx is the smallest of a few coarse buckets that fits the prompt and the answer: a KV cache of 32k
+    tokens is mostly wasted memory for a question with a few passages. Ollama reloads a model whenever
+    num_ctx changes though, so while the backend a request goes to still has the model loaded with a bigger
+    bucket that fits, that bucket is kept. Every backend loads its models on its own.
+    """
+
+    def __init__(self, buckets: Sequence[int] = NUM_CTX_BUCKETS, tokenizer: str = LLM_TOKENIZER,
+                 chars_per_token: float = CHARS_PER_TOKEN, window: int = 100, quantile: float = 0.1,
+                 keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE):
+        """
+        Args:
+            buckets (Sequence[int]): Allowed num_ctx values.
+            tokenizer (str): Hugging Face repository or path of a tokenizer.json, empty to estimate.
+            chars_per_token (float): Ratio used before calibration.
+            window (int): Calibration samples kept per model.
+            quantile (float): Quantile of the samples used as the ratio.
+            keep_alive (str, optional): keep_alive of the requests, for how long a loaded bucket is kept.
+        """
+        self.buckets: List[int] = sorted(set(buckets))
+        self.tokenizer_name = tokenizer
+        self.chars_per_token = chars_per_token
+        self.quantile = quantile
+        self.keep_alive = keep_alive_seconds(keep_alive)
+
+        self._samples: Dict[str, Deque[float]] = {}
+        self._window = window
+        self._ratios: Dict[str, float] = {}
+        # (backend, model) -> (num_ctx, time it is unloaded)
+        self._loaded: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._tokenizer = None
+        self._tokenizer_failed = False
+        self._lock = threading.Lock()
+
+    def count(self, text: str, model: str) -> int:
+        """
+        :return: Number of tokens of the text for the model, estimated unless a tokenizer is configured.
+        """
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False).ids)
+        return math.ceil(len(text) / self.ratio(model))
+
+    def ratio(self, model: str) -> float:
+        return self._ratios.get(model, self.chars_per_token)
+
+    def calibrate(self, model: str, prompt_chars: int, result: dict) -> None:
+        """
+        Learns the chars-per-token ratio from the final chunk of a generation.
+
+        :param model: The model.
+        :param prompt_chars: Length of the system prompt and the prompt.
+        :param result: The final chunk of the response.
+        """
+        context = result.get('context')
+        if context:
+            prompt_tokens = len(context) - result.get('eval_count', 0)
+        else:
+            # prompt_eval_count leaves out a cached prefix, the low quantile takes care of that
+            prompt_tokens = result.get('prompt_eval_count', 0)
+        if prompt_chars < 200 or prompt_tokens <= 0:
+            # the chat template dominates short prompts
+            return
+
+        with self._lock:
+            samples = self._samples.setdefault(model, deque(maxlen=self._window))
+            samples.append(prompt_chars / prompt_tokens)
+            ordered = sorted(samples)
+            self._ratios[model] = ordered[int(self.quantile * (len(ordered) - 1))]
+
+    def num_ctx(self, model: str, tokens: int, limit: Optional[int] = None, backend: Optional[str] = None) -> int:
+        """
+        Picks num_ctx for a request.
+
+        :param model: The model.
+        :param tokens: Tokens of the prompt and the answer.
+        :param limit: The largest allowed num_ctx.
+        :param backend: The backend the request goes to, None while it is not picked yet.
+        :return: The smallest sufficient bucket, the bucket the backend has the model loaded with if that one
+            is bigger and fits under the limit, the largest allowed bucket if nothing is sufficient.
+        """
+        allowed = [bucket for bucket in self.buckets if limit is None or bucket <= limit] or self.buckets[:1]
+        chosen = next((bucket for bucket in allowed if bucket >= tokens), allowed[-1])
+
+        loaded = self.loaded_num_ctx(backend, model) if backend is not None else None
+        if loaded is not None and chosen < loaded <= allowed[-1]:
+            return loaded
+        return chosen
+
+    def loaded_num_ctx(self, backend: str, model: str) -> Optional[int]:
+        """
+        :return: num_ctx the backend has the model loaded with, None if it is not loaded there.
+        """
+        loaded = self._loaded.get((backend, model))
+        if loaded is None or loaded[1] <= time.monotonic():
+            return None
+        return loaded[0]
+
+    def loaded(self, backend: str, model: str, num_ctx: int) -> None:
+        """
+        Remembers the num_ctx a request to the model was sent to the backend with,
+        the backend has the model loaded with it now.
+        """
+        self._loaded[(backend, model)] = (num_ctx, time.monotonic() + self.keep_alive)
+
+    def load_tokenizer(self) -> None:
+        """
+        Loads the tokenizer ahead of the first request, from_pretrained may download it.
+        Blocking, run it in an executor: counting tokens on the event loop would otherwise load it there.
+        """
+        self._get_tokenizer()
+
+    def _get_tokenizer(self):
+        if not self.tokenizer_name or self._tokenizer_failed:
+            return None
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None and not self._tokenizer_failed:
+                    try:
+                        from tokenizers import Tokenizer
+
+                        if os.path.isfile(self.tokenizer_name):
+                            self._tokenizer = Tokenizer.from_file(self.tokenizer_name)
+                        else:
+                            self._tokenizer = Tokenizer.from_pretrained(self.tokenizer_name)
+                    except Exception as e:
+                        logger.warning(f"Failed to load tokenizer {self.tokenizer_name}, estimating tokens: {e}")
+                        self._tokenizer_failed = True
+        return self._tokenizer
@@ -1,20 +1,34 @@
+import asyncio
 import json
+from contextlib import asynccontextmanager
 from time import perf_counter
-from typing import override, final, Optional, AsyncGenerator
+from typing import override, final, Optional, AsyncGenerator, AsyncIterator, Awaitable, Set, TypeVar
 
 import aiohttp
 
 from app.bot import logger
+from app.bot.api.http_client import HttpClient
 from app.bot.api.ollama.base_ollama import BaseOllama
-from app.bot.config import available_llm_models
+from app.bot.api.ollama.context_window import ContextWindow, TEMPLATE_TOKENS
+from app.bot.api.ollama.pool import OllamaPool
+from app.bot.api.ollama.resilience import (LLMError, LLMTimeoutError, LLMBackendError, CircuitOpenError,
+                                           get_circuit_breaker, retry_delay)
+from app.bot.api.ollama.router import ModelRouter
+from app.bot.config import (available_llm_models, OLLAMA_KEEP_ALIVE, ANSWER_MAX_TOKENS, OLLAMA_CONNECT_TIMEOUT,
+                            OLLAMA_FIRST_TOKEN_TIMEOUT, OLLAMA_STALL_TIMEOUT, OLLAMA_TOTAL_TIMEOUT, OLLAMA_RETRIES)
+from app.bot.utils.metrics import (record_generation_stats, llm_generation_duration, llm_time_to_first_token,
+                                   llm_request_failures, llm_retries)
+
+T = TypeVar('T')
 
 
 @final
 class Ollama(BaseOllama):
     def __init__(self, prompt: str, model: available_llm_models = available_llm_models,
-                 stream: bool = False, endpoint: str = "http://localhost:11434/api/generate",
+                 stream: bool = False, endpoint: Optional[str] = None,
                  system_prompt: Optional[str] = None, temperature: float = 0.1,
-                 max_context: int = 32768, jsonify: bool = False):
+                 max_context: Optional[int] = None, jsonify: bool = False, http_client: Optional[HttpClient] = None,
+                 keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE, num_predict: Optional[int] = None):
         """
         Initialize the Llama class.
 
@@ -22,29 +36,48 @@ class Ollama(BaseOllama):
             prompt (str): The input prompt for the model.
             model (Literal["qwen2"], optional): The model to use.".
             stream (bool, optional): Whether to stream the response. Defaults to False.
-            endpoint (str, optional): The API endpoint to send the request to. Defaults to "http://ollama:11434/api/generate".
+            endpoint (str, optional): The API endpoint to send the request to. By default a backend of OllamaPool.
             system_prompt (str, optional): System prompt for the model.
-            max_context (int): The maximum number of tokens in the context that the neural network can process
+            max_context (int, optional): The maximum number of tokens in the context that the neural network can process.
+                A bigger num_ctx the picked backend has the model loaded with is kept. By default the smallest
+                bucket that fits the prompt and the answer, see ContextWindow.
             jsonify (bool): obliges the neural network to respond in the form of json
+            http_client (HttpClient, optional): Pooled HTTP client. Defaults to the application-wide one.
+            keep_alive (str, optional): How long Ollama keeps the model in memory after the request, e.g. "30m".
+            num_predict (int, optional): Maximum number of tokens to generate.
         """
-        super().__init__(prompt=prompt, model=model, stream=stream, endpoint=endpoint, system_prompt=system_prompt, temperature=temperature, max_context=max_context, jsonify=jsonify)
+        super().__init__(prompt=prompt, model=model, stream=stream, endpoint=endpoint, system_prompt=system_prompt, temperature=temperature, max_context=max_context, jsonify=jsonify, http_client=http_client, keep_alive=keep_alive, num_predict=num_predict)
 
-    @override
-    async def send_request(self) -> None:
+    def _num_ctx(self, endpoint: str) -> int:
         """
-        Send a request to the model.
+        num_ctx of a request to the backend: max_context or the bucket of the prompt, or the bigger bucket
+        the backend has the model loaded with, so that it is not loaded again.
+        """
+        window = ContextWindow()
+        if self.max_context is not None:
+            loaded = window.loaded_num_ctx(endpoint, self.model)
+            return loaded if loaded is not None and loaded > self.max_context else self.max_context
 
-        This method sends a POST request to the specified endpoint with the given prompt,
-        model, and stream settings. The response is stored in self.response.
+        tokens = (window.count(self.system_prompt or "", self.model) + window.count(self.prompt, self.model)
+                  + TEMPLATE_TOKENS + (self.num_predict or ANSWER_MAX_TOKENS))
+        return window.num_ctx(self.model, tokens, backend=endpoint)
+
+    def _prompt_chars(self) -> int:
+        return len(self.system_prompt or "") + len(self.prompt)
+
+    def _build_payload(self, endpoint: str, stream: bool) -> dict:
+        """
+        Builds the request to the backend, which has the model loaded with its num_ctx afterwards.
         """
-        url = self.endpoint
+        num_ctx = self._num_ctx(endpoint)
+        ContextWindow().loaded(endpoint, self.model, num_ctx)
         data = {
             "model": self.model,
             "prompt": self.prompt,
-            "stream": self.stream,
+            "stream": stream,
             "options": {
                 "temperature": self.temperature,
-                "num_ctx": self.max_context,
+                "num_ctx": num_ctx,
             },
         }
 
@@ -54,55 +87,236 @@ class Ollama(BaseOllama):
         if self.jsonify:
             data['format'] = 'json'
 
-        start_time = perf_counter()
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data, timeout=1111) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    self.response = result
-                    logger.info("Response from server:", result)
-                else:
-                    logger.warning(f"Error: {response.status}\n{await response.json()}")
+        if self.keep_alive is not None:
+            data['keep_alive'] = self.keep_alive
+
+        if self.num_predict is not None:
+            data['options']['num_predict'] = self.num_predict
+
+        return data
+
+    @asynccontextmanager
+    async def _connect(self, failed: Optional[Set[str]] = None) -> AsyncIterator[str]:
+        """
+        Picks a backend and runs a request through its circuit breaker, turning the failures into LLMError.
+
+        Args:
+            failed (Set[str], optional): Endpoints earlier attempts of the same request failed on, updated
+                with this one. A retry that fails on the same backend again is not counted by its breaker twice.
+
+        Yields:
+            str: The endpoint to send the request to.
+        """
+        async with OllamaPool().acquire(self.model, self.endpoint) as backend:
+            async with self._guard(backend.generate_url, failed):
+                yield backend.generate_url
+
+    @asynccontextmanager
+    async def _guard(self, endpoint: str, failed: Optional[Set[str]] = None) -> AsyncIterator[None]:
+        breaker = get_circuit_breaker(endpoint)
+
+        def failure() -> None:
+            breaker.record_failure(repeated=failed is not None and endpoint in failed)
+            if failed is not None:
+                failed.add(endpoint)
+
+        try:
+            breaker.before_request()
+        except CircuitOpenError:
+            llm_request_failures.inc(endpoint=endpoint, reason="circuit_open")
+            raise
+
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            # the caller gave up, that says nothing about the backend
+            breaker.record_cancel()
+            raise
+        except LLMBackendError as e:
+            llm_request_failures.inc(endpoint=endpoint, reason="status")
+            if e.retryable:
+                failure()
+            else:
+                # the backend is up, the request is wrong
+                breaker.record_success()
+            raise
+        except LLMTimeoutError as e:
+            llm_request_failures.inc(endpoint=endpoint, reason=e.phase)
+            failure()
+            raise
+        except aiohttp.ConnectionTimeoutError:
+            llm_request_failures.inc(endpoint=endpoint, reason="connect")
+            failure()
+            raise LLMTimeoutError("connect", OLLAMA_CONNECT_TIMEOUT) from None
+        except asyncio.TimeoutError:
+            llm_request_failures.inc(endpoint=endpoint, reason="total")
+            failure()
+            raise LLMTimeoutError("total", OLLAMA_TOTAL_TIMEOUT) from None
+        except LLMError:
+            llm_request_failures.inc(endpoint=endpoint, reason="protocol")
+            failure()
+            raise
+        except aiohttp.ClientError as e:
+            llm_request_failures.inc(endpoint=endpoint, reason="connection")
+            failure()
+            raise LLMError(f"{type(e).__name__}: {e}") from e
+        except ValueError as e:
+            # a response that is not the JSON of Ollama
+            llm_request_failures.inc(endpoint=endpoint, reason="protocol")
+            failure()
+            raise LLMError(f"Malformed response: {e}") from e
+        except BaseException:
+            breaker.record_cancel()
+            raise
+        else:
+            breaker.record_success()
+
+    @override
+    async def send_request(self) -> None:
+        """
+        Send a request to the model.
+
+        This method sends a POST request to the specified endpoint with the given prompt,
+        model, and stream settings. The response is stored in self.response. Connection errors,
+        timeouts and 5xx are retried OLLAMA_RETRIES times with jittered exponential backoff.
+
+        Raises:
+            LLMError: The request failed. CircuitOpenError right away while the backend is down.
+        """
+        attempt = 0
+        # a request counts as one failure for the breaker of a backend, however often it is retried there
+        failed: Set[str] = set()
+        while True:
+            start_time = perf_counter()
+            try:
+                result = await self._post(failed)
+                break
+            except CircuitOpenError:
+                raise
+            except LLMError as e:
+                if attempt >= OLLAMA_RETRIES or (isinstance(e, LLMBackendError) and not e.retryable):
+                    raise
+                delay = retry_delay(attempt)
+                attempt += 1
+                llm_retries.inc(model=self.model)
+                logger.warning(f"Request to {self.model} failed ({e}), retry {attempt} in {delay:.1f} s")
+                await asyncio.sleep(delay)
+
+        self.response = result
+        logger.debug(f"Response of {self.model}: {result.get('response', '')}")
+        record_generation_stats(self.model, result)
+        ContextWindow().calibrate(self.model, self._prompt_chars(), result)
+        llm_generation_duration.observe(perf_counter() - start_time, model=self.model)
 
         logger.info(f"The LLM response was {perf_counter() - start_time} second")
 
+    async def _post(self, failed: Optional[Set[str]] = None) -> dict:
+        timeout = aiohttp.ClientTimeout(total=OLLAMA_TOTAL_TIMEOUT, sock_connect=OLLAMA_CONNECT_TIMEOUT)
+        async with self._connect(failed) as endpoint:
+            data = self._build_payload(endpoint, stream=self.stream)
+            async with self.http_client.session.post(endpoint, json=data, timeout=timeout) as response:
+                if response.status != 200:
+                    raise LLMBackendError(response.status, await response.text())
+                return await response.json()
+
+    @override
+    async def warm_up(self) -> None:
+        """
+        Load the model into memory without generating anything.
+
+        Ollama treats a request without a prompt as a load request. num_ctx is sent as well,
+        because a different context size would make Ollama load the model again on the first question.
+
+        Raises:
+            LLMError: The model could not be loaded.
+        """
+        start_time = perf_counter()
+        # loading takes as long as it takes to the first token of a cold model
+        timeout = aiohttp.ClientTimeout(total=OLLAMA_FIRST_TOKEN_TIMEOUT, sock_connect=OLLAMA_CONNECT_TIMEOUT)
+        async with self._connect() as endpoint:
+            data = {
+                "model": self.model,
+                "options": {"num_ctx": self._num_ctx(endpoint)},
+            }
+            ContextWindow().loaded(endpoint, self.model, data['options']['num_ctx'])
+
+            if self.keep_alive is not None:
+                data['keep_alive'] = self.keep_alive
+
+            async with self.http_client.session.post(endpoint, json=data, timeout=timeout) as response:
+                if response.status != 200:
+                    raise LLMBackendError(response.status, await response.text())
+
+        logger.info(f"Model {self.model} loaded in {perf_counter() - start_time:.2f} second")
+
     @override
     async def stream_response(self) -> AsyncGenerator[str, None]:
         """
         Stream the response from the model.
 
         This method sends a POST request with streaming enabled and yields parts of the response
-        as they are received, enabling real-time streaming of the model's output.
+        as they are received, enabling real-time streaming of the model's output. The first token
+        must arrive within OLLAMA_FIRST_TOKEN_TIMEOUT, the following chunks at most OLLAMA_STALL_TIMEOUT
+        apart and the whole response within OLLAMA_TOTAL_TIMEOUT. Streams are not retried, a part
+        of the answer may already be shown.
 
         Yields:
             str: The next part of the response.
+
+        Raises:
+            LLMError: The request failed or a deadline passed. CircuitOpenError right away while the backend is down.
         """
-        url = self.endpoint
-        data = {
-            "model": self.model,
-            "prompt": self.prompt,
-            "stream": True,
-            "options": {
-                "temperature": self.temperature,
-                "num_ctx": self.max_context,
-            },
-        }
+        context_window = ContextWindow()
 
-        if self.system_prompt is not None:
-            data["system"] = self.system_prompt
+        loop = asyncio.get_running_loop()
+        start_time = perf_counter()
+        started = loop.time()
+        first_token_at = started + OLLAMA_FIRST_TOKEN_TIMEOUT
+        finish_at = started + OLLAMA_TOTAL_TIMEOUT
+        waiting_for_first_token = True
+        time_to_first_token = None
+        session = self.http_client.session
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=OLLAMA_CONNECT_TIMEOUT)
 
-        if self.jsonify:
-            data['format'] = 'json'
+        async with self._connect() as endpoint:
+            data = self._build_payload(endpoint, stream=True)
+            response = await _within(session.post(endpoint, json=data, timeout=timeout), first_token_at, finish_at, "first_token")
+            async with response:
+                if response.status != 200:
+                    raise LLMBackendError(response.status, await response.text())
+
+                while True:
+                    if waiting_for_first_token:
+                        line = await _within(response.content.readline(), first_token_at, finish_at, "first_token")
+                    else:
+                        line = await _within(response.content.readline(), loop.time() + OLLAMA_STALL_TIMEOUT,
+                                             finish_at, "stall")
+                    if not line:
+                        raise LLMError("the stream ended before the answer was complete")
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data) as response:
-                if response.status == 200:
-                    async for line in response.content:
-                        line = line.decode('utf-8')
-                        jsn = json.loads(line)
-                        yield jsn['response']
-                else:
-                    logger.warning(f"Error: {response.status}\n{await response.json()}")
+                    jsn = json.loads(line.decode('utf-8'))
+                    if 'error' in jsn:
+                        raise LLMBackendError(500, jsn['error'])
+
+                    if waiting_for_first_token and jsn.get('response'):
+                        time_to_first_token = perf_counter() - start_time
+                        llm_time_to_first_token.observe(time_to_first_token, model=self.model)
+                        waiting_for_first_token = False
+
+                    if jsn.get('done'):
+                        # the final chunk carries prompt_eval_count, eval_count and the durations
+                        record_generation_stats(self.model, jsn)
+                        if time_to_first_token is not None:
+                            # the load time is only known now, a cold start must not count against the SLO
+                            ModelRouter().observe_first_token(self.model, time_to_first_token,
+                                                              jsn.get('load_duration', 0) / 1e9)
+                        context_window.calibrate(self.model, self._prompt_chars(), jsn)
+                        llm_generation_duration.observe(perf_counter() - start_time, model=self.model)
+
+                    yield jsn['response']
+
+                    if jsn.get('done'):
+                        break
 
     @override
     def get_formatted_response(self) -> str:
@@ -115,4 +329,24 @@ class Ollama(BaseOllama):
             str: The formatted response.
         """
         assert self.response is not None
-        return self.response['response']
\ No newline at end of file
+        return self.response['response']
+
+
+async def _within(awaitable: Awaitable[T], deadline: float, finish_at: float, phase: str) -> T:
+    """
+    Awaits a step of a streamed request before its deadline or the deadline of the whole request.
+
+    :raises LLMTimeoutError: A deadline passed.
+    """
+    loop = asyncio.get_running_loop()
+    if finish_at < deadline:
+        deadline, phase = finish_at, "total"
+
+    try:
+        return await asyncio.wait_for(awaitable, max(deadline - loop.time(), 0))
+    except aiohttp.ServerTimeoutError:
+        # a timeout of aiohttp itself, e.g. while connecting
+        raise
+    except asyncio.TimeoutError:
+        seconds = {"first_token": OLLAMA_FIRST_TOKEN_TIMEOUT, "stall": OLLAMA_STALL_TIMEOUT}.get(phase, OLLAMA_TOTAL_TIMEOUT)
+        raise LLMTimeoutError(phase, seconds) from None
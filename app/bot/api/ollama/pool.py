@@ -0,0 +1,222 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import aiohttp
+
+from app.bot import logger
+from app.bot.api.http_client import HttpClient
+from app.bot.api.ollama.resilience import CircuitOpenError, get_circuit_breaker
+from app.bot.config import OLLAMA_BACKENDS, OLLAMA_HEALTH_INTERVAL, OLLAMA_DRAIN_FILE, OLLAMA_CONNECT_TIMEOUT
+from app.bot.utils.metrics import registry, llm_request_failures, CallbackMetric
+from app.bot.utils.singleton import singleton
+
+GENERATE_PATH = "/api/generate"
+
+# a backend that would have to load the model first counts as this many requests busier
+COLD_MODEL_PENALTY = 2
+
+
+class NoBackendError(CircuitOpenError):
+    """
+    No backend takes requests: all are down, drained or have their circuit open.
+    """
+
+
+def model_tag(model: str) -> str:
+    # Ollama reports "qwen2" as "qwen2:latest"
+    return model if ':' in model else f"{model}:latest"
+
+
+@dataclass
+class Backend:
+    url: str
+    in_flight: int = 0
+    # optimistic until the first health check, the bot must not wait for it
+    healthy: bool = True
+    draining: bool = False
+    # pulled models (/api/tags), None until the first health check
+    models: Optional[Set[str]] = None
+    # models in memory (/api/ps)
+    loaded: Set[str] = field(default_factory=set)
+    last_picked: float = 0.0
+
+    @property
+    def generate_url(self) -> str:
+        return self.url + GENERATE_PATH
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.draining and get_circuit_breaker(self.generate_url).available
+
+    def has_model(self, model: str) -> bool:
+        return self.models is None or model_tag(model) in self.models
+
+
+@singleton
+class OllamaPool:
+    """
+    Spreads generations over several Ollama instances.
+
+    Every request goes to the available backend with the fewest requests in flight. Backends that
+    have the model in memory are preferred, loading it elsewhere costs COLD_MODEL_PENALTY requests.
+    Every OLLAMA_HEALTH_INTERVAL seconds each backend is asked for its models (/api/tags) and the loaded
+    ones (/api/ps); a backend that does not answer is out of rotation until it does.
+
+    A backend listed in OLLAMA_DRAIN_FILE (one URL per line) is drained: it gets no new requests,
+    the running ones complete, and "drained" is logged once the last one is done. The file is shared
+    by all worker processes; remove the line to put the backend back.
+    """
+
+    def __init__(self, urls: List[str] = OLLAMA_BACKENDS, health_interval: float = OLLAMA_HEALTH_INTERVAL,
+                 drain_file: str = OLLAMA_DRAIN_FILE, http_client: Optional[HttpClient] = None):
+        """
+        Args:
+            urls (List[str]): Base URLs of the backends, e.g. http://ollama:11434.
+            health_interval (float): Seconds between health checks, 0 turns them off.
+            drain_file (str): File with the URLs of the backends to drain.
+            http_client (HttpClient, optional): Pooled HTTP client. Defaults to the application-wide one.
+        """
+        self.backends: Dict[str, Backend] = {url.rstrip('/'): Backend(url.rstrip('/')) for url in urls}
+        self.health_interval = health_interval
+        self.drain_file = drain_file
+        self.http_client = http_client or HttpClient()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether any backend takes requests. Handlers switch to the degraded mode otherwise.
+        """
+        return any(backend.available for backend in self.backends.values())
+
+    async def start(self) -> None:
+        if self.health_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def candidates(self, model: str) -> List[Backend]:
+        """
+        :return: Available backends that have the model.
+        """
+        return [backend for backend in self.backends.values() if backend.available and backend.has_model(model)]
+
+    def pick(self, model: str) -> Backend:
+        """
+        :return: The least loaded available backend for the model.
+        :raises NoBackendError: No backend is available.
+        """
+        candidates = self.candidates(model)
+        if not candidates:
+            # none has the model, Ollama explains that better than we do
+            candidates = [backend for backend in self.backends.values() if backend.available]
+        if not candidates:
+            llm_request_failures.inc(endpoint="pool", reason="no_backend")
+            raise NoBackendError("No Ollama backend is available")
+
+        tag = model_tag(model)
+        backend = min(candidates, key=lambda b: (b.in_flight + (0 if tag in b.loaded else COLD_MODEL_PENALTY),
+                                                 b.last_picked))
+        backend.last_picked = time.monotonic()
+        return backend
+
+    @asynccontextmanager
+    async def acquire(self, model: str, endpoint: Optional[str] = None) -> AsyncIterator[Backend]:
+        """
+        Holds a backend for the duration of a request.
+
+        :param model: The model of the request.
+        :param endpoint: Generate URL of a specific backend, e.g. for a warm-up. It need not be in the pool.
+        :raises NoBackendError: No backend is available.
+        """
+        if endpoint is not None:
+            url = endpoint[:-len(GENERATE_PATH)] if endpoint.endswith(GENERATE_PATH) else endpoint
+            backend = self.backends.get(url.rstrip('/')) or Backend(url.rstrip('/'))
+        else:
+            backend = self.pick(model)
+
+        backend.in_flight += 1
+        try:
+            yield backend
+            backend.loaded.add(model_tag(model))
+        finally:
+            backend.in_flight -= 1
+            if backend.draining and backend.in_flight == 0:
+                logger.info(f"Ollama backend {backend.url} is drained")
+
+    def drain(self, url: str, draining: bool = True) -> None:
+        backend = self.backends.get(url.rstrip('/'))
+        if backend is None or backend.draining == draining:
+            return
+
+        backend.draining = draining
+        if not draining:
+            logger.info(f"Ollama backend {backend.url} is back in rotation")
+        elif backend.in_flight:
+            logger.info(f"Draining Ollama backend {backend.url}, {backend.in_flight} requests in flight")
+        else:
+            logger.info(f"Ollama backend {backend.url} is drained")
+
+    async def check(self, backend: Backend) -> None:
+        """
+        Refreshes the health and the models of a backend.
+        """
+        session = self.http_client.session
+        timeout = aiohttp.ClientTimeout(total=max(self.health_interval, OLLAMA_CONNECT_TIMEOUT),
+                                        sock_connect=OLLAMA_CONNECT_TIMEOUT)
+        try:
+            async with session.get(backend.url + "/api/tags", timeout=timeout) as response:
+                response.raise_for_status()
+                models = {model['name'] for model in (await response.json()).get('models', [])}
+            async with session.get(backend.url + "/api/ps", timeout=timeout) as response:
+                response.raise_for_status()
+                loaded = {model['name'] for model in (await response.json()).get('models', [])}
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            if backend.healthy:
+                logger.warning(f"Ollama backend {backend.url} is out of rotation: {type(e).__name__}: {e}")
+            backend.healthy = False
+            return
+
+        if not backend.healthy:
+            logger.info(f"Ollama backend {backend.url} is healthy again")
+        backend.healthy = True
+        backend.models = models
+        backend.loaded = loaded
+
+    def _read_drain_file(self) -> None:
+        if not self.drain_file:
+            return
+
+        drained: Set[str] = set()
+        if os.path.exists(self.drain_file):
+            with open(self.drain_file, encoding='utf-8') as f:
+                drained = {line.strip().rstrip('/') for line in f if line.strip() and not line.startswith('#')}
+
+        for url in self.backends:
+            self.drain(url, url in drained)
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                self._read_drain_file()
+                await asyncio.gather(*(self.check(backend) for backend in self.backends.values()))
+            except Exception as e:
+                logger.warning(f"Ollama health check failed: {e}")
+            await asyncio.sleep(self.health_interval)
+
+
+registry.register(CallbackMetric(
+    "ollama_backend_in_flight", "Requests running on each Ollama backend.", "gauge",
+    lambda: {(backend.url,): backend.in_flight for backend in OllamaPool().backends.values()}, ["backend"]))
+registry.register(CallbackMetric(
+    "ollama_backend_up", "1 while an Ollama backend is healthy and in rotation.", "gauge",
+    lambda: {(backend.url,): int(backend.healthy and not backend.draining)
+             for backend in OllamaPool().backends.values()}, ["backend"]))
@@ -0,0 +1,163 @@
+import random
+import time
+from enum import Enum
+from typing import Dict
+
+from app.bot import logger
+from app.bot.config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, OLLAMA_RETRY_BACKOFF
+from app.bot.utils.metrics import registry, CallbackMetric
+
+
+class LLMError(Exception):
+    """
+    The LLM backend failed to answer.
+    """
+
+
+class LLMTimeoutError(LLMError):
+    """
+    A deadline of the request passed.
+    """
+
+    def __init__(self, phase: str, seconds: float):
+        """
+        Args:
+            phase (str): "connect", "first_token", "stall" (between two chunks) or "total".
+            seconds (float): The deadline.
+        """
+        super().__init__(f"{phase} deadline of {seconds:.0f} s passed")
+        self.phase = phase
+
+
+class LLMBackendError(LLMError):
+    """
+    The backend answered with an error status.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        # 4xx (unknown model, bad options) will not get better by retrying
+        return self.status >= 500
+
+
+class CircuitOpenError(LLMError):
+    """
+    The backend failed repeatedly, requests are rejected without trying it.
+    """
+
+
+class CircuitState(Enum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a backend is down.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests are rejected
+    with CircuitOpenError for `reset_timeout` seconds. Then a single trial request is let through
+    (half-open): its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        """
+        Args:
+            name (str): Backend, for logs and metrics.
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before a trial request.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = CircuitState.CLOSED
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return CircuitState.HALF_OPEN
+        return self._state
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether a request would be let through now.
+        """
+        state = self.state
+        return state == CircuitState.CLOSED or (state == CircuitState.HALF_OPEN and not self._trial_in_flight)
+
+    def before_request(self) -> None:
+        """
+        :raises CircuitOpenError: The circuit is open, or half-open with the trial request still running.
+        """
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return
+        if state == CircuitState.HALF_OPEN and not self._trial_in_flight:
+            self._state = CircuitState.HALF_OPEN
+            self._trial_in_flight = True
+            return
+        raise CircuitOpenError(f"LLM backend {self.name} is unavailable")
+
+    def record_success(self) -> None:
+        if self._state != CircuitState.CLOSED:
+            logger.info(f"LLM backend {self.name} recovered, circuit closed")
+        self._failures = 0
+        self._state = CircuitState.CLOSED
+        self._trial_in_flight = False
+
+    def record_failure(self, repeated: bool = False) -> None:
+        """
+        :param repeated: A retry of a request that already failed on this backend. It only counts
+            as the trial of a half-open circuit, so retries do not open the circuit on their own.
+        """
+        self._trial_in_flight = False
+        if repeated and self._state == CircuitState.CLOSED:
+            return
+        self._failures += 1
+        if self._state == CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != CircuitState.OPEN:
+                logger.warning(f"LLM backend {self.name} failed {self._failures} times, "
+                               f"circuit opened for {self.reset_timeout:.0f} s")
+            self._state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+    def record_cancel(self) -> None:
+        """
+        The request was abandoned without an outcome, e.g. the user's handler was cancelled.
+        """
+        self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+
+def retry_delay(attempt: int, base: float = OLLAMA_RETRY_BACKOFF) -> float:
+    """
+    Exponential backoff with full jitter, so clients failing together do not retry together.
+
+    :param attempt: 0 for the first retry.
+    """
+    return random.uniform(0, base * 2 ** attempt)
+
+
+registry.register(CallbackMetric(
+    "llm_circuit_state", "Circuit of each LLM backend: 0 closed, 1 half-open, 2 open.", "gauge",
+    lambda: {(name,): breaker.state.value for name, breaker in _breakers.items()}, ["endpoint"]))
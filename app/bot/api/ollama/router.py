@@ -0,0 +1,169 @@
+import re
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from app.bot import logger
+from app.bot.config import (SMALL_LLM_MODEL, LARGE_LLM_MODEL, ROUTER_MAX_WORDS, ROUTER_MAX_PARTS,
+                            ROUTER_LARGE_MAX_IN_FLIGHT, ROUTER_LARGE_TTFT_SLO, ROUTER_SLO_WINDOW)
+from app.bot.utils.metrics import registry, llm_route_decisions, CallbackMetric
+from app.bot.utils.singleton import singleton
+
+_WORD = re.compile(r"\w+")
+# numbered or bulleted lines: "1. ...", "2) ...", "- ...", "• ..."
+_LIST_ITEM = re.compile(r"^\s*(?:\d+[.)]|[-•*])\s", re.MULTILINE)
+_PART_MARKERS = ("а также", "кроме того", "и еще", "и ещё", "во-первых", "во-вторых")
+
+# share of the recent time to first token samples that must stay within the SLO
+SLO_QUANTILE = 0.9
+# fewer samples than this say nothing about the latency
+SLO_MIN_SAMPLES = 3
+# a generation that spent longer loading the model says nothing about the load on it
+COLD_LOAD_SECONDS = 1.0
+
+
+def question_complexity(question: str) -> Tuple[int, int]:
+    """
+    :return: Number of words and number of parts (separate questions, list items) of the question.
+    """
+    words = len(_WORD.findall(question))
+    lowered = question.lower()
+    parts = max(
+        question.count('?'),
+        len(_LIST_ITEM.findall(question)),
+        1 + sum(lowered.count(marker) for marker in _PART_MARKERS),
+    )
+    return words, parts
+
+
+@dataclass
+class RouteDecision:
+    model: str
+    # short, long, multipart, large_queue, large_slo or single_model
+    reason: str
+
+
+@singleton
+class ModelRouter:
+    """
+    Picks the model that answers a question.
+
+    Short single questions, which are mostly FAQ-like, go to the small model; long and multi-part ones
+    to the large model. The large model is slower and has the same GPU to share, so a question falls back
+    to the small one while too many questions are already waiting for or running on the large model,
+    or while the recent time to first token of the large model is above the SLO. Old latency samples
+    expire after the SLO window, so the large model gets traffic again once the load is gone.
+    """
+
+    def __init__(self, small_model: str = SMALL_LLM_MODEL, large_model: str = LARGE_LLM_MODEL,
+                 max_words: int = ROUTER_MAX_WORDS, max_parts: int = ROUTER_MAX_PARTS,
+                 large_max_in_flight: int = ROUTER_LARGE_MAX_IN_FLIGHT, ttft_slo: float = ROUTER_LARGE_TTFT_SLO,
+                 slo_window: float = ROUTER_SLO_WINDOW):
+        """
+        Args:
+            small_model (str): Model for simple questions and the fallback.
+            large_model (str): Model for complex questions, empty to always use the small one.
+            max_words (int): Longer questions are complex.
+            max_parts (int): Questions with more parts are complex.
+            large_max_in_flight (int): Questions waiting for or running on the large model before falling back.
+            ttft_slo (float): Seconds to the first token of the large model, 0 turns the check off.
+            slo_window (float): Seconds the latency samples are kept.
+        """
+        self.small_model = small_model
+        self.large_model = large_model
+        self.max_words = max_words
+        self.max_parts = max_parts
+        self.large_max_in_flight = large_max_in_flight
+        self.ttft_slo = ttft_slo
+        self.slo_window = slo_window
+
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        # model -> (time of the sample, seconds to the first token)
+        self._latencies: Dict[str, Deque[Tuple[float, float]]] = defaultdict(lambda: deque(maxlen=100))
+
+    @property
+    def in_flight(self) -> Dict[str, int]:
+        return dict(self._in_flight)
+
+    def preferred(self, question: str) -> RouteDecision:
+        """
+        The model the question calls for, regardless of the load.
+        """
+        return self._classify(*question_complexity(question))
+
+    def _classify(self, words: int, parts: int) -> RouteDecision:
+        if not self.large_model or self.large_model == self.small_model:
+            return RouteDecision(self.small_model, "single_model")
+        if parts > self.max_parts:
+            return RouteDecision(self.large_model, "multipart")
+        if words > self.max_words:
+            return RouteDecision(self.large_model, "long")
+        return RouteDecision(self.small_model, "short")
+
+    def route(self, question: str) -> RouteDecision:
+        """
+        Picks the model for a generation, falling back to the small model when the large one is overloaded.
+        The decision is logged and counted in llm_route_decisions_total.
+        """
+        words, parts = question_complexity(question)
+        decision = self._classify(words, parts)
+
+        if decision.model == self.large_model:
+            latency = self.recent_latency(self.large_model)
+            if self._in_flight[self.large_model] >= self.large_max_in_flight:
+                decision = RouteDecision(self.small_model, "large_queue")
+            elif self.ttft_slo and latency is not None and latency > self.ttft_slo:
+                decision = RouteDecision(self.small_model, "large_slo")
+
+        logger.info(f"Question of {words} words, {parts} parts routed to {decision.model} ({decision.reason}), "
+                    f"in flight: {dict(self._in_flight)}")
+        llm_route_decisions.inc(model=decision.model, reason=decision.reason)
+        return decision
+
+    @asynccontextmanager
+    async def track(self, model: str) -> AsyncIterator[None]:
+        """
+        Counts the question as in flight on the model for the duration of the block, queueing included.
+        """
+        self._in_flight[model] += 1
+        try:
+            yield
+        finally:
+            self._in_flight[model] -= 1
+
+    def observe_first_token(self, model: str, seconds: float, load_seconds: float = 0.0) -> None:
+        """
+        Adds a time to first token sample, unless the model was loaded for the generation.
+
+        :param seconds: Time to the first token.
+        :param load_seconds: Time Ollama spent loading the model (load_duration of the final chunk).
+        """
+        if load_seconds > COLD_LOAD_SECONDS:
+            logger.info(f"First token of {model} after {seconds:.2f} s, {load_seconds:.2f} s of them loading "
+                        f"the model, not counted for the SLO")
+            return
+        self._latencies[model].append((time.monotonic(), seconds))
+
+    def recent_latency(self, model: str) -> Optional[float]:
+        """
+        :return: The SLO quantile of the times to the first token within the window, None without enough samples.
+        """
+        samples = self._latencies.get(model)
+        if not samples:
+            return None
+
+        horizon = time.monotonic() - self.slo_window
+        while samples and samples[0][0] < horizon:
+            samples.popleft()
+        if len(samples) < SLO_MIN_SAMPLES:
+            return None
+
+        ordered = sorted(seconds for _, seconds in samples)
+        return ordered[int(SLO_QUANTILE * (len(ordered) - 1))]
+
+
+registry.register(CallbackMetric(
+    "llm_router_in_flight", "Questions waiting for or running on each model.", "gauge",
+    lambda: {(model,): count for model, count in ModelRouter().in_flight.items()}, ["model"]))
@@ -0,0 +1,203 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from app.bot import logger
+from app.bot.config import LLM_CONCURRENCY, LLM_MAX_QUEUE
+from app.bot.utils.metrics import registry, llm_queue_wait, CallbackMetric
+from app.bot.utils.singleton import singleton
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class Priority(IntEnum):
+    """
+    Lower value is served first.
+    """
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class QueueFullError(Exception):
+    """
+    Raised when the scheduler queue is full and the request is shed.
+    """
+
+
+@dataclass(eq=False)
+class _Waiter:
+    user_id: int
+    priority: Priority
+    future: asyncio.Future
+    on_position: Optional[PositionCallback] = None
+    position: int = field(default=0)
+
+
+@singleton
+class LLMScheduler:
+    """
+    Admits LLM generations to the backend a few at a time.
+
+    Waiters are grouped by priority class; within a class users are served round-robin,
+    so one user sending many questions cannot push everyone else back. When the queue
+    is full new requests are rejected with QueueFullError instead of waiting forever.
+    """
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        """
+        Args:
+            concurrency (int): How many generations may run at the same time.
+            max_queue (int): How many requests may wait for a slot.
+        """
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+
+        self._running = 0
+        self._queued = 0
+        self._queues: Dict[Priority, OrderedDict[int, Deque[_Waiter]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._notifications: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, priority: Priority = Priority.INTERACTIVE,
+                   on_position: Optional[PositionCallback] = None) -> AsyncIterator[None]:
+        """
+        Waits for a generation slot and holds it for the duration of the block.
+
+        :param user_id: Telegram id of the user the generation is for.
+        :param priority: Priority class of the request.
+        :param on_position: Called with the 1-based queue position whenever it changes while waiting.
+        :raises QueueFullError: The queue is full.
+        """
+        started = time.monotonic()
+        await self._acquire(user_id, priority, on_position)
+        llm_queue_wait.observe(time.monotonic() - started, priority=priority.name.lower())
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, user_id: int, priority: Priority, on_position: Optional[PositionCallback]) -> None:
+        if self._running < self.concurrency and self._queued == 0:
+            self._running += 1
+            return
+
+        if self._queued >= self.max_queue:
+            logger.warning(f"LLM queue is full ({self._queued}), shedding request of {user_id}")
+            raise QueueFullError()
+
+        waiter = _Waiter(user_id, priority, asyncio.get_running_loop().create_future(), on_position)
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        self._update_positions()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # the slot was granted right before the cancellation, give it back
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        dispatched = False
+
+        while self._running < self.concurrency and self._queued:
+            waiter = self._pop_next()
+            self._running += 1
+            waiter.future.set_result(None)
+            dispatched = True
+
+        if dispatched:
+            self._update_positions()
+
+    def _pop_next(self) -> _Waiter:
+        for priority in Priority:
+            users = self._queues[priority]
+            if not users:
+                continue
+
+            user_id, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                # the user goes to the back of the round
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+
+            self._queued -= 1
+            return waiter
+
+        raise RuntimeError("Scheduler queue is empty")
+
+    def _discard(self, waiter: _Waiter) -> None:
+        users = self._queues[waiter.priority]
+        waiters = users.get(waiter.user_id)
+        if waiters is None or waiter not in waiters:
+            return
+
+        waiters.remove(waiter)
+        if not waiters:
+            del users[waiter.user_id]
+        self._queued -= 1
+        self._update_positions()
+
+    def _dispatch_order(self) -> List[_Waiter]:
+        """
+        The order in which the current waiters will be served: priority classes first,
+        then rounds over the users in their rotation order.
+        """
+        order = []
+        for priority in Priority:
+            keyed = [
+                (round_index, user_index, waiter)
+                for user_index, waiters in enumerate(self._queues[priority].values())
+                for round_index, waiter in enumerate(waiters)
+            ]
+            order.extend(waiter for _, _, waiter in sorted(keyed, key=lambda item: item[:2]))
+        return order
+
+    def _update_positions(self) -> None:
+        for position, waiter in enumerate(self._dispatch_order(), start=1):
+            if waiter.position == position:
+                continue
+
+            waiter.position = position
+            if waiter.on_position is not None:
+                task = asyncio.create_task(self._notify(waiter, position))
+                self._notifications.add(task)
+                task.add_done_callback(self._notifications.discard)
+
+    @staticmethod
+    async def _notify(waiter: _Waiter, position: int) -> None:
+        if waiter.future.done() or waiter.position != position:
+            return
+
+        try:
+            await waiter.on_position(position)
+        except Exception as e:
+            logger.debug(f"Queue position callback failed: {e}")
+
+
+registry.register(CallbackMetric(
+    "llm_scheduler_slots", "Generations running and waiting in the scheduler.", "gauge",
+    lambda: {("running",): LLMScheduler().running, ("queued",): LLMScheduler().queued}, ["state"]))
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.bot import logger
+from app.bot.api.ollama.context_window import ContextWindow, TEMPLATE_TOKENS
+from app.bot.api.ollama.impl.ollama import Ollama
+from app.bot.api.ollama.pool import OllamaPool
+from app.bot.api.ollama.scheduler import LLMScheduler
+from app.bot.config import (SMALL_LLM_MODEL, LARGE_LLM_MODEL, system_prompt, RETRIEVAL_MAX_CONTEXT, RETRIEVAL_TOKEN_BUDGET,
+                            ANSWER_MAX_TOKENS, WARMUP_INTERVAL)
+from app.bot.utils.singleton import singleton
+
+
+@singleton
+class ModelWarmer:
+    """
+    Keeps the support models loaded and their system prompt evaluated.
+
+    A warm-up loads the model with the num_ctx used for questions and then evaluates the static
+    system prompt once with a one-token generation. Ollama keeps the evaluated prefix in its KV cache
+    and reuses it for every following request that starts with the same system prompt, so questions
+    only pay for their own passages. Warm-ups of the same model and prompt are deduplicated and
+    skipped while the previous one is recent or the model is busy anyway.
+    """
+
+    def __init__(self, interval: float = WARMUP_INTERVAL):
+        self.interval = interval
+        self._primed: Dict[Tuple[str, int, str], float] = {}
+        self._in_flight: Dict[Tuple[str, int, str], asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    async def warm_up(self, model: str = SMALL_LLM_MODEL, max_context: Optional[int] = None,
+                      prompt: Optional[str] = None) -> None:
+        """
+        Loads the model and primes the system prompt prefix.
+
+        :param model: The model to warm up.
+        :param max_context: num_ctx the model will be used with. By default the bucket of a question
+            whose passages fill the whole retrieval budget.
+        :param prompt: System prompt to prime, the support prompt by default.
+        """
+        prompt = system_prompt() if prompt is None else prompt
+        if max_context is None:
+            window = ContextWindow()
+            tokens = window.count(prompt, model) + TEMPLATE_TOKENS + RETRIEVAL_TOKEN_BUDGET + ANSWER_MAX_TOKENS
+            max_context = window.num_ctx(model, tokens, limit=RETRIEVAL_MAX_CONTEXT)
+        key = (model, max_context, hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+
+        if time.monotonic() - self._primed.get(key, float('-inf')) < self.interval:
+            return
+
+        if LLMScheduler().running:
+            # a generation is running, so the model is loaded and the prefix is cached
+            return
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._prime(key, model, max_context, prompt))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        await asyncio.shield(task)
+
+    @property
+    def models(self) -> List[str]:
+        """
+        The models questions are routed to: the small one and the large one, if routing is on.
+        """
+        return list(dict.fromkeys(model for model in (SMALL_LLM_MODEL, LARGE_LLM_MODEL) if model))
+
+    async def warm_up_all(self) -> None:
+        """
+        Warms up every model questions are routed to, so none of them is loaded by a question.
+        """
+        await asyncio.gather(*(self.warm_up(model) for model in self.models))
+
+    def schedule(self, **kwargs) -> None:
+        """
+        Starts a warm-up in the background, for handlers that must not wait for it.
+        """
+        task = asyncio.create_task(self._safe_warm_up(**kwargs))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _safe_warm_up(self, **kwargs) -> None:
+        try:
+            await self.warm_up(**kwargs)
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+
+    async def _prime(self, key: Tuple[str, int, str], model: str, max_context: int, prompt: str) -> None:
+        # every backend keeps its own KV cache, so all of them are primed
+        endpoints = [backend.generate_url for backend in OllamaPool().candidates(model)]
+        results = await asyncio.gather(
+            *(self._prime_backend(endpoint, model, max_context, prompt) for endpoint in endpoints),
+            return_exceptions=True,
+        )
+        for endpoint, result in zip(endpoints, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Warm-up of {model} on {endpoint} failed: {result}")
+        if any(not isinstance(result, Exception) for result in results):
+            self._primed[key] = time.monotonic()
+
+    @staticmethod
+    async def _prime_backend(endpoint: str, model: str, max_context: int, prompt: str) -> None:
+        await Ollama("", model=model, endpoint=endpoint, max_context=max_context).warm_up()
+        await Ollama(".", model=model, endpoint=endpoint, system_prompt=prompt, max_context=max_context,
+                     num_predict=1).send_request()
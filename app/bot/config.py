@@ -11,20 +11,188 @@ BOT_TOKEN: str = env.str("BOT_TOKEN")
 
 UPLOADS_DIR = '../../uploads'
 
+# extracted document text and the knowledge base snapshot live here
+CACHE_DIR = env.str("CACHE_DIR", default='../../cache')
+
+# text extraction runs in worker processes; bigger files are rejected, slower ones are aborted
+INGESTION_WORKERS = env.int("INGESTION_WORKERS", default=2)
+INGESTION_TIMEOUT = env.float("INGESTION_TIMEOUT", default=120.0)  # seconds per file
+INGESTION_MAX_FILE_SIZE = env.int("INGESTION_MAX_FILE_SIZE", default=50 * 1024 * 1024)  # bytes
+# ZIP uploads: at most this many documents and unpacked bytes per archive
+ARCHIVE_MAX_FILES = env.int("ARCHIVE_MAX_FILES", default=500)
+ARCHIVE_MAX_TOTAL_SIZE = env.int("ARCHIVE_MAX_TOTAL_SIZE", default=1024 * 1024 * 1024)  # bytes
+
+# only the most relevant knowledge base passages are put into the prompt
+RETRIEVAL_CHUNK_SIZE = env.int("RETRIEVAL_CHUNK_SIZE", default=1200)  # characters
+RETRIEVAL_CHUNK_OVERLAP = env.int("RETRIEVAL_CHUNK_OVERLAP", default=200)  # characters
+RETRIEVAL_TOP_K = env.int("RETRIEVAL_TOP_K", default=8)
+RETRIEVAL_TOKEN_BUDGET = env.int("RETRIEVAL_TOKEN_BUDGET", default=3000)
+# largest num_ctx for questions answered from retrieved passages; less relevant passages are dropped to fit
+RETRIEVAL_MAX_CONTEXT = env.int("RETRIEVAL_MAX_CONTEXT", default=8192)
+# tokens reserved for the answer, longer answers are cut
+ANSWER_MAX_TOKENS = env.int("ANSWER_MAX_TOKENS", default=1024)
+
+# num_ctx is the smallest of these that fits the prompt and the answer; Ollama reloads the model on every change
+NUM_CTX_BUCKETS = env.list("NUM_CTX_BUCKETS", default=[2048, 4096, 8192, 16384, 32768], subcast=int)
+# Hugging Face tokenizer of the LLM (e.g. "Qwen/Qwen2.5-7B-Instruct") to count prompt tokens exactly;
+# empty to estimate them from a ratio calibrated on Ollama responses
+LLM_TOKENIZER = env.str("LLM_TOKENIZER", default="")
+
+# dense retrieval: "flag" (FlagEmbedding model), "hashing" (no weights, for tests) or "none"
+EMBEDDER = env.str("EMBEDDER", default="flag")
+EMBEDDING_MODEL = env.str("EMBEDDING_MODEL", default="deepvk/USER-bge-m3")
+VECTOR_INDEX_DIR = env.str("VECTOR_INDEX_DIR", default=os.path.join(CACHE_DIR, 'vectors'))
+
+# answers to repeated questions; an empty path keeps the cache in memory only
+ANSWER_CACHE_SIZE = env.int("ANSWER_CACHE_SIZE", default=1024)
+ANSWER_CACHE_TTL = env.float("ANSWER_CACHE_TTL", default=24 * 60 * 60)  # seconds
+ANSWER_CACHE_PATH = env.str("ANSWER_CACHE_PATH", default=os.path.join(CACHE_DIR, 'answers.sqlite3'))
+
+# shared HTTP connection pool for the LLM backends
+HTTP_POOL_LIMIT = env.int("HTTP_POOL_LIMIT", default=100)
+HTTP_POOL_LIMIT_PER_HOST = env.int("HTTP_POOL_LIMIT_PER_HOST", default=32)
+HTTP_DNS_CACHE_TTL = env.int("HTTP_DNS_CACHE_TTL", default=300)  # seconds
+HTTP_KEEPALIVE_TIMEOUT = env.float("HTTP_KEEPALIVE_TIMEOUT", default=60.0)  # seconds
+
+# Ollama instances the generations are spread over, comma separated base URLs
+OLLAMA_BACKENDS = env.list("OLLAMA_BACKENDS", default=["http://ollama:11434"])
+OLLAMA_HEALTH_INTERVAL = env.float("OLLAMA_HEALTH_INTERVAL", default=10.0)  # seconds between /api/tags checks
+# backends listed in this file (one URL per line) get no new requests and finish the running ones
+OLLAMA_DRAIN_FILE = env.str("OLLAMA_DRAIN_FILE", default=os.path.join(CACHE_DIR, 'ollama-drain'))
+
+# how many generations all Ollama backends run at once and how many requests may wait for a slot
+LLM_CONCURRENCY = env.int("LLM_CONCURRENCY", default=2)
+LLM_MAX_QUEUE = env.int("LLM_MAX_QUEUE", default=50)
+
+# deadlines of requests to Ollama, in seconds; the first token includes loading the model and evaluating the prompt
+OLLAMA_CONNECT_TIMEOUT = env.float("OLLAMA_CONNECT_TIMEOUT", default=5.0)
+OLLAMA_FIRST_TOKEN_TIMEOUT = env.float("OLLAMA_FIRST_TOKEN_TIMEOUT", default=120.0)
+OLLAMA_STALL_TIMEOUT = env.float("OLLAMA_STALL_TIMEOUT", default=30.0)  # between two streamed chunks
+OLLAMA_TOTAL_TIMEOUT = env.float("OLLAMA_TOTAL_TIMEOUT", default=300.0)
+# non-streaming requests are retried on connection errors, timeouts and 5xx with jittered exponential backoff
+OLLAMA_RETRIES = env.int("OLLAMA_RETRIES", default=2)
+OLLAMA_RETRY_BACKOFF = env.float("OLLAMA_RETRY_BACKOFF", default=0.5)  # seconds
+# after this many consecutive failures requests fail fast for BREAKER_RESET_TIMEOUT seconds
+BREAKER_FAILURE_THRESHOLD = env.int("BREAKER_FAILURE_THRESHOLD", default=5)
+BREAKER_RESET_TIMEOUT = env.float("BREAKER_RESET_TIMEOUT", default=30.0)
+# while the LLM is down, questions get the closest FAQ entry at least this similar
+DEGRADED_FAQ_THRESHOLD = env.float("DEGRADED_FAQ_THRESHOLD", default=0.4)
+
+# how long Ollama keeps the model in VRAM after the last request
+OLLAMA_KEEP_ALIVE = env.str("OLLAMA_KEEP_ALIVE", default="30m")
+# a warm-up is skipped if the same model and system prompt were primed less than this many seconds ago
+WARMUP_INTERVAL = env.float("WARMUP_INTERVAL", default=300.0)
+# startup waits this many seconds for the first warm-up before reporting ready, 0 leaves it to the background
+STARTUP_WARMUP_TIMEOUT = env.float("STARTUP_WARMUP_TIMEOUT", default=60.0)
+
+# Telegram limits: about 30 messages per second per bot, edits of one chat should stay around one per second
+TELEGRAM_GLOBAL_RATE = env.float("TELEGRAM_GLOBAL_RATE", default=25.0)  # requests per second
+TELEGRAM_EDIT_INTERVAL = env.float("TELEGRAM_EDIT_INTERVAL", default=1.5)  # seconds between edits of one message
+
+# Prometheus metrics endpoint, port 0 disables it
+METRICS_HOST = env.str("METRICS_HOST", default="127.0.0.1")
+METRICS_PORT = env.int("METRICS_PORT", default=9100)
+
+# voice questions: "whisper", "stub" (fixed transcript, for tests) or "none" to turn them off
+TRANSCRIBER = env.str("TRANSCRIBER", default="whisper")
+WHISPER_MODEL = env.str("WHISPER_MODEL", default="small")
+TRANSCRIPTION_LANGUAGE = env.str("TRANSCRIPTION_LANGUAGE", default="ru")
+# every worker loads its own copy of the model
+TRANSCRIPTION_WORKERS = env.int("TRANSCRIPTION_WORKERS", default=1)
+TRANSCRIPTION_MAX_QUEUE = env.int("TRANSCRIPTION_MAX_QUEUE", default=16)
+# clips that arrive within the window are transcribed as one batch
+TRANSCRIPTION_BATCH_SIZE = env.int("TRANSCRIPTION_BATCH_SIZE", default=8)
+TRANSCRIPTION_BATCH_WINDOW = env.float("TRANSCRIPTION_BATCH_WINDOW", default=0.05)  # seconds
+VOICE_MAX_DURATION = env.int("VOICE_MAX_DURATION", default=120)  # seconds
+FFMPEG_BINARY = env.str("FFMPEG_BINARY", default="ffmpeg")
+
+# FAQ regeneration: candidate questions are generated per fragment, then deduplicated
+FAQ_CHUNK_SIZE = env.int("FAQ_CHUNK_SIZE", default=3000)  # characters
+FAQ_CONCURRENCY = env.int("FAQ_CONCURRENCY", default=2)  # fragments queued in the scheduler at once
+FAQ_MAX_ATTEMPTS = env.int("FAQ_MAX_ATTEMPTS", default=3)  # per fragment and run
+FAQ_DEDUP_THRESHOLD = env.float("FAQ_DEDUP_THRESHOLD", default=0.6)  # Jaccard similarity of question terms
+FAQ_MAX_ENTRIES = env.int("FAQ_MAX_ENTRIES", default=30)
+FAQ_PROGRESS_INTERVAL = env.float("FAQ_PROGRESS_INTERVAL", default=5.0)  # seconds between progress edits
+FAQ_SAVE_INTERVAL = env.float("FAQ_SAVE_INTERVAL", default=30.0)  # seconds between saves of the job state
+
+# a question this similar (cosine of character n-gram TF-IDF) to an FAQ title is answered from the FAQ
+FAQ_MATCH_THRESHOLD = env.float("FAQ_MATCH_THRESHOLD", default=0.75)
+
+# buttons per page of the document list and the FAQ list
+DOCUMENTS_PAGE_SIZE = env.int("DOCUMENTS_PAGE_SIZE", default=6)
+FAQ_PAGE_SIZE = env.int("FAQ_PAGE_SIZE", default=8)
+
+# FAQ, feedback and the document catalog: "sqlite" (single node, tests) or "mongo"
+DATABASE_BACKEND = env.str("DATABASE_BACKEND", default="sqlite")
+DATABASE_PATH = env.str("DATABASE_PATH", default='../../data/bot.sqlite3')
+MONGO_URL = env.str("MONGO_URL", default="mongodb://mongo_db:27017")
+MONGO_DATABASE = env.str("MONGO_DATABASE", default="prod")
+# writes are queued and flushed in batches every DATABASE_FLUSH_INTERVAL seconds or DATABASE_BATCH_SIZE writes
+DATABASE_FLUSH_INTERVAL = env.float("DATABASE_FLUSH_INTERVAL", default=1.0)
+DATABASE_BATCH_SIZE = env.int("DATABASE_BATCH_SIZE", default=100)
+
+# logging: LOG_LEVEL for everything, LOG_LEVELS overrides it per module or logger,
+# e.g. "app.bot.handlers=DEBUG,aiogram.event=WARNING"
+LOG_LEVEL = env.str("LOG_LEVEL", default="INFO")
+LOG_LEVELS = env.list("LOG_LEVELS", default=[])
+# "text" or "json" (one object per line, with the request id)
+LOG_FORMAT = env.str("LOG_FORMAT", default="text")
+# longer messages (prompts, responses) are cut, except for a LOG_SAMPLE_RATE share of them
+LOG_MAX_MESSAGE = env.int("LOG_MAX_MESSAGE", default=2000)  # characters
+LOG_SAMPLE_RATE = env.float("LOG_SAMPLE_RATE", default=0.01)
+# records waiting for the writer thread; more are dropped rather than blocking the event loop
+LOG_QUEUE_SIZE = env.int("LOG_QUEUE_SIZE", default=10000)
+
+# "polling" or "webhook"
+BOT_MODE = env.str("BOT_MODE", default="polling")
+# public HTTPS address Telegram sends updates to, e.g. https://bot.example.com (without the path)
+WEBHOOK_URL = env.str("WEBHOOK_URL", default="")
+WEBHOOK_PATH = env.str("WEBHOOK_PATH", default="/webhook")
+# checked against the X-Telegram-Bot-Api-Secret-Token header of every update
+WEBHOOK_SECRET = env.str("WEBHOOK_SECRET", default="")
+# address of the local HTTP server behind the reverse proxy
+WEBHOOK_HOST = env.str("WEBHOOK_HOST", default="127.0.0.1")
+WEBHOOK_PORT = env.int("WEBHOOK_PORT", default=8080)
+# parallel connections Telegram opens to the webhook
+WEBHOOK_MAX_CONNECTIONS = env.int("WEBHOOK_MAX_CONNECTIONS", default=40)
+
+# base URL of a self-hosted or fake Bot API server, empty for api.telegram.org
+TELEGRAM_API_SERVER = env.str("TELEGRAM_API_SERVER", default="")
 
 available_llm_models: Literal['qwen2:7b-instruct-fp16', 'qwen2.5:3b'] = "qwen2.5:3b"
 
+# short questions go to the small model, long and multi-part ones to the large model; empty LARGE_LLM_MODEL turns routing off
+SMALL_LLM_MODEL = env.str("SMALL_LLM_MODEL", default=available_llm_models)
+LARGE_LLM_MODEL = env.str("LARGE_LLM_MODEL", default="qwen2:7b-instruct-fp16")
+ROUTER_MAX_WORDS = env.int("ROUTER_MAX_WORDS", default=25)
+ROUTER_MAX_PARTS = env.int("ROUTER_MAX_PARTS", default=1)
+# the small model answers instead while this many questions wait for or run on the large model,
+# or while the 90th percentile of its time to first token over the window is above the SLO
+ROUTER_LARGE_MAX_IN_FLIGHT = env.int("ROUTER_LARGE_MAX_IN_FLIGHT", default=4)
+ROUTER_LARGE_TTFT_SLO = env.float("ROUTER_LARGE_TTFT_SLO", default=8.0)  # seconds, 0 turns the check off
+ROUTER_SLO_WINDOW = env.float("ROUTER_SLO_WINDOW", default=300.0)  # seconds
+
 super_user_id = 6898688536
 
-def user_prompt(question: str):
-    return question
+#
+# Adds context (knowledge base passages selected by app.bot.knowledge.retrieval).
+# The passages go after the system prompt, so the static prefix can be reused by Ollama between questions
+#
+def user_prompt(question: str, context: str = "") -> str:
+    if not context:
+        return question
+
+    return f"""База знаний:
+{context}
+
+Вопрос: {question}"""
 
 
 #
-# Adds context (data content extracted from docx) (thanks for not giving the power to host a vector database!)
+# Must not depend on the question: Ollama reuses the evaluated prefix only while it stays byte-identical
 #
-def system_prompt(context: str) -> str:
-    prompt = f"""
+def system_prompt(context: str = "") -> str:
+    prompt = """
     Ты — ИИ ассистент (от компании ООО Сила), работающий с информацией из базы знаний. Ты должен опираться исключительно на текст базы знаний для ответов. Если информация отсутствует, деликатно сообщи, что база знаний не содержит нужных данных.
     
     *Форматирование текста:*
@@ -33,7 +201,10 @@ def system_prompt(context: str) -> str:
     *Точные ответы:*
     - Воспринимай оскорбления и прочую информацию не по теме как завершение диалога.
     - Отвечай уверенно, опираясь на текст, избегая домыслов, если не хватает информации.
-    
+    """
+
+    if context:
+        prompt += f"""
     База знаний:
     {context}
     """
@@ -0,0 +1,117 @@
+from typing import List, Optional, final, override
+
+import pymongo
+from beanie import Document, init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, ReplaceOne
+
+from app.bot import logger
+from app.bot.config import MONGO_URL, MONGO_DATABASE
+from app.bot.database.models.document import DocumentRecord
+from app.bot.database.models.faq import FaqSet
+from app.bot.database.models.feedback import Feedback
+from app.bot.database.repository import BaseRepository, WriteOp, FAQ, FEEDBACK, DOCUMENTS
+
+# the FAQ is stored as one document, replacing it is a single atomic write
+FAQ_ID = "current"
+
+
+class FaqDocument(FaqSet, Document):
+    id: str = FAQ_ID
+
+    class Settings:
+        name = "faq"
+
+
+class FeedbackDocument(Feedback, Document):
+    class Settings:
+        name = "feedback"
+        indexes = [
+            pymongo.IndexModel([("user_id", pymongo.ASCENDING)], unique=True),
+            "rating",
+        ]
+
+
+class DocumentRecordDocument(DocumentRecord, Document):
+    class Settings:
+        name = "documents"
+        indexes = [
+            pymongo.IndexModel([("name", pymongo.ASCENDING)], unique=True),
+            "sha256",
+        ]
+
+
+@final
+class MongoRepository(BaseRepository):
+    """
+    MongoDB backend on beanie/motor, shared by all bot processes.
+    """
+
+    def __init__(self, url: str = MONGO_URL, database: str = MONGO_DATABASE, **kwargs):
+        """
+        Args:
+            url (str): Connection string.
+            database (str): Database name.
+        """
+        super().__init__(**kwargs)
+        self.url = url
+        self.database = database
+        self._client: Optional[AsyncIOMotorClient] = None
+
+    @override
+    async def _connect(self) -> None:
+        self._client = AsyncIOMotorClient(self.url)
+        # creates the indexes declared in the Settings of the documents
+        await init_beanie(
+            database=self._client[self.database],
+            document_models=[FaqDocument, FeedbackDocument, DocumentRecordDocument],
+        )
+        logger.info(f"Connected to MongoDB database {self.database}")
+
+    @override
+    async def _disconnect(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    @override
+    async def _fetch_faq(self) -> Optional[FaqSet]:
+        document = await FaqDocument.get(FAQ_ID)
+        if document is None:
+            return None
+        return FaqSet.model_validate(document.model_dump(exclude={'id', 'revision_id'}))
+
+    @override
+    async def _fetch_feedback(self, user_id: int) -> Optional[Feedback]:
+        document = await FeedbackDocument.find_one(FeedbackDocument.user_id == user_id)
+        if document is None:
+            return None
+        return Feedback.model_validate(document.model_dump(exclude={'id', 'revision_id'}))
+
+    @override
+    async def _fetch_documents(self) -> List[DocumentRecord]:
+        documents = await DocumentRecordDocument.find_all().sort("name").to_list()
+        return [DocumentRecord.model_validate(document.model_dump(exclude={'id', 'revision_id'})) for document in documents]
+
+    @override
+    async def _apply(self, ops: List[WriteOp]) -> None:
+        feedback, documents = [], []
+
+        for op in ops:
+            if op.collection == FAQ:
+                await FaqDocument.get_motor_collection().replace_one(
+                    {"_id": FAQ_ID}, op.value.model_dump(), upsert=True,
+                )
+            elif op.collection == FEEDBACK:
+                feedback.append(ReplaceOne({"user_id": op.value.user_id}, op.value.model_dump(), upsert=True))
+            elif op.collection == DOCUMENTS:
+                if op.value is None:
+                    documents.append(DeleteOne({"name": op.key}))
+                else:
+                    documents.append(ReplaceOne({"name": op.key}, op.value.model_dump(), upsert=True))
+
+        # one round trip per collection, the batch already holds at most one write per key
+        if feedback:
+            await FeedbackDocument.get_motor_collection().bulk_write(feedback, ordered=False)
+        if documents:
+            await DocumentRecordDocument.get_motor_collection().bulk_write(documents, ordered=False)
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional, TypeVar, final, override
+
+from app.bot import logger
+from app.bot.config import DATABASE_PATH
+from app.bot.database.models.document import DocumentRecord
+from app.bot.database.models.faq import FaqEntry, FaqSet
+from app.bot.database.models.feedback import Feedback
+from app.bot.database.repository import BaseRepository, WriteOp, FAQ, FEEDBACK, DOCUMENTS
+
+T = TypeVar('T')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS faq (
+    position INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    kb_version TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feedback (
+    user_id INTEGER PRIMARY KEY,
+    rating INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feedback_rating ON feedback (rating);
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    uploaded_by INTEGER,
+    uploaded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_sha256 ON documents (sha256);
+"""
+
+
+@final
+class SqliteRepository(BaseRepository):
+    """
+    Embedded backend on the standard sqlite3 module, for tests and single-node deployments.
+
+    The connection is used from one dedicated thread, so queries never block the event loop
+    and sqlite3 objects never cross threads. WAL mode lets several worker processes share the file.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, **kwargs):
+        """
+        Args:
+            path (str): Database file, ":memory:" for a throwaway database.
+        """
+        super().__init__(**kwargs)
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._db: Optional[sqlite3.Connection] = None
+
+    @override
+    async def _connect(self) -> None:
+        await self._run_in_thread(self._open)
+        logger.info(f"SQLite database opened: {self.path}")
+
+    @override
+    async def _disconnect(self) -> None:
+        await self._run_in_thread(self._db.close)
+        self._executor.shutdown(wait=True)
+
+    @override
+    async def _fetch_faq(self) -> Optional[FaqSet]:
+        rows = await self._run_in_thread(
+            lambda: self._db.execute('SELECT title, answer, kb_version, updated_at FROM faq ORDER BY position').fetchall()
+        )
+        if not rows:
+            return None
+
+        return FaqSet(
+            entries=[FaqEntry(title=title, answer=answer) for title, answer, _, _ in rows],
+            kb_version=rows[0][2],
+            updated_at=datetime.fromisoformat(rows[0][3]),
+        )
+
+    @override
+    async def _fetch_feedback(self, user_id: int) -> Optional[Feedback]:
+        row = await self._run_in_thread(
+            lambda: self._db.execute(
+                'SELECT user_id, rating, created_at FROM feedback WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        )
+        if row is None:
+            return None
+        return Feedback(user_id=row[0], rating=row[1], created_at=datetime.fromisoformat(row[2]))
+
+    @override
+    async def _fetch_documents(self) -> List[DocumentRecord]:
+        rows = await self._run_in_thread(
+            lambda: self._db.execute(
+                'SELECT name, sha256, size, uploaded_by, uploaded_at FROM documents ORDER BY name'
+            ).fetchall()
+        )
+        return [
+            DocumentRecord(name=name, sha256=sha256, size=size, uploaded_by=uploaded_by,
+                           uploaded_at=datetime.fromisoformat(uploaded_at))
+            for name, sha256, size, uploaded_by, uploaded_at in rows
+        ]
+
+    @override
+    async def _apply(self, ops: List[WriteOp]) -> None:
+        await self._run_in_thread(self._apply_sync, ops)
+
+    def _open(self) -> None:
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def _apply_sync(self, ops: List[WriteOp]) -> None:
+        feedback = [op.value for op in ops if op.collection == FEEDBACK and op.value is not None]
+        saved_documents = [op.value for op in ops if op.collection == DOCUMENTS and op.value is not None]
+        removed_documents = [(op.key,) for op in ops if op.collection == DOCUMENTS and op.value is None]
+        faq = [op.value for op in ops if op.collection == FAQ]
+
+        # one transaction per batch: the FAQ swap is atomic and the batch is committed with a single fsync
+        with self._db:
+            if feedback:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO feedback (user_id, rating, created_at) VALUES (?, ?, ?)',
+                    [(item.user_id, item.rating, item.created_at.isoformat()) for item in feedback],
+                )
+            if saved_documents:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO documents (name, sha256, size, uploaded_by, uploaded_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(item.name, item.sha256, item.size, item.uploaded_by, item.uploaded_at.isoformat())
+                     for item in saved_documents],
+                )
+            if removed_documents:
+                self._db.executemany('DELETE FROM documents WHERE name = ?', removed_documents)
+            for faq_set in faq:
+                self._db.execute('DELETE FROM faq')
+                self._db.executemany(
+                    'INSERT INTO faq (position, title, answer, kb_version, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    [(position, entry.title, entry.answer, faq_set.kb_version, faq_set.updated_at.isoformat())
+                     for position, entry in enumerate(faq_set.entries)],
+                )
+
+    async def _run_in_thread(self, function: Callable[..., T], *args) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
@@ -0,0 +1,15 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class DocumentRecord(BaseModel):
+    """
+    Catalog entry of an uploaded knowledge base document.
+    """
+    name: str
+    sha256: str
+    size: int
+    uploaded_by: Optional[int] = None
+    uploaded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,19 @@
+from datetime import datetime, timezone
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class FaqEntry(BaseModel):
+    title: str
+    answer: str
+
+
+class FaqSet(BaseModel):
+    """
+    The FAQ shown to users. Always replaced as a whole, so users never see a half-updated list.
+    """
+    entries: List[FaqEntry] = Field(default_factory=list)
+    # version of the knowledge base the FAQ was generated from
+    kb_version: str = ""
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
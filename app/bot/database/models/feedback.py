@@ -0,0 +1,12 @@
+from datetime import datetime, timezone
+
+from pydantic import BaseModel, Field
+
+
+class Feedback(BaseModel):
+    """
+    Rating of the bot left by a user, one per user.
+    """
+    user_id: int
+    rating: int = Field(ge=1, le=5)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
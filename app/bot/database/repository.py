@@ -0,0 +1,190 @@
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.bot import logger
+from app.bot.config import DATABASE_BACKEND, DATABASE_FLUSH_INTERVAL, DATABASE_BATCH_SIZE
+from app.bot.database.models.document import DocumentRecord
+from app.bot.database.models.faq import FaqSet
+from app.bot.database.models.feedback import Feedback
+from app.bot.utils.singleton import singleton
+
+FAQ = "faq"
+FEEDBACK = "feedback"
+DOCUMENTS = "documents"
+
+
+@dataclass
+class WriteOp:
+    """
+    A queued write. `value` None deletes the record with the key.
+    """
+    collection: str
+    key: str
+    value: Optional[Union[FaqSet, Feedback, DocumentRecord]]
+
+
+class BaseRepository(ABC):
+    """
+    Storage of the FAQ, the user feedback and the document catalog.
+
+    Writes never wait for the database: they are queued, coalesced by key (the last write
+    of a record wins) and applied by a background task in batches, every `flush_interval`
+    seconds or as soon as `batch_size` writes are pending. Reads see the queued writes,
+    so a handler always reads what it has just written.
+
+    Backends implement the `_`-prefixed methods.
+    """
+
+    def __init__(self, flush_interval: float = DATABASE_FLUSH_INTERVAL, batch_size: int = DATABASE_BATCH_SIZE):
+        """
+        Args:
+            flush_interval (float): Seconds between flushes of the write queue.
+            batch_size (int): Number of pending writes that triggers a flush right away.
+        """
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._pending: Dict[Tuple[str, str], WriteOp] = {}
+        # the batch being written, still visible to reads until the write completes
+        self._in_flight: Dict[Tuple[str, str], WriteOp] = {}
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self._connect()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+        await self._disconnect()
+
+    async def get_faq(self) -> FaqSet:
+        op = self._queued(FAQ, "")
+        if op is not None:
+            return op.value
+        return await self._fetch_faq() or FaqSet()
+
+    def replace_faq(self, faq: FaqSet) -> None:
+        self._enqueue(WriteOp(FAQ, "", faq))
+
+    async def get_feedback(self, user_id: int) -> Optional[Feedback]:
+        op = self._queued(FEEDBACK, str(user_id))
+        if op is not None:
+            return op.value
+        return await self._fetch_feedback(user_id)
+
+    def save_feedback(self, feedback: Feedback) -> None:
+        self._enqueue(WriteOp(FEEDBACK, str(feedback.user_id), feedback))
+
+    async def list_documents(self) -> List[DocumentRecord]:
+        documents = {record.name: record for record in await self._fetch_documents()}
+        for (collection, key), op in [*self._in_flight.items(), *self._pending.items()]:
+            if collection != DOCUMENTS:
+                continue
+            if op.value is None:
+                documents.pop(key, None)
+            else:
+                documents[key] = op.value
+        return [documents[name] for name in sorted(documents)]
+
+    def save_document(self, record: DocumentRecord) -> None:
+        self._enqueue(WriteOp(DOCUMENTS, record.name, record))
+
+    def remove_document(self, name: str) -> None:
+        self._enqueue(WriteOp(DOCUMENTS, name, None))
+
+    async def flush(self) -> None:
+        """
+        Applies the queued writes. Writes of a failed batch are queued again, unless they were overwritten meanwhile.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, {}
+            self._in_flight = batch
+            try:
+                await self._apply(list(batch.values()))
+            except BaseException as e:
+                # writes are idempotent, a batch interrupted by shutdown is simply written again
+                for key, op in batch.items():
+                    self._pending.setdefault(key, op)
+                if not isinstance(e, Exception):
+                    raise
+                logger.warning(f"Failed to write {len(batch)} records, will retry: {e}")
+                return
+            finally:
+                self._in_flight = {}
+
+            logger.debug(f"Flushed {len(batch)} records to the database")
+
+    def _queued(self, collection: str, key: str) -> Optional[WriteOp]:
+        return self._pending.get((collection, key)) or self._in_flight.get((collection, key))
+
+    def _enqueue(self, op: WriteOp) -> None:
+        self._pending[(op.collection, op.key)] = op
+        if len(self._pending) >= self.batch_size:
+            self._flush_requested.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    @abstractmethod
+    async def _connect(self) -> None:
+        pass
+
+    @abstractmethod
+    async def _disconnect(self) -> None:
+        pass
+
+    @abstractmethod
+    async def _fetch_faq(self) -> Optional[FaqSet]:
+        pass
+
+    @abstractmethod
+    async def _fetch_feedback(self, user_id: int) -> Optional[Feedback]:
+        pass
+
+    @abstractmethod
+    async def _fetch_documents(self) -> List[DocumentRecord]:
+        pass
+
+    @abstractmethod
+    async def _apply(self, ops: List[WriteOp]) -> None:
+        """
+        Writes a batch. Should be atomic where the backend allows it.
+        """
+        pass
+
+
+def create_repository(kind: str = DATABASE_BACKEND) -> BaseRepository:
+    if kind == "sqlite":
+        from app.bot.database.impl.sqlite import SqliteRepository
+        return SqliteRepository()
+    if kind == "mongo":
+        from app.bot.database.impl.mongo import MongoRepository
+        return MongoRepository()
+    raise ValueError(f"Unknown database backend: {kind}")
+
+
+@singleton
+def get_repository() -> BaseRepository:
+    """
+    The repository of this process, created from DATABASE_BACKEND.
+    """
+    return create_repository()
@@ -1,13 +1,13 @@
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 
+from app.bot.database.models.feedback import Feedback
+from app.bot.database.repository import get_repository
 from app.bot.keyboards.feedback import feedback_keyboard
 from app.bot.keyboards.general import start_keyboard
 
 router = Router()
 
-users = set()
-
 @router.callback_query(F.data == "feedback_button")
 async def feedback_button_handler(callback_query: CallbackQuery):
     """
@@ -15,25 +15,22 @@ async def feedback_button_handler(callback_query: CallbackQuery):
     """
     telegram_id = callback_query.from_user.id
 
-    if telegram_id in users:
+    if await get_repository().get_feedback(telegram_id) is not None:
         text = "Вы уже оставляли фидбек. Спасибо!"
         await callback_query.message.edit_text(text=text, reply_markup=start_keyboard)
     else:
         text = "Пожалуйста, оцените наш бот от 1 до 5:"
-        users.add(telegram_id)
         await callback_query.message.edit_text(text=text, reply_markup=feedback_keyboard)
 
 
 @router.callback_query(F.data.startswith("feedback_"))
 async def handle_feedback(callback_query: CallbackQuery):
     """
-    Handles the feedback callback query. Processes the feedback and returns to the main menu.
+    Handles the feedback callback query. Saves the rating and returns to the main menu.
     """
     telegram_id = callback_query.from_user.id
     text = "Спасибо за ваш фидбек! Ваше мнение очень важно для нас."
 
-    if telegram_id in users:
-        await callback_query.message.edit_text(text=text, reply_markup=start_keyboard)
-    else:
-        users.add(telegram_id)
-        await callback_query.message.edit_text(text=text, reply_markup=start_keyboard)
\ No newline at end of file
+    rating = int(callback_query.data.removeprefix("feedback_"))
+    get_repository().save_feedback(Feedback(user_id=telegram_id, rating=rating))
+    await callback_query.message.edit_text(text=text, reply_markup=start_keyboard)
\ No newline at end of file
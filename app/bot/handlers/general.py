@@ -1,21 +1,31 @@
 import asyncio
-import time
-from concurrent.futures.thread import ThreadPoolExecutor
-from random import randrange
 
 from aiogram import Router, F
 from aiogram.enums import ChatAction
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 
 from app.bot import logger, bot
 from app.bot.api.ollama.impl.ollama import Ollama
-from app.bot.config import UPLOADS_DIR, user_prompt, system_prompt
-from app.bot.handlers.staff import questions
-from app.bot.keyboards.general import start_keyboard, answer_inline_keyboard, back_to_main_button
+from app.bot.api.ollama.pool import OllamaPool
+from app.bot.api.ollama.resilience import LLMError
+from app.bot.api.ollama.router import ModelRouter
+from app.bot.api.ollama.scheduler import LLMScheduler, Priority, QueueFullError
+from app.bot.api.ollama.warmup import ModelWarmer
+from app.bot.config import ANSWER_MAX_TOKENS, DEGRADED_FAQ_THRESHOLD, VOICE_MAX_DURATION
+from app.bot.keyboards.general import start_keyboard, answer_inline_keyboard, back_to_main_button, faq_match_keyboard
+from app.bot.knowledge.catalog import Catalog
+from app.bot.knowledge.context import AssembledPrompt, assemble_prompt
+from app.bot.knowledge.faq_matcher import FaqMatcher
+from app.bot.knowledge.knowledge_base import KnowledgeBase
+from app.bot.knowledge.retrieval import Retriever
+from app.bot.speech.audio import decode_audio
+from app.bot.speech.service import TranscriptionService, TranscriptionQueueFullError
 from app.bot.states.general import GeneralStates
-from app.bot.utils.utils import extract_text_from_all_docx_files
+from app.bot.utils.answer_cache import AnswerCache
+from app.bot.utils.streaming import StreamingMessage, answer_with_fallback, edit_with_fallback
 
 router = Router()
 
@@ -41,44 +51,178 @@ async def support_button_handler(callback_query: CallbackQuery, state: FSMContex
     Handles the 'support_button' callback query. Sets the state to GET_HELP and prompts the user to describe their problem.
     """
     await state.set_state(GeneralStates.GET_HELP)
+    # the question may go to either model, so both are kept loaded
+    for model in ModelWarmer().models:
+        ModelWarmer().schedule(model=model)
     await callback_query.message.answer(text='Внятно объясните и изложите суть своей проблемы и/или вопроса.')
 
 
+@router.message(GeneralStates.GET_HELP, F.voice | F.audio)
+async def voice_help_handler(message: Message, state: FSMContext):
+    """
+    Handles voice messages and audio files in the GET_HELP state. Transcribes the question and answers it like a text one.
+    """
+    transcription = TranscriptionService()
+    if not transcription.enabled:
+        await message.answer("Голосовые сообщения не поддерживаются, напишите вопрос текстом")
+        return
+
+    media = message.voice or message.audio
+    if media.duration and media.duration > VOICE_MAX_DURATION:
+        await message.answer(f"Сообщение слишком длинное, максимум {VOICE_MAX_DURATION} секунд")
+        return
+
+    try:
+        await bot.send_chat_action(message.chat.id, ChatAction.TYPING)
+        # the file stays in memory: downloaded into a buffer and piped through ffmpeg
+        buffer = await bot.download(media)
+        clip = await decode_audio(buffer.getvalue())
+        question = await transcription.transcribe(clip)
+    except TranscriptionQueueFullError:
+        await message.answer("Сейчас слишком много голосовых вопросов, попробуйте позже или напишите текстом")
+        return
+    except Exception as e:
+        logger.warning(f"Failed to transcribe a voice question: {e}")
+        await message.answer("Не удалось распознать сообщение, напишите вопрос текстом")
+        return
+
+    if not question:
+        await message.answer("Не удалось разобрать речь, попробуйте еще раз или напишите вопрос текстом")
+        return
+
+    await message.answer(f"Ваш вопрос: {question}", parse_mode=None)
+    await answer_question(message, message.from_user.id, question, state, use_faq=True)
+
+
 @router.message(GeneralStates.GET_HELP)
 async def help_handler(message: Message, state: FSMContext):
     """
-    Handles messages in the GET_HELP state. Processes text input and streams the response.
+    Handles messages in the GET_HELP state. Answers from the FAQ if the question is already there,
+    otherwise processes text input and streams the response.
+    """
+    await answer_question(message, message.from_user.id, message.text, state, use_faq=True)
+
+
+@router.callback_query(F.data == "ask_ai_anyway")
+async def ask_ai_anyway_handler(callback_query: CallbackQuery, state: FSMContext):
+    """
+    Handles the 'ask_ai_anyway' callback query. Sends the question that was answered from the FAQ to the model.
+    """
+    question = (await state.get_data()).get("question")
+    if not question:
+        await callback_query.answer("Вопрос не найден, задайте его еще раз.", show_alert=True)
+        return
+
+    await callback_query.answer()
+    await answer_question(callback_query.message, callback_query.from_user.id, question, state, use_faq=False)
+
+
+def degraded_answer(question: str) -> str:
+    """
+    The reply while the model is unavailable: the closest FAQ entry or a request to ask later.
+    """
+    match = FaqMatcher().match(question, Catalog().faq, threshold=DEGRADED_FAQ_THRESHOLD)
+    if match is None:
+        return "Сервис ответов временно недоступен, попробуйте задать вопрос чуть позже."
+
+    entry, _ = match
+    return (f"Сервис ответов временно недоступен. Возможно, вам поможет ответ на похожий вопрос:\n\n"
+            f"*{entry.title}*\n\n{entry.answer}")
+
+
+def build_prompt(question: str, model: str) -> AssembledPrompt:
+    """
+    Retrieves the passages for the question and assembles its prompt. Both are CPU-bound and counting
+    tokens may use the tokenizer, so this runs in an executor.
+    """
+    return assemble_prompt(question, Retriever().search(question), model=model)
+
+
+async def answer_question(message: Message, user_id: int, question: str, state: FSMContext, use_faq: bool):
+    """
+    Answers a support question: from the answer cache, from the FAQ or by streaming a generation.
+
+    :param message: Message of the chat to answer in.
+    :param user_id: Telegram id of the user who asked.
+    :param question: The question.
+    :param state: FSM context of the user.
+    :param use_faq: Answer with a matching FAQ entry instead of the model.
     """
     try:
-        await bot.send_chat_action(message.chat.id, ChatAction.TYPING)
+        answer_cache = AnswerCache()
+        model_router = ModelRouter()
+        kb_version = KnowledgeBase().version
         loop = asyncio.get_running_loop()
+        # an answer of the small model given while the large one was overloaded is not reused for a complex question;
+        # a miss in memory reads the SQLite tier, so the lookup runs off the event loop like the write
+        cached_answer = await loop.run_in_executor(
+            None, answer_cache.get, question, model_router.preferred(question).model, kb_version)
+        if cached_answer is not None:
+            # the answer may have been shown as plain text when it was generated
+            await answer_with_fallback(message, cached_answer, reply_markup=answer_inline_keyboard)
+            await state.clear()
+            return
 
-        with ThreadPoolExecutor() as executor:
-            raw_text: str = await loop.run_in_executor(executor, extract_text_from_all_docx_files, UPLOADS_DIR)
+        if use_faq:
+            match = FaqMatcher().match(question, Catalog().faq)
+            if match is not None:
+                entry, score = match
+                logger.debug(f"Question matched FAQ entry {entry.title!r} ({score:.2f})")
+                # the state stays GET_HELP, so the user may still ask the model about the same question
+                await state.update_data(question=question)
+                # entries are generated, their markup may be broken
+                await answer_with_fallback(message, f"*{entry.title}*\n\n{entry.answer}", reply_markup=faq_match_keyboard)
+                return
 
-        formatted_user_prompt = user_prompt(message.text)
-        sys_prompt = system_prompt(raw_text)
+        if not OllamaPool().available:
+            # the backend is down, do not make the user wait for the deadlines
+            await message.answer(degraded_answer(question))
+            return
 
-        logger.debug(sys_prompt)
+        await bot.send_chat_action(message.chat.id, ChatAction.TYPING)
 
-        ollama = Ollama(formatted_user_prompt, system_prompt=sys_prompt, stream=True)
+        decision = model_router.route(question)
+        # counted from here, so questions routed meanwhile see this one in the queue of the model
+        async with model_router.track(decision.model):
+            assembled = await loop.run_in_executor(None, build_prompt, question, decision.model)
 
-        msg = await message.answer("Успешно!")
-        await bot.send_chat_action(message.chat.id, ChatAction.TYPING)
+            # cut to LOG_MAX_MESSAGE characters unless sampled, the whole prompt is rarely needed
+            logger.debug(f"Prompt for {decision.model}:\n{assembled.prompt}")
 
-        accumulated_text = ""
-        last_update_time = time.time()
+            ollama = Ollama(assembled.prompt, model=decision.model, system_prompt=assembled.system, stream=True,
+                            max_context=assembled.num_ctx, num_predict=ANSWER_MAX_TOKENS)
 
-        async for chunk in ollama.stream_response():
-            accumulated_text += chunk
+            msg = await message.answer("Успешно!")
+            await bot.send_chat_action(message.chat.id, ChatAction.TYPING)
 
-            if time.time() - last_update_time >= float(randrange(2, 3)):
-                await msg.edit_text(accumulated_text)
-                await bot.send_chat_action(message.chat.id, ChatAction.TYPING)
-                last_update_time = time.time()
+            async with StreamingMessage(msg) as stream:
+                async def show_queue_position(position: int):
+                    stream.set_status(f"Успешно! Ваш вопрос в очереди: {position}")
+
+                try:
+                    async with LLMScheduler().slot(user_id, Priority.INTERACTIVE, on_position=show_queue_position):
+                        async for chunk in ollama.stream_response():
+                            stream.append(chunk)
+                except QueueFullError:
+                    stream.set_status("Сейчас слишком много обращений, попробуйте повторить вопрос чуть позже.")
+                    await stream.finish()
+                    return
+                except LLMError as e:
+                    logger.warning(f"Generation for {user_id} on {decision.model} failed: {e}")
+                    if stream.text.strip():
+                        stream.append("\n\n(Ответ прерван: сервис ответов не отвечает. Попробуйте повторить вопрос позже.)")
+                    else:
+                        stream.set_status(degraded_answer(question))
+                    await stream.finish()
+                    return
+
+                await stream.finish(reply_markup=answer_inline_keyboard)
 
-        await msg.edit_text(accumulated_text, reply_markup=answer_inline_keyboard)
         await state.clear()
+
+        accumulated_text = stream.text
+        if accumulated_text.strip():
+            await loop.run_in_executor(None, answer_cache.put, question, ollama.model, kb_version, accumulated_text)
     except Exception as e:
         await message.answer("Произошла неизвестная ошибка, обратитесь в поддержку")
         logger.warning(e)
@@ -87,23 +231,27 @@ async def help_handler(message: Message, state: FSMContext):
 @router.callback_query(F.data == "faq_button")
 async def faq_button_handler(callback_query: CallbackQuery):
     """
-    Handles the 'faq_button' callback query. Displays FAQ questions as inline buttons.
+    Handles the 'faq_button' callback query. Displays the first page of FAQ questions as inline buttons.
     """
-    if not questions:
-        logger.debug(questions)
+    catalog = Catalog()
+    if not catalog.faq.entries:
         await callback_query.message.answer("Список FAQ пуст. Пожалуйста, обновите его.")
         return
 
-    faq_keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=question.title, callback_data=f"quest_{index}")]
-            for index, question in enumerate(questions)
-        ]
-    )
-
-    faq_keyboard.inline_keyboard.append([back_to_main_button])
+    await callback_query.message.edit_text("Часто задаваемые вопросы:", reply_markup=catalog.faq_keyboard())
 
-    await callback_query.message.edit_text("Часто задаваемые вопросы:", reply_markup=faq_keyboard)
+@router.callback_query(F.data.startswith("faq_page:"))
+async def faq_page_handler(callback_query: CallbackQuery):
+    """
+    Handles the navigation buttons of the FAQ list. Shows the requested page.
+    """
+    keyboard = Catalog().faq_keyboard(int(callback_query.data.split(":")[1]))
+    try:
+        await callback_query.message.edit_reply_markup(reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+    await callback_query.answer()
 
 @router.callback_query(F.data.startswith("quest_"))
 async def faq_answer_handler(callback_query: CallbackQuery):
@@ -111,11 +259,12 @@ async def faq_answer_handler(callback_query: CallbackQuery):
     Handles the FAQ question selection and shows the answer.
     """
     index = int(callback_query.data.split("_")[1])
+    questions = Catalog().faq.entries
 
     if index < len(questions):
         question = questions[index]
-        await callback_query.message.edit_text(
-            f"*{question.title}*\n\n{question.answer}",
+        await edit_with_fallback(
+            callback_query.message, f"*{question.title}*\n\n{question.answer}",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[back_to_main_button]])
         )
     else:
@@ -1,26 +1,30 @@
 import asyncio
-import json
 import os
-from concurrent.futures import ThreadPoolExecutor
-from typing import Optional, List
+import tempfile
+from typing import List, Optional
 
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery, Document
 
-from app.bot import logger, bot
-from app.bot.api.ollama.impl.ollama import Ollama
-from app.bot.config import UPLOADS_DIR, super_user_id
+from app.bot import logger
+from app.bot.config import UPLOADS_DIR, ARCHIVE_MAX_TOTAL_SIZE, super_user_id
+from app.bot.database.repository import get_repository
 from app.bot.keyboards.staff import choice_keyboard, document_keyboard, back_to_document_management_keyboard
+from app.bot.knowledge.catalog import Catalog
+from app.bot.knowledge.extractors import ExtractionError, SUPPORTED_EXTENSIONS, get_extractor
+from app.bot.knowledge.faq_generation import FaqGenerator, FaqJobProgress
+from app.bot.knowledge.ingestion import IngestionPool
+from app.bot.knowledge.knowledge_base import KnowledgeBase
+from app.bot.knowledge.uploads import ArchiveImporter, ArchiveReport, commit_upload, index_upload
 from app.bot.states.staff import StaffStates
-from app.bot.utils.utils import delayed_message_delete, create_paginated_keyboard_from_directory, Question, \
-    extract_text_from_all_docx_files
+from app.bot.utils.streaming import telegram_bucket
+from app.bot.utils.utils import delayed_message_delete
 
 router = Router()
 
-questions: List[Question] = []
-
 @router.message(Command(commands=["admin"]))
 async def define_post(message: Message):
     """
@@ -39,9 +43,25 @@ async def support_button_handler(callback_query: CallbackQuery):
     if callback_query.from_user.id != super_user_id:
         return
 
-    keyboard = create_paginated_keyboard_from_directory()
+    keyboard = Catalog().documents_keyboard()
     await callback_query.message.edit_text(text="Список загруженных документов", reply_markup=keyboard)
 
+@router.callback_query(F.data.startswith("page:"))
+async def document_page_handler(callback_query: CallbackQuery):
+    """
+    Handles the navigation buttons of the document list. Shows the requested page.
+    """
+    if callback_query.from_user.id != super_user_id:
+        return
+
+    keyboard = Catalog().documents_keyboard(int(callback_query.data.split(":")[1]))
+    try:
+        await callback_query.message.edit_reply_markup(reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+    await callback_query.answer()
+
 @router.callback_query(F.data.startswith("document_management_button"))
 async def open_document_panel(callback_query: CallbackQuery):
     """
@@ -76,25 +96,30 @@ async def load_document(callback_query: CallbackQuery, state: FSMContext):
     if callback_query.from_user.id != super_user_id:
         return
 
-    await callback_query.message.edit_text("Загрузите документ", reply_markup=back_to_document_management_keyboard)
+    await callback_query.message.edit_text(f"Загрузите документ ({', '.join(SUPPORTED_EXTENSIONS)}) или ZIP-архив с документами",
+                                           reply_markup=back_to_document_management_keyboard)
     await state.set_state(StaffStates.LOAD_DOCUMENT)
 
-async def handle_faq(ollama: Ollama, message: Message):
-    await ollama.send_request()
-    answer = ollama.get_formatted_response()
+def format_faq_progress(progress: FaqJobProgress) -> str:
+    if progress.error is not None:
+        return f"Генерация FAQ завершилась ошибкой: {progress.error}"
 
-    try:
-        data = json.loads(answer)
-        logger.debug(data)
-        for obj in data["questions"]:
-            questions.append(Question(title=obj["title"], answer=obj["answer"]))
+    processed = progress.done + progress.failed
+    lines = [f"Генерация FAQ: обработано {processed} из {progress.total} фрагментов"]
+    if progress.resumed:
+        lines.append(f"Продолжение прошлого запуска, уже готово: {progress.resumed}")
+    if progress.failed:
+        lines.append(f"Не удалось разобрать: {progress.failed}")
 
-        await bot.send_message(message.chat.id, "Успешно!")
-    except (json.JSONDecodeError, KeyError) as e:
-        await message.answer("Ошибка при обработке данных FAQ.")
-        logger.warning(f"Ошибка при загрузке FAQ: {e}")
+    if progress.finished:
+        if progress.entries:
+            lines.append(f"Готово! В FAQ {progress.entries} вопросов.")
+        else:
+            lines.append("Не удалось получить ни одного вопроса, FAQ не изменен.")
+        if progress.failed:
+            lines.append("Запустите регенерацию еще раз, чтобы повторить только неудачные фрагменты.")
 
-    await bot.send_message(message.from_user.id, "Успешно!")
+    return "\n".join(lines)
 
 
 @router.callback_query(F.data == "faq_regeneration_button")
@@ -102,32 +127,29 @@ async def generate_faq(callback_query: CallbackQuery):
     if callback_query.from_user.id != super_user_id:
         return
 
-    loop = asyncio.get_running_loop()
+    generator = FaqGenerator()
+    if generator.running:
+        await callback_query.answer("Генерация FAQ уже идет", show_alert=True)
+        return
+
+    status = await callback_query.message.answer("Генерация FAQ запускается...")
+
+    async def on_progress(progress: FaqJobProgress):
+        await telegram_bucket.acquire()
+        try:
+            await status.edit_text(format_faq_progress(progress), parse_mode=None)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in e.message:
+                raise
 
-    with ThreadPoolExecutor() as executor:
-        raw_text: str = await loop.run_in_executor(executor, extract_text_from_all_docx_files, UPLOADS_DIR)
-
-    ollama = Ollama(f"""
-    Тебе нужно придумать пять вопросов-ответов основываясь на базу знаний. Ответ должен быть ТОЛЬКО в формате JSON, без комментариев и прочего.
-    <json-schema>
-    {{
-      "questions": [
-        {{
-          "title": "string",
-          "answer": "string"
-        }}
-      ]
-    }}
-    </json-schema>
-    База знаний: {raw_text}
-    """, jsonify=True)
-    await callback_query.message.answer("Генерация займет много времени...")
-    await asyncio.create_task(handle_faq(ollama, callback_query.message))
+    generator.start(callback_query.from_user.id, on_progress)
+    await callback_query.answer()
 
 @router.message(StaffStates.LOAD_DOCUMENT)
 async def handle_document(message: Message, state: FSMContext):
     """
-    Handles document uploads in the LOAD_DOCUMENT state. Saves the document to the uploads directory.
+    Handles document uploads in the LOAD_DOCUMENT state. Saves the document to the uploads directory
+    unless the same contents are already there. ZIP archives are imported in the background.
     """
 
     document: Optional[Document] = message.document
@@ -136,17 +158,102 @@ async def handle_document(message: Message, state: FSMContext):
         await delayed_message_delete(message)
         return
 
-    file_id = document.file_id
-    file = await message.bot.get_file(file_id)
-    file_path = file.file_path
+    name = os.path.basename(document.file_name or "")
+    if name.lower().endswith('.zip'):
+        await handle_archive(message, state, document, name)
+        return
+
+    if get_extractor(name) is None:
+        message = await message.answer(f"Формат не поддерживается, загрузите файл {', '.join(SUPPORTED_EXTENSIONS)} "
+                                       f"или ZIP-архив с ними")
+        await delayed_message_delete(message)
+        return
+
+    ingestion = IngestionPool()
+    if document.file_size is not None and document.file_size > ingestion.max_file_size:
+        message = await message.answer(f"Документ слишком большой, максимум {ingestion.max_file_size // (1024 * 1024)} МБ")
+        await delayed_message_delete(message)
+        return
+
+    tmp_path = await download_to_uploads(message, document)
+    loop = asyncio.get_running_loop()
+    duplicate = await loop.run_in_executor(None, commit_upload, tmp_path, name)
+    if duplicate is not None:
+        message = await message.answer(f"Документ с таким содержимым уже загружен: {duplicate}")
+        await state.clear()
+        await delayed_message_delete(message)
+        return
 
-    destination = os.path.join(UPLOADS_DIR, document.file_name)
-    await message.bot.download_file(file_path, destination)
+    try:
+        await index_upload(os.path.join(UPLOADS_DIR, name), message.from_user.id)
+    except ExtractionError as e:
+        logger.warning(f"Failed to extract {name}: {e}")
+        message = await message.answer(f"Не удалось прочитать документ {name}: {e}")
+        await delayed_message_delete(message)
+        return
 
-    message = await message.answer(f"Документ {document.file_name} загружен")
+    message = await message.answer(f"Документ {name} загружен")
     await state.clear()
     await delayed_message_delete(message)
 
+async def download_to_uploads(message: Message, document: Document) -> str:
+    """
+    Streams a file from Telegram into a temporary file in the uploads directory, which sync() ignores.
+
+    :return: Path to the temporary file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOADS_DIR, prefix=".tmp-")
+    os.close(fd)
+    try:
+        file = await message.bot.get_file(document.file_id)
+        await message.bot.download_file(file.file_path, tmp_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+async def handle_archive(message: Message, state: FSMContext, document: Document, name: str):
+    """
+    Accepts a ZIP archive of documents. The import runs in the background and reports into a single message.
+    """
+    if document.file_size is not None and document.file_size > ARCHIVE_MAX_TOTAL_SIZE:
+        message = await message.answer(f"Архив слишком большой, максимум {ARCHIVE_MAX_TOTAL_SIZE // (1024 * 1024)} МБ")
+        await delayed_message_delete(message)
+        return
+
+    status = await message.answer(f"Архив {name} получен, документы распаковываются и индексируются...")
+    await state.clear()
+    archive_path = await download_to_uploads(message, document)
+
+    async def on_done(report: ArchiveReport):
+        await telegram_bucket.acquire()
+        await status.edit_text(format_archive_report(report), parse_mode=None)
+
+    ArchiveImporter().start(archive_path, name, message.from_user.id, on_done)
+
+def format_archive_report(report: ArchiveReport, max_listed: int = 10) -> str:
+    if report.error is not None:
+        return f"Архив {report.archive} не обработан: {report.error}"
+
+    def listed(title: str, items: List[str]) -> List[str]:
+        if not items:
+            return []
+        lines = [f"{title}: {len(items)}"]
+        lines.extend(f"  • {item}" for item in items[:max_listed])
+        if len(items) > max_listed:
+            lines.append(f"  • и еще {len(items) - max_listed}")
+        return lines
+
+    lines = [f"Архив {report.archive} обработан."]
+    lines += listed("Добавлено", report.added)
+    lines += listed("Обновлено", report.replaced)
+    lines += listed("Уже загружены", [f"{name} (= {original})" for name, original in report.duplicates])
+    lines += listed("Пропущено", [f"{name}: {reason}" for name, reason in report.skipped])
+    lines += listed("Не удалось прочитать", [f"{name}: {reason}" for name, reason in report.failed])
+    if len(lines) == 1:
+        lines.append("Документов для загрузки не найдено.")
+    return "\n".join(lines)
+
 @router.callback_query(F.data.startswith("unload_document_button"))
 async def unload_document(callback_query: CallbackQuery, state: FSMContext):
     """
@@ -168,6 +275,9 @@ async def handle_unload_document(message: Message, state: FSMContext):
 
     if os.path.exists(file_path):
         os.remove(file_path)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, KnowledgeBase().remove_document, file_name)
+        get_repository().remove_document(file_name)
         message = await message.answer(f"Файл {file_name} удален")
         await delayed_message_delete(message)
     else:
@@ -23,4 +23,15 @@ repeat_request_to_ai = InlineKeyboardButton(text="Спросить AI снова
 answer_inline_keyboard = InlineKeyboardMarkup(
     inline_keyboard=[
         [repeat_request_to_ai],
-])
\ No newline at end of file
+])
+
+ask_ai_anyway_button = InlineKeyboardButton(text="Все равно спросить AI", callback_data="ask_ai_anyway")
+
+#
+# Under an answer that was taken from the FAQ
+#
+faq_match_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [ask_ai_anyway_button],
+        [back_to_main_button],
+])
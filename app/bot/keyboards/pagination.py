@@ -0,0 +1,35 @@
+from typing import Sequence
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+
+def paginated_keyboard(buttons: Sequence[InlineKeyboardButton], row_width: int, page: int, pages: int,
+                       page_callback: str, back_button: InlineKeyboardButton) -> InlineKeyboardMarkup:
+    """
+    Lays out the buttons of one page with the navigation row and the back button under them.
+
+    :param buttons: Buttons of the page.
+    :param row_width: Buttons per row.
+    :param page: Number of the page, starting from 1.
+    :param pages: Number of pages.
+    :param page_callback: Callback data prefix of the navigation buttons, "<prefix>:<page>".
+    :param back_button: The last row.
+    :return: The keyboard.
+    """
+    kb_builder = InlineKeyboardBuilder()
+
+    for i in range(0, len(buttons), row_width):
+        kb_builder.row(*buttons[i:i + row_width])
+
+    nav_buttons = []
+    if page > 1:
+        nav_buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"{page_callback}:{page - 1}"))
+    if page < pages:
+        nav_buttons.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"{page_callback}:{page + 1}"))
+
+    if nav_buttons:
+        kb_builder.row(*nav_buttons)
+
+    kb_builder.row(back_button)
+    return kb_builder.as_markup()
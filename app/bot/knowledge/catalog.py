@@ -0,0 +1,115 @@
+import math
+import threading
+from typing import Dict, Iterable, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from app.bot.config import DOCUMENTS_PAGE_SIZE, FAQ_PAGE_SIZE
+from app.bot.database.models.faq import FaqSet
+from app.bot.keyboards.general import back_to_main_button
+from app.bot.keyboards.pagination import paginated_keyboard
+from app.bot.keyboards.staff import back_to_document_management_button
+from app.bot.utils.singleton import singleton
+
+DOCUMENTS = "documents"
+FAQ = "faq"
+
+
+@singleton
+class Catalog:
+    """
+    The lists users page through: knowledge base documents and FAQ questions.
+
+    Both are kept in memory, in a stable order, and updated by the events that change them:
+    the catalog listens to the knowledge base, and the FAQ job hands over every new FAQ.
+    Every change bumps the version of the list. Rendered pages are memoized by list, version and page,
+    so a page turn is a dictionary lookup without any disk or database access.
+
+    Like the knowledge base, the catalog belongs to one process.
+    """
+
+    def __init__(self, documents_page_size: int = DOCUMENTS_PAGE_SIZE, faq_page_size: int = FAQ_PAGE_SIZE):
+        """
+        Args:
+            documents_page_size (int): Documents per page.
+            faq_page_size (int): FAQ questions per page.
+        """
+        self.page_sizes = {DOCUMENTS: documents_page_size, FAQ: faq_page_size}
+
+        # knowledge base listeners are called from executor threads
+        self._lock = threading.Lock()
+        self._faq = FaqSet()
+        self._items: Dict[str, Tuple[str, ...]] = {DOCUMENTS: (), FAQ: ()}
+        self._versions: Dict[str, int] = {DOCUMENTS: 0, FAQ: 0}
+        self._pages: Dict[Tuple[str, int, int], InlineKeyboardMarkup] = {}
+
+    @property
+    def documents(self) -> Tuple[str, ...]:
+        return self._items[DOCUMENTS]
+
+    @property
+    def faq(self) -> FaqSet:
+        return self._faq
+
+    def version(self, kind: str) -> int:
+        return self._versions[kind]
+
+    def set_documents(self, names: Iterable[str]) -> None:
+        with self._lock:
+            self._set_items(DOCUMENTS, tuple(sorted(names)))
+
+    def set_faq(self, faq: FaqSet) -> None:
+        with self._lock:
+            self._faq = faq
+            self._set_items(FAQ, tuple(entry.title for entry in faq.entries))
+
+    def document_added(self, name: str, text: str) -> None:
+        with self._lock:
+            # a replaced document keeps its place in the list
+            if name not in self._items[DOCUMENTS]:
+                self._set_items(DOCUMENTS, tuple(sorted((*self._items[DOCUMENTS], name))))
+
+    def document_removed(self, name: str) -> None:
+        with self._lock:
+            if name in self._items[DOCUMENTS]:
+                self._set_items(DOCUMENTS, tuple(item for item in self._items[DOCUMENTS] if item != name))
+
+    def version_changed(self, version: str) -> None:
+        pass
+
+    def documents_keyboard(self, page: int = 1) -> InlineKeyboardMarkup:
+        return self._page(DOCUMENTS, page)
+
+    def faq_keyboard(self, page: int = 1) -> InlineKeyboardMarkup:
+        return self._page(FAQ, page)
+
+    def _set_items(self, kind: str, items: Tuple[str, ...]) -> None:
+        self._items[kind] = items
+        self._versions[kind] += 1
+        self._pages = {key: keyboard for key, keyboard in self._pages.items() if key[0] != kind}
+
+    def _page(self, kind: str, page: int) -> InlineKeyboardMarkup:
+        with self._lock:
+            items = self._items[kind]
+            page_size = self.page_sizes[kind]
+            pages = max(1, math.ceil(len(items) / page_size))
+            # a page of an outdated message may no longer exist
+            page = min(max(page, 1), pages)
+
+            key = (kind, self._versions[kind], page)
+            keyboard = self._pages.get(key)
+            if keyboard is None:
+                start = (page - 1) * page_size
+                keyboard = self._render(kind, items[start:start + page_size], start, page, pages)
+                self._pages[key] = keyboard
+            return keyboard
+
+    @staticmethod
+    def _render(kind: str, items: Tuple[str, ...], start: int, page: int, pages: int) -> InlineKeyboardMarkup:
+        # indexes instead of names: callback data is limited to 64 bytes
+        if kind == DOCUMENTS:
+            buttons = [InlineKeyboardButton(text=name, callback_data=f"file:{start + i}") for i, name in enumerate(items)]
+            return paginated_keyboard(buttons, 3, page, pages, "page", back_to_document_management_button)
+
+        buttons = [InlineKeyboardButton(text=title, callback_data=f"quest_{start + i}") for i, title in enumerate(items)]
+        return paginated_keyboard(buttons, 1, page, pages, "faq_page", back_to_main_button)
@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from typing import List
+
+
+@dataclass(frozen=True)
+class Chunk:
+    document: str
+    index: int
+    text: str
+
+
+def _split_long_paragraph(paragraph: str, chunk_size: int, overlap: int) -> List[str]:
+    """
+    Cuts a paragraph that does not fit into one chunk into overlapping windows,
+    preferring to cut on whitespace.
+    """
+    windows = []
+    start = 0
+    overlap = min(overlap, chunk_size // 2)
+
+    while start < len(paragraph):
+        end = min(start + chunk_size, len(paragraph))
+        if end < len(paragraph):
+            space = paragraph.rfind(' ', start + chunk_size // 2, end)
+            if space != -1:
+                end = space
+        windows.append(paragraph[start:end].strip())
+        if end == len(paragraph):
+            break
+        start = max(end - overlap, start + 1)
+        # do not start the next window in the middle of a word
+        space = paragraph.find(' ', start, end)
+        if space != -1 and paragraph[start - 1] != ' ':
+            start = space + 1
+
+    return [window for window in windows if window]
+
+
+def split_into_chunks(document: str, text: str, chunk_size: int = 1200, overlap: int = 200) -> List[Chunk]:
+    """
+    Splits a document into chunks of at most chunk_size characters.
+    Paragraphs are packed together while they fit, long paragraphs are cut into overlapping windows.
+
+    :param document: Name of the document the text belongs to.
+    :param text: Text of the document.
+    :param chunk_size: Maximum chunk length in characters.
+    :param overlap: How many characters neighbouring windows of a long paragraph share.
+    :return: Chunks in document order.
+    """
+    pieces = []
+    for paragraph in text.split('\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > chunk_size:
+            pieces.extend(_split_long_paragraph(paragraph, chunk_size, overlap))
+        else:
+            pieces.append(paragraph)
+
+    chunks = []
+    current = []
+    current_length = 0
+
+    for piece in pieces:
+        if current and current_length + len(piece) + 1 > chunk_size:
+            chunks.append('\n'.join(current))
+            current, current_length = [], 0
+        current.append(piece)
+        current_length += len(piece) + 1
+
+    if current:
+        chunks.append('\n'.join(current))
+
+    return [Chunk(document=document, index=index, text=chunk) for index, chunk in enumerate(chunks)]
@@ -0,0 +1,73 @@
+from dataclasses import dataclass, field
+from typing import List
+
+from app.bot import logger
+from app.bot.api.ollama.context_window import ContextWindow, TEMPLATE_TOKENS
+from app.bot.config import (available_llm_models, system_prompt, user_prompt, RETRIEVAL_TOKEN_BUDGET,
+                            RETRIEVAL_MAX_CONTEXT, ANSWER_MAX_TOKENS)
+from app.bot.knowledge.chunking import Chunk
+
+
+@dataclass
+class AssembledPrompt:
+    system: str
+    prompt: str
+    num_ctx: int
+    # estimated tokens of the prompt and the reserved answer
+    tokens: int
+    passages: List[Chunk] = field(default_factory=list)
+    dropped: List[Chunk] = field(default_factory=list)
+
+
+def render_passage(chunk: Chunk) -> str:
+    return f"[{chunk.document}]\n{chunk.text}"
+
+
+def assemble_prompt(question: str, passages: List[Chunk], model: str = available_llm_models,
+                    token_budget: int = RETRIEVAL_TOKEN_BUDGET, max_context: int = RETRIEVAL_MAX_CONTEXT,
+                    answer_tokens: int = ANSWER_MAX_TOKENS) -> AssembledPrompt:
+    """
+    Builds the prompt of a support question within a token budget.
+
+    The system prompt, the question and the answer are always kept. Knowledge base passages are taken
+    in the order of relevance while they fit into the budget, the rest are dropped. num_ctx is then
+    chosen for what was actually assembled; the backend is not picked yet, so Ollama may still raise it
+    to the bucket the backend has the model loaded with.
+
+    :param question: The user question.
+    :param passages: Retrieved chunks, the most relevant first.
+    :param model: The model that answers, its tokenizer decides the cost of the text.
+    :param token_budget: Maximal number of tokens of knowledge base passages.
+    :param max_context: The largest allowed num_ctx.
+    :param answer_tokens: Tokens reserved for the answer.
+    :return: The prompt and its num_ctx.
+    """
+    window = ContextWindow()
+    system = system_prompt()
+    fixed = window.count(system, model) + window.count(user_prompt(question, "-"), model) + TEMPLATE_TOKENS
+    budget = min(token_budget, max_context - fixed - answer_tokens)
+
+    selected: List[Chunk] = []
+    dropped: List[Chunk] = []
+    used = 0
+    for chunk in passages:
+        # passages are joined with an empty line
+        cost = window.count(render_passage(chunk), model) + 1
+        if used + cost > budget:
+            dropped.append(chunk)
+            continue
+        selected.append(chunk)
+        used += cost
+
+    tokens = fixed + used + answer_tokens
+    num_ctx = window.num_ctx(model, tokens, limit=max_context)
+
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} of {len(passages)} passages to fit {budget} tokens: "
+                    f"{', '.join(chunk.document for chunk in dropped)}")
+    if tokens > num_ctx:
+        logger.warning(f"Prompt of about {tokens} tokens does not fit num_ctx {num_ctx}")
+
+    context = '\n\n'.join(render_passage(chunk) for chunk in selected)
+    return AssembledPrompt(system=system, prompt=user_prompt(question, context), num_ctx=num_ctx, tokens=tokens,
+                           passages=selected, dropped=dropped)
@@ -0,0 +1,89 @@
+import hashlib
+from abc import ABC, abstractmethod
+from typing import List
+
+import numpy as np
+
+from app.bot.config import EMBEDDER, EMBEDDING_MODEL
+from app.bot.knowledge.lexical_index import tokenize
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Scales every row to unit length, so a dot product equals cosine similarity.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class BaseEmbedder(ABC):
+    """
+    Turns texts into dense vectors for the vector index.
+    """
+
+    name: str
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds a batch of texts.
+
+        Returns:
+            np.ndarray: float32 matrix of shape (len(texts), dim) with unit-length rows.
+        """
+
+
+class HashingEmbedder(BaseEmbedder):
+    """
+    Deterministic feature-hashing embedder. Needs no model weights, used in tests and as a CPU fallback.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            for term in tokenize(text):
+                # blake2b instead of hash() so vectors are stable across processes
+                value = int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), 'little')
+                matrix[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+
+        return normalize_rows(matrix)
+
+
+class FlagEmbedder(BaseEmbedder):
+    """
+    Dense embeddings from a BGE-M3 compatible model via FlagEmbedding.
+    """
+
+    dim = 1024
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = 32, max_length: int = 512):
+        from FlagEmbedding import BGEM3FlagModel
+
+        self.name = f"flag-{model_name}"
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._model = BGEM3FlagModel(model_name, use_fp16=True)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        output = self._model.encode(texts, batch_size=self.batch_size, max_length=self.max_length)
+        return normalize_rows(np.asarray(output['dense_vecs'], dtype=np.float32))
+
+
+def create_embedder(kind: str = EMBEDDER) -> BaseEmbedder:
+    """
+    Builds the embedder selected in the config.
+
+    :param kind: "flag" or "hashing".
+    """
+    if kind == 'flag':
+        return FlagEmbedder()
+    if kind == 'hashing':
+        return HashingEmbedder()
+    raise ValueError(f"Unknown embedder: {kind}")
@@ -0,0 +1,132 @@
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+
+
+class ExtractionError(Exception):
+    """
+    The text of a document could not be extracted: the file is too big, broken or took too long.
+    """
+
+
+class BaseExtractor(ABC):
+    """
+    Turns a document of one format into plain text.
+
+    Extractors run in the worker processes of the ingestion pool, so they may be slow and
+    must not rely on anything but the file itself.
+    """
+
+    extensions: Tuple[str, ...]
+
+    @abstractmethod
+    def extract(self, file_path: str) -> str:
+        """
+        Args:
+            file_path (str): Path to the document.
+
+        Returns:
+            str: Text of the document, paragraphs separated by newlines.
+        """
+
+
+def _join_cells(values: List[str]) -> str:
+    return ' | '.join(value for value in values if value)
+
+
+class DocxExtractor(BaseExtractor):
+    """
+    Paragraphs and tables of a Word document, in document order. A table row becomes one line.
+    """
+
+    extensions = ('.docx',)
+
+    def extract(self, file_path: str) -> str:
+        from docx import Document
+        from docx.table import Table
+
+        lines = []
+        for block in Document(file_path).iter_inner_content():
+            if isinstance(block, Table):
+                for row in block.rows:
+                    # a merged cell is returned once for every grid column it spans
+                    cells = []
+                    for cell in row.cells:
+                        text = cell.text.strip()
+                        if not cells or cells[-1] != text:
+                            cells.append(text)
+                    lines.append(_join_cells(cells))
+            else:
+                lines.append(block.text)
+
+        return '\n'.join(lines)
+
+
+class PdfExtractor(BaseExtractor):
+    """
+    Text layer of a PDF. Scanned pages without one produce no text.
+    """
+
+    extensions = ('.pdf',)
+
+    def extract(self, file_path: str) -> str:
+        from pdfminer.high_level import extract_text
+
+        # pages are separated by form feeds
+        return extract_text(file_path).replace('\x0c', '\n')
+
+
+class XlsxExtractor(BaseExtractor):
+    """
+    Cell values of an Excel workbook, sheet by sheet, one line per row.
+    """
+
+    extensions = ('.xlsx',)
+
+    def extract(self, file_path: str) -> str:
+        from openpyxl import load_workbook
+
+        # read_only streams the rows instead of building the whole workbook in memory
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            lines = []
+            for sheet in workbook.worksheets:
+                lines.append(f"Лист: {sheet.title}")
+                for row in sheet.iter_rows(values_only=True):
+                    line = _join_cells([str(value).strip() for value in row if value is not None])
+                    if line:
+                        lines.append(line)
+                lines.append('')
+            return '\n'.join(lines)
+        finally:
+            workbook.close()
+
+
+EXTRACTORS: List[BaseExtractor] = [DocxExtractor(), PdfExtractor(), XlsxExtractor()]
+
+SUPPORTED_EXTENSIONS = tuple(extension for extractor in EXTRACTORS for extension in extractor.extensions)
+
+
+def get_extractor(file_name: str) -> Optional[BaseExtractor]:
+    extension = os.path.splitext(file_name)[1].lower()
+    for extractor in EXTRACTORS:
+        if extension in extractor.extensions:
+            return extractor
+    return None
+
+
+def extract_text(file_path: str) -> str:
+    """
+    Extracts the text of a document with the extractor of its format. Entry point of the pool workers.
+
+    :raises ExtractionError: The format is not supported or the file cannot be parsed.
+    """
+    extractor = get_extractor(file_path)
+    if extractor is None:
+        raise ExtractionError(f"unsupported format: {os.path.basename(file_path)}")
+
+    try:
+        return extractor.extract(file_path)
+    except Exception as e:
+        # the original exception may not be picklable, only its description crosses the process boundary
+        raise ExtractionError(f"{type(e).__name__}: {e}") from None
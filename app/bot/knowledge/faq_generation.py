@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.bot import logger
+from app.bot.api.ollama.impl.ollama import Ollama
+from app.bot.api.ollama.resilience import LLMError
+from app.bot.api.ollama.scheduler import LLMScheduler, Priority, QueueFullError
+from app.bot.config import (CACHE_DIR, FAQ_CHUNK_SIZE, FAQ_CONCURRENCY, FAQ_MAX_ATTEMPTS,
+                            FAQ_DEDUP_THRESHOLD, FAQ_MAX_ENTRIES, FAQ_PROGRESS_INTERVAL, FAQ_SAVE_INTERVAL)
+from app.bot.database.models.faq import FaqEntry, FaqSet
+from app.bot.database.repository import get_repository
+from app.bot.knowledge.catalog import Catalog
+from app.bot.knowledge.chunking import Chunk, split_into_chunks
+from app.bot.knowledge.knowledge_base import KnowledgeBase
+from app.bot.knowledge.lexical_index import tokenize
+from app.bot.utils.singleton import singleton
+from app.bot.utils.utils import atomic_write
+
+# bump when the layout of the job state changes
+STATE_FORMAT = 1
+
+# the same for every fragment, so Ollama evaluates it once and reuses the prefix
+FAQ_SYSTEM_PROMPT = """
+Ты составляешь FAQ для сотрудников компании ООО Сила по фрагменту базы знаний.
+Придумай от одного до трех вопросов, которые сотрудник мог бы задать, и ответь на них только по этому фрагменту.
+Если во фрагменте нет полезной информации, верни пустой список.
+Ответ должен быть ТОЛЬКО в формате JSON, без комментариев и прочего.
+<json-schema>
+{
+  "questions": [
+    {
+      "title": "string",
+      "answer": "string"
+    }
+  ]
+}
+</json-schema>
+"""
+
+# LLMError is not among them: send_request has retried the request already
+_RETRYABLE_ERRORS = (ValueError, QueueFullError)
+
+
+@dataclass
+class FaqJobProgress:
+    total: int
+    done: int = 0
+    failed: int = 0
+    # fragments taken from an interrupted previous run
+    resumed: int = 0
+    finished: bool = False
+    entries: int = 0
+    error: Optional[str] = None
+
+
+ProgressCallback = Callable[[FaqJobProgress], Awaitable[None]]
+
+
+def parse_candidates(raw: str) -> List[FaqEntry]:
+    """
+    Parses the JSON reply of the model.
+
+    :raises ValueError: The reply is not JSON or does not follow the schema.
+    """
+    data = json.loads(raw)
+    if not isinstance(data, dict) or not isinstance(data.get("questions"), list):
+        raise ValueError("'questions' list is missing")
+
+    entries = []
+    for item in data["questions"]:
+        if not isinstance(item, dict):
+            continue
+        title, answer = item.get("title"), item.get("answer")
+        if isinstance(title, str) and isinstance(answer, str) and title.strip() and answer.strip():
+            entries.append(FaqEntry(title=title.strip(), answer=answer.strip()))
+    return entries
+
+
+def deduplicate(candidates: List[FaqEntry], threshold: float = FAQ_DEDUP_THRESHOLD) -> List[FaqEntry]:
+    """
+    Groups near-identical questions (Jaccard similarity of their stemmed terms) and keeps the first one of each group.
+    Groups are ordered by size: a question produced from many fragments is likely an important one.
+    """
+    groups: List[List] = []  # [terms, entry, size]
+
+    for candidate in candidates:
+        terms: Set[str] = set(tokenize(candidate.title))
+        for group in groups:
+            union = terms | group[0]
+            if union and len(terms & group[0]) / len(union) >= threshold:
+                group[2] += 1
+                break
+        else:
+            groups.append([terms, candidate, 1])
+
+    groups.sort(key=lambda group: -group[2])
+    return [entry for _, entry, _ in groups]
+
+
+def fragment_key(chunk: Chunk) -> str:
+    return hashlib.sha256(f"{chunk.document}\0{chunk.text}".encode('utf-8')).hexdigest()[:16]
+
+
+@dataclass
+class _FragmentState:
+    status: str  # "done" or "failed"
+    attempts: int = 0
+    questions: List[dict] = field(default_factory=list)
+
+
+@singleton
+class FaqGenerator:
+    """
+    Regenerates the FAQ in the background, map-reduce style.
+
+    The knowledge base is split into fragments and every fragment gets its own small JSON-mode
+    request (map), at background priority so users' questions go first. The candidates are then
+    deduplicated and the new FAQ replaces the old one in a single write (reduce).
+
+    The state of the job is saved every `save_interval` seconds while fragments complete and at the end,
+    rewriting it after every fragment would make a run quadratic in the size of the knowledge base.
+    A run that was interrupted or had fragments whose reply could not be parsed is resumed by the next one:
+    parsed fragments are reused and only the rest are sent to the model again.
+    """
+
+    def __init__(self, state_path: str = os.path.join(CACHE_DIR, 'faq_job.json'), chunk_size: int = FAQ_CHUNK_SIZE,
+                 concurrency: int = FAQ_CONCURRENCY, max_attempts: int = FAQ_MAX_ATTEMPTS,
+                 max_entries: int = FAQ_MAX_ENTRIES, progress_interval: float = FAQ_PROGRESS_INTERVAL,
+                 save_interval: float = FAQ_SAVE_INTERVAL):
+        """
+        Args:
+            state_path (str): JSON file with the state of the last run.
+            chunk_size (int): Size of one fragment in characters.
+            concurrency (int): How many fragments may wait in the scheduler at once.
+            max_attempts (int): Attempts per fragment within one run.
+            max_entries (int): Size limit of the resulting FAQ.
+            progress_interval (float): Minimal number of seconds between progress reports.
+            save_interval (float): Minimal number of seconds between saves of the state during a run.
+        """
+        self.state_path = state_path
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.max_entries = max_entries
+        self.progress_interval = progress_interval
+        self.save_interval = save_interval
+
+        self._task: Optional[asyncio.Task] = None
+        self._state_lock = asyncio.Lock()
+        self._saved_at = float('-inf')
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, user_id: int, on_progress: ProgressCallback) -> bool:
+        """
+        Starts a run in the background.
+
+        :param user_id: Telegram id of the admin, the requests are scheduled on his behalf.
+        :param on_progress: Receives progress reports, the last one has finished == True.
+        :return: False if a run is already in progress.
+        """
+        if self.running:
+            return False
+
+        self._task = asyncio.create_task(self._safe_run(user_id, on_progress))
+        return True
+
+    async def run(self, user_id: int, on_progress: ProgressCallback) -> FaqSet:
+        loop = asyncio.get_running_loop()
+        # reads and splits every document, which would stall the chats on the event loop
+        kb_version, fragments = await loop.run_in_executor(None, self._split_knowledge_base)
+        results = await loop.run_in_executor(None, self._resume, fragments)
+        self._saved_at = time.monotonic()
+        progress = FaqJobProgress(total=len(fragments), done=len(results), resumed=len(results))
+        reporter = _ProgressReporter(on_progress, self.progress_interval)
+        await reporter.report(progress, force=True)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(key: str, chunk: Chunk) -> None:
+            async with semaphore:
+                state = await self._generate(user_id, chunk, results.get(key))
+            results[key] = state
+            if time.monotonic() - self._saved_at >= self.save_interval:
+                self._saved_at = time.monotonic()
+                await self._save_state(results, finished=False, kb_version=kb_version)
+
+            if state.status == "done":
+                progress.done += 1
+            else:
+                progress.failed += 1
+            await reporter.report(progress)
+
+        pending = {key: chunk for key, chunk in fragments.items() if key not in results or results[key].status != "done"}
+        await asyncio.gather(*(process(key, chunk) for key, chunk in pending.items()))
+
+        candidates = [
+            FaqEntry(**question)
+            for key in fragments if results[key].status == "done"
+            for question in results[key].questions
+        ]
+        entries = deduplicate(candidates)[:self.max_entries]
+        faq = FaqSet(entries=entries, kb_version=kb_version)
+
+        if entries:
+            get_repository().replace_faq(faq)
+            Catalog().set_faq(faq)
+        logger.info(f"FAQ job: {len(candidates)} candidates from {progress.done}/{progress.total} fragments, "
+                    f"{len(entries)} after deduplication, {progress.failed} fragments failed")
+
+        # with failed fragments the next run resumes and retries only them
+        await self._save_state(results, finished=not progress.failed, kb_version=kb_version)
+
+        progress.finished = True
+        progress.entries = len(entries)
+        await reporter.report(progress, force=True)
+        return faq
+
+    async def _safe_run(self, user_id: int, on_progress: ProgressCallback) -> None:
+        try:
+            await self.run(user_id, on_progress)
+        except Exception as e:
+            logger.exception(f"FAQ job failed: {e}")
+            try:
+                await on_progress(FaqJobProgress(total=0, finished=True, error=str(e)))
+            except Exception as report_error:
+                logger.debug(f"FAQ job failure report failed: {report_error}")
+
+    async def _generate(self, user_id: int, chunk: Chunk, previous: Optional[_FragmentState]) -> _FragmentState:
+        state = _FragmentState(status="failed", attempts=previous.attempts if previous else 0)
+
+        for _ in range(self.max_attempts):
+            state.attempts += 1
+            # num_ctx is picked for the fragment, usually the bucket the model is already loaded with
+            ollama = Ollama(chunk.text, system_prompt=FAQ_SYSTEM_PROMPT, jsonify=True)
+            try:
+                async with LLMScheduler().slot(user_id, Priority.BACKGROUND):
+                    await ollama.send_request()
+                if ollama.response is None:
+                    raise ValueError("no response from the model")
+                entries = parse_candidates(ollama.get_formatted_response())
+            except _RETRYABLE_ERRORS as e:
+                logger.warning(f"FAQ job: fragment {chunk.document}#{chunk.index} failed "
+                               f"(attempt {state.attempts}): {e}")
+                continue
+            except LLMError as e:
+                logger.warning(f"FAQ job: fragment {chunk.document}#{chunk.index} failed: {e}")
+                break
+
+            state.status = "done"
+            state.questions = [entry.model_dump() for entry in entries]
+            break
+
+        return state
+
+    def _split_knowledge_base(self) -> Tuple[str, Dict[str, Chunk]]:
+        """
+        :return: Version of the knowledge base and its fragments by key. Blocking, run it in an executor.
+        """
+        knowledge_base = KnowledgeBase()
+        kb_version = knowledge_base.version
+
+        fragments: Dict[str, Chunk] = {}
+        for name in knowledge_base.documents:
+            for chunk in split_into_chunks(name, knowledge_base.document_text(name) or "", self.chunk_size, overlap=0):
+                fragments[fragment_key(chunk)] = chunk
+        return kb_version, fragments
+
+    def _resume(self, fragments: Dict[str, Chunk]) -> Dict[str, _FragmentState]:
+        """
+        Parsed fragments of an unfinished previous run that are still in the knowledge base.
+        Blocking, run it in an executor.
+        """
+        if not os.path.exists(self.state_path):
+            return {}
+
+        with open(self.state_path, encoding='utf-8') as f:
+            state = json.load(f)
+
+        if state.get('format') != STATE_FORMAT or state.get('finished'):
+            return {}
+
+        results = {
+            key: _FragmentState(**value) for key, value in state['fragments'].items()
+            if key in fragments and value['status'] == "done"
+        }
+        if results:
+            logger.info(f"FAQ job: resuming, {len(results)} of {len(fragments)} fragments are already done")
+        return results
+
+    async def _save_state(self, results: Dict[str, _FragmentState], finished: bool, kb_version: str) -> None:
+        state = {
+            'format': STATE_FORMAT,
+            'finished': finished,
+            'kb_version': kb_version,
+            'fragments': {key: asdict(value) for key, value in results.items()},
+        }
+
+        def write() -> None:
+            atomic_write(self.state_path, json.dumps(state, ensure_ascii=False).encode('utf-8'))
+
+        async with self._state_lock:
+            await asyncio.get_running_loop().run_in_executor(None, write)
+
+
+class _ProgressReporter:
+    def __init__(self, callback: ProgressCallback, interval: float):
+        self.callback = callback
+        self.interval = interval
+        self._reported_at = float('-inf')
+
+    async def report(self, progress: FaqJobProgress, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._reported_at < self.interval:
+            return
+
+        self._reported_at = now
+        try:
+            await self.callback(progress)
+        except Exception as e:
+            logger.debug(f"FAQ job progress report failed: {e}")
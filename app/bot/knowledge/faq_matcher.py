@@ -0,0 +1,100 @@
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.bot.config import FAQ_MATCH_THRESHOLD
+from app.bot.database.models.faq import FaqEntry, FaqSet
+from app.bot.utils.answer_cache import normalize_question
+from app.bot.utils.metrics import cache_requests
+from app.bot.utils.singleton import singleton
+
+
+@singleton
+class FaqMatcher:
+    """
+    Finds the FAQ entry a user question is a near-duplicate of.
+
+    Titles are embedded as L2-normalized character n-gram TF-IDF vectors (robust to typos and
+    Russian inflection). The matrix is stored transposed, n-gram by entry, so scoring a question
+    only sums the rows of the few n-grams it contains. The question is weighted here rather than
+    by `TfidfVectorizer.transform`, whose per-call overhead is larger than the scoring itself.
+    The index is rebuilt whenever it is asked about a different FAQ set.
+    """
+
+    def __init__(self, threshold: float = FAQ_MATCH_THRESHOLD):
+        """
+        Args:
+            threshold (float): Minimal cosine similarity of a match.
+        """
+        self.threshold = threshold
+        self._key: Optional[tuple] = None
+        self._entries: List[FaqEntry] = []
+        self._analyzer: Optional[Callable[[str], List[str]]] = None
+        self._vocabulary: Dict[str, int] = {}
+        self._idf: Optional[np.ndarray] = None
+        # n-gram x entry, CSR
+        self._matrix = None
+
+    def match(self, question: str, faq: FaqSet, threshold: Optional[float] = None) -> Optional[Tuple[FaqEntry, float]]:
+        """
+        :param question: The user question.
+        :param faq: Current FAQ set.
+        :param threshold: Minimal similarity instead of the configured one.
+        :return: The best entry and its similarity, or None if nothing is similar enough.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        self._ensure_index(faq)
+        if self._matrix is None:
+            return None
+
+        scores = self._scores(normalize_question(question))
+        best = int(np.argmax(scores)) if scores is not None else 0
+
+        if scores is None or scores[best] < threshold:
+            cache_requests.inc(cache="faq", result="miss")
+            return None
+
+        cache_requests.inc(cache="faq", result="hit")
+        return self._entries[best], float(scores[best])
+
+    def warm_up(self, faq: FaqSet) -> None:
+        """
+        Builds the index ahead of the first question, which would otherwise wait for scikit-learn to be imported.
+
+        :param faq: Current FAQ set.
+        """
+        self._ensure_index(faq)
+
+    def _scores(self, text: str) -> Optional[np.ndarray]:
+        counts = Counter(gram for gram in self._analyzer(text) if gram in self._vocabulary)
+        if not counts:
+            return None
+
+        columns = np.fromiter((self._vocabulary[gram] for gram in counts), dtype=np.intp, count=len(counts))
+        # the weighting of the vectorizer: sublinear tf, idf, L2 norm
+        weights = 1 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+        weights *= self._idf[columns]
+        weights /= np.linalg.norm(weights)
+        return self._matrix[columns].T @ weights
+
+    def _ensure_index(self, faq: FaqSet) -> None:
+        key = (faq.kb_version, faq.updated_at, len(faq.entries))
+        if key == self._key:
+            return
+
+        self._key = key
+        self._entries = list(faq.entries)
+        if not self._entries:
+            self._matrix = None
+            return
+
+        # scikit-learn takes longer to import than the rest of the bot except aiogram
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), sublinear_tf=True)
+        matrix = vectorizer.fit_transform([normalize_question(entry.title) for entry in self._entries])
+        self._analyzer = vectorizer.build_analyzer()
+        self._vocabulary = vectorizer.vocabulary_
+        self._idf = vectorizer.idf_
+        self._matrix = matrix.T.tocsr()
@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from app.bot import logger
+from app.bot.config import INGESTION_WORKERS, INGESTION_TIMEOUT, INGESTION_MAX_FILE_SIZE
+from app.bot.knowledge.extractors import ExtractionError, extract_text
+from app.bot.utils.singleton import singleton
+
+
+@singleton
+class IngestionPool:
+    """
+    Extracts document texts in a bounded pool of worker processes.
+
+    Parsing a large PDF is CPU-bound and holds the GIL for seconds, in a thread it would stall the
+    event loop. In a worker process it only occupies that worker. Files over `max_file_size` are
+    rejected before parsing. A file that takes longer than `timeout` gets the pool restarted,
+    because a running task cannot be cancelled otherwise.
+    """
+
+    def __init__(self, workers: int = INGESTION_WORKERS, timeout: float = INGESTION_TIMEOUT,
+                 max_file_size: int = INGESTION_MAX_FILE_SIZE):
+        """
+        Args:
+            workers (int): Number of worker processes.
+            timeout (float): Seconds one file may take.
+            max_file_size (int): Largest accepted file in bytes.
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.max_file_size = max_file_size
+
+        # a file waits for a free worker here, so the timeout only counts its own parsing
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def extract(self, file_path: str) -> str:
+        """
+        Extracts the text of a document. Blocking, run it in an executor.
+
+        :param file_path: Path to the document.
+        :return: The text.
+        :raises ExtractionError: The file is too big, cannot be parsed or took too long.
+        """
+        size = os.path.getsize(file_path)
+        if size > self.max_file_size:
+            raise ExtractionError(f"file is too big: {size} bytes, the limit is {self.max_file_size}")
+
+        with self._slots:
+            return self._extract(file_path)
+
+    def _extract(self, file_path: str, retry: bool = True) -> str:
+        executor = self._get_executor()
+        try:
+            return executor.submit(extract_text, file_path).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.warning(f"Extraction of {os.path.basename(file_path)} timed out, restarting the ingestion pool")
+            self._restart(executor)
+            raise ExtractionError(f"timed out after {self.timeout:g} s") from None
+        except BrokenProcessPool:
+            restarted = self._executor is not executor
+            self._restart(executor)
+            if restarted and retry:
+                # the pool was restarted because of another file, this one gets a second chance
+                return self._extract(file_path, retry=False)
+            # the worker died on this file, e.g. killed by the OOM killer
+            raise ExtractionError("the worker process died") from None
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: the bot process runs threads, forking it could copy a held lock
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+        # ProcessPoolExecutor cannot cancel a running task, the stuck worker has to be killed.
+        # Other files extracted by the same pool fail with BrokenProcessPool.
+        for process in list(executor._processes.values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
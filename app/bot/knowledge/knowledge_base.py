@@ -0,0 +1,388 @@
+import hashlib
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Deque, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from app.bot import logger
+from app.bot.config import UPLOADS_DIR, CACHE_DIR
+from app.bot.knowledge.extractors import ExtractionError, get_extractor
+from app.bot.knowledge.ingestion import IngestionPool
+from app.bot.utils.metrics import cache_requests
+from app.bot.utils.singleton import singleton
+from app.bot.utils.utils import atomic_write
+
+# bump when the snapshot layout or the extraction output changes, so old caches are ignored
+SNAPSHOT_FORMAT = 2
+
+
+@dataclass
+class DocumentEntry:
+    name: str
+    sha256: str
+    size: int
+    mtime_ns: int
+
+
+class KnowledgeBaseListener(Protocol):
+    """
+    Receives knowledge base changes. Used by indexes that are derived from the document texts.
+    Changes are delivered one at a time in the order they were made, outside the lock of the knowledge base.
+    """
+
+    def document_added(self, name: str, text: str) -> None:
+        ...
+
+    def document_removed(self, name: str) -> None:
+        ...
+
+    def version_changed(self, version: str) -> None:
+        """
+        The snapshot of the changes delivered so far is built, `version` is the version of the knowledge base now.
+        A batch, e.g. a sync or an archive import, reports it once, after all of its documents.
+        """
+        ...
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """
+    Computes the sha256 of a file without reading it into memory at once.
+
+    :param file_path: Path to the file.
+    :param block_size: Size of the blocks read from disk.
+    :return: Hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@singleton
+class KnowledgeBase:
+    """
+    Persistent, content-addressed cache of the text extracted from uploaded documents.
+
+    Layout of the cache directory:
+        texts/<sha256>.v<format>.txt - extracted text of a document, shared by files with equal contents
+        manifest.json      - file name -> sha256, size and mtime of the file it was extracted from
+        snapshot.json      - version of the knowledge base, a hash of the names and contents of its documents
+
+    Documents are parsed only when they are added (or changed on disk between restarts). The request path
+    reads the retrieval index, which the listeners keep up to date, and the version from the snapshot.
+    """
+
+    def __init__(self, uploads_dir: str = UPLOADS_DIR, cache_dir: str = CACHE_DIR):
+        self.uploads_dir = uploads_dir
+        self.cache_dir = cache_dir
+        self._texts_dir = os.path.join(cache_dir, 'texts')
+        self._manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self._snapshot_path = os.path.join(cache_dir, 'snapshot.json')
+
+        self._lock = threading.RLock()
+        # listeners get the changes from the queue, under a lock of their own: indexing a document
+        # must not hold back other uploads or readers of the manifest
+        self._delivery_lock = threading.Lock()
+        # (kind, document name or the new version, text of an added document)
+        self._events: Deque[Tuple[str, str, Optional[str]]] = deque()
+        self._listeners: List[KnowledgeBaseListener] = []
+        self._manifest: Dict[str, DocumentEntry] = {}
+        self._snapshot: Optional[dict] = None
+        # while a batch runs, the manifest and the snapshot are written once at its end
+        self._batches = 0
+        self._manifest_outdated = False
+
+        os.makedirs(self._texts_dir, exist_ok=True)
+        self._load_manifest()
+
+    @property
+    def version(self) -> str:
+        """
+        Version of the knowledge base, changes whenever a document is added, replaced or removed.
+        """
+        return self._get_snapshot()['version']
+
+    @property
+    def documents(self) -> List[str]:
+        with self._lock:
+            return sorted(self._manifest)
+
+    @property
+    def document_hashes(self) -> Dict[str, str]:
+        """
+        sha256 of the contents -> name of a document with these contents.
+        """
+        with self._lock:
+            return {entry.sha256: name for name, entry in self._manifest.items()}
+
+    def document_text(self, name: str) -> Optional[str]:
+        """
+        Returns the cached text of a document or None if it is not in the knowledge base.
+        """
+        with self._lock:
+            entry = self._manifest.get(name)
+        if entry is None:
+            return None
+        return self._read_text(entry.sha256)
+
+    def add_listener(self, listener: KnowledgeBaseListener, replay: bool = True) -> None:
+        """
+        Subscribes a listener to document changes.
+
+        :param listener: The listener.
+        :param replay: Send the documents that are already in the knowledge base to the listener.
+        """
+        with self._delivery_lock:
+            self._deliver_pending()
+            with self._lock:
+                self._listeners.append(listener)
+                documents = sorted((name, entry.sha256) for name, entry in self._manifest.items())
+
+            # changes made meanwhile are queued, they reach the listener after the replay
+            for name, sha256 in documents if replay else ():
+                try:
+                    text = self._read_text(sha256)
+                except FileNotFoundError:
+                    # removed meanwhile, the listener gets the removal next
+                    continue
+                listener.document_added(name, text)
+
+    def add_document(self, file_path: str) -> Optional[DocumentEntry]:
+        """
+        Extracts the text of a document (unless the same contents were extracted before)
+        and updates the snapshot. Blocking, run it in an executor.
+
+        :param file_path: Path to the document inside the uploads directory.
+        :return: The manifest entry or None if the format is not supported.
+        :raises ExtractionError: The text could not be extracted, the knowledge base is unchanged.
+        """
+        name = os.path.basename(file_path)
+        if get_extractor(name) is None:
+            logger.debug(f"Skipping unsupported document {name}")
+            return None
+
+        stat = os.stat(file_path)
+        sha256 = hash_file(file_path)
+        text_path = self._text_path(sha256)
+
+        if os.path.exists(text_path):
+            cache_requests.inc(cache="extraction", result="hit")
+            text = self._read_text(sha256)
+        else:
+            cache_requests.inc(cache="extraction", result="miss")
+            text = IngestionPool().extract(file_path)
+            atomic_write(text_path, text.encode('utf-8'))
+            logger.info(f"Extracted {len(text)} characters from {name}")
+
+        entry = DocumentEntry(name=name, sha256=sha256, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+        with self._lock:
+            previous = self._manifest.get(name)
+            self._manifest[name] = entry
+            self._save_manifest()
+
+            if previous is not None and previous.sha256 == sha256:
+                return entry
+
+            if previous is not None:
+                self._collect_garbage(previous.sha256)
+                self._events.append(('removed', name, None))
+            self._events.append(('added', name, text))
+            if not self._batches:
+                self._update_snapshot()
+
+        self._deliver()
+        return entry
+
+    def remove_document(self, name: str) -> bool:
+        """
+        Evicts a document from the knowledge base. Blocking, run it in an executor.
+
+        :param name: File name of the document.
+        :return: True if the document was known.
+        """
+        with self._lock:
+            entry = self._manifest.pop(name, None)
+            if entry is None:
+                return False
+
+            self._save_manifest()
+            self._collect_garbage(entry.sha256)
+            self._events.append(('removed', name, None))
+            if not self._batches:
+                self._update_snapshot()
+
+        self._deliver()
+        return True
+
+    def sync(self) -> None:
+        """
+        Reconciles the cache with the uploads directory, e.g. after files were changed while the bot was down.
+        Files whose size and mtime match the manifest are not even hashed. The manifest and the snapshot are
+        written once at the end, rewriting them for every file would make a sync of n new documents quadratic.
+        """
+        on_disk = {}
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        for filename in os.listdir(self.uploads_dir):
+            file_path = os.path.join(self.uploads_dir, filename)
+            if get_extractor(filename) is not None and os.path.isfile(file_path):
+                on_disk[filename] = os.stat(file_path)
+
+        with self._lock:
+            known = dict(self._manifest)
+
+        with self.batch():
+            for name in known.keys() - on_disk.keys():
+                self.remove_document(name)
+
+            for name, stat in on_disk.items():
+                entry = known.get(name)
+                if entry is None or entry.size != stat.st_size or entry.mtime_ns != stat.st_mtime_ns:
+                    try:
+                        self.add_document(os.path.join(self.uploads_dir, name))
+                    except ExtractionError as e:
+                        logger.warning(f"Skipping document {name}: {e}")
+
+    def begin_batch(self) -> None:
+        """
+        Starts adding or removing many documents: the manifest and the snapshot are written once,
+        when the batch ends, instead of after every document. Batches may overlap, the last one to end writes.
+        """
+        with self._lock:
+            self._batches += 1
+
+    def end_batch(self) -> None:
+        """
+        Ends a batch, writes the manifest and rebuilds the snapshot if the documents changed.
+        Blocking, run it in an executor.
+        """
+        with self._lock:
+            self._batches -= 1
+            if self._batches:
+                return
+            if self._manifest_outdated:
+                self._save_manifest()
+
+            snapshot = self._snapshot or self._load_snapshot()
+            if snapshot is None or snapshot['version'] != self._compute_version():
+                self._update_snapshot()
+        self._deliver()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        self.begin_batch()
+        try:
+            yield
+        finally:
+            self.end_batch()
+
+    def _get_snapshot(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._load_snapshot() or self._rebuild_snapshot()
+            return self._snapshot
+
+    def _load_snapshot(self) -> Optional[dict]:
+        if not os.path.exists(self._snapshot_path):
+            return None
+
+        with open(self._snapshot_path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+
+        if snapshot.get('format') != SNAPSHOT_FORMAT:
+            return None
+        # snapshots of older releases carry the whole text as well, nothing reads it any more
+        snapshot.pop('text', None)
+        return snapshot
+
+    def _rebuild_snapshot(self) -> dict:
+        snapshot = {
+            'format': SNAPSHOT_FORMAT,
+            'version': self._compute_version(),
+            'documents': len(self._manifest),
+        }
+        atomic_write(self._snapshot_path, json.dumps(snapshot).encode('utf-8'))
+        self._snapshot = snapshot
+        logger.info(f"Knowledge base snapshot {snapshot['version']} built from {snapshot['documents']} documents")
+        return snapshot
+
+    def _update_snapshot(self) -> None:
+        """
+        Rebuilds the snapshot after a change and queues the new version for the listeners.
+        """
+        self._events.append(('version', self._rebuild_snapshot()['version'], None))
+
+    def _compute_version(self) -> str:
+        digest = hashlib.sha256(f"format:{SNAPSHOT_FORMAT}\n".encode())
+        for name in sorted(self._manifest):
+            digest.update(f"{name}:{self._manifest[name].sha256}\n".encode())
+        return digest.hexdigest()[:16]
+
+    def _load_manifest(self) -> None:
+        if not os.path.exists(self._manifest_path):
+            return
+
+        with open(self._manifest_path, encoding='utf-8') as f:
+            raw = json.load(f)
+
+        for name, value in raw.items():
+            entry = DocumentEntry(**value)
+            # an entry without its text is useless, sync() will extract the file again
+            if os.path.exists(self._text_path(entry.sha256)):
+                self._manifest[name] = entry
+
+    def _save_manifest(self) -> None:
+        if self._batches:
+            self._manifest_outdated = True
+            return
+
+        self._manifest_outdated = False
+        raw = {name: asdict(entry) for name, entry in self._manifest.items()}
+        atomic_write(self._manifest_path, json.dumps(raw, ensure_ascii=False).encode('utf-8'))
+
+    def _text_path(self, sha256: str) -> str:
+        # texts of an older extraction format are not found, so their documents are extracted again
+        return os.path.join(self._texts_dir, f"{sha256}.v{SNAPSHOT_FORMAT}.txt")
+
+    def _read_text(self, sha256: str) -> str:
+        with open(self._text_path(sha256), encoding='utf-8') as f:
+            return f.read()
+
+    def _collect_garbage(self, sha256: str) -> None:
+        if any(entry.sha256 == sha256 for entry in self._manifest.values()):
+            return
+
+        text_path = self._text_path(sha256)
+        if os.path.exists(text_path):
+            os.remove(text_path)
+
+    def _deliver(self) -> None:
+        """
+        Hands the queued changes to the listeners. Called without holding `_lock`.
+        """
+        with self._delivery_lock:
+            self._deliver_pending()
+
+    def _deliver_pending(self) -> None:
+        while True:
+            with self._lock:
+                if not self._events:
+                    return
+                kind, name, text = self._events.popleft()
+                listeners = list(self._listeners)
+
+            for listener in listeners:
+                if kind == 'added':
+                    listener.document_added(name, text)
+                elif kind == 'removed':
+                    listener.document_removed(name)
+                else:
+                    listener.version_changed(name)
@@ -0,0 +1,109 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from app.bot.knowledge.chunking import Chunk
+
+_WORD_RE = re.compile(r'\w+')
+
+# Russian is heavily inflected, cutting words to a fixed prefix is a cheap stemmer
+# that lets "договора" match "договор" without a morphology dictionary
+STEM_LENGTH = 6
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase terms for the lexical index.
+    """
+    return [word[:STEM_LENGTH] for word in _WORD_RE.findall(text.lower()) if len(word) > 1]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index that is updated in place:
+    adding or removing a document touches only the postings of its own terms.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._chunks: Dict[int, Chunk] = {}
+        self._lengths: Dict[int, int] = {}
+        self._by_document: Dict[str, List[int]] = {}
+        self._total_length = 0
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def add_document(self, document: str, chunks: List[Chunk]) -> None:
+        """
+        Indexes the chunks of a document, replacing the previous version of it.
+        """
+        with self._lock:
+            self._remove(document)
+
+            ids = []
+            for chunk in chunks:
+                chunk_id = self._next_id
+                self._next_id += 1
+
+                terms = Counter(tokenize(chunk.text))
+                for term, frequency in terms.items():
+                    self._postings[term][chunk_id] = frequency
+
+                length = sum(terms.values())
+                self._chunks[chunk_id] = chunk
+                self._lengths[chunk_id] = length
+                self._total_length += length
+                ids.append(chunk_id)
+
+            self._by_document[document] = ids
+
+    def remove_document(self, document: str) -> None:
+        with self._lock:
+            self._remove(document)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[Chunk, float]]:
+        """
+        Returns up to top_k chunks that share at least one term with the query, best first.
+        """
+        terms = set(tokenize(query))
+
+        with self._lock:
+            count = len(self._chunks)
+            if count == 0 or not terms:
+                return []
+
+            average_length = self._total_length / count
+            scores: Dict[int, float] = defaultdict(float)
+
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                    scores[chunk_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(self._chunks[chunk_id], score) for chunk_id, score in best]
+
+    def _remove(self, document: str) -> None:
+        for chunk_id in self._by_document.pop(document, []):
+            chunk = self._chunks.pop(chunk_id)
+            self._total_length -= self._lengths.pop(chunk_id)
+
+            for term in set(tokenize(chunk.text)):
+                postings = self._postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
@@ -0,0 +1,65 @@
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from app.bot import logger
+from app.bot.config import RETRIEVAL_CHUNK_SIZE, RETRIEVAL_CHUNK_OVERLAP, RETRIEVAL_TOP_K, EMBEDDER, VECTOR_INDEX_DIR
+from app.bot.knowledge.chunking import Chunk, split_into_chunks
+from app.bot.knowledge.lexical_index import BM25Index
+from app.bot.knowledge.vector_index import VectorIndex
+from app.bot.utils.singleton import singleton
+
+# reciprocal rank fusion constant, dampens the advantage of the very first ranks
+RRF_K = 60
+
+
+@singleton
+class Retriever:
+    """
+    Selects the knowledge base passages relevant to a question.
+
+    Subscribed to the KnowledgeBase, so documents are chunked and indexed when they are uploaded
+    and dropped from the index when they are deleted. Lexical (BM25) and dense (vector index) results
+    are merged with reciprocal rank fusion; the dense part is skipped when EMBEDDER is "none".
+    """
+
+    def __init__(self, chunk_size: int = RETRIEVAL_CHUNK_SIZE, chunk_overlap: int = RETRIEVAL_CHUNK_OVERLAP,
+                 vector_index: Optional[VectorIndex] = None):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.lexical_index = BM25Index()
+        self.vector_index = vector_index
+
+        if self.vector_index is None and EMBEDDER != 'none':
+            from app.bot.knowledge.embedders import create_embedder
+            self.vector_index = VectorIndex(VECTOR_INDEX_DIR, create_embedder())
+
+    def document_added(self, name: str, text: str) -> None:
+        chunks = split_into_chunks(name, text, chunk_size=self.chunk_size, overlap=self.chunk_overlap)
+        self.lexical_index.add_document(name, chunks)
+        if self.vector_index is not None:
+            self.vector_index.add_document(name, text, chunks)
+        logger.debug(f"Indexed {len(chunks)} chunks of {name}")
+
+    def document_removed(self, name: str) -> None:
+        self.lexical_index.remove_document(name)
+        if self.vector_index is not None:
+            self.vector_index.remove_document(name)
+
+    def version_changed(self, version: str) -> None:
+        pass
+
+    def search(self, question: str, top_k: int = RETRIEVAL_TOP_K) -> List[Chunk]:
+        """
+        Ranks chunks by lexical and dense similarity. Blocking when dense retrieval is on.
+        The prompt takes as many of them as fit, see assemble_prompt.
+        """
+        rankings = [self.lexical_index.search(question, top_k)]
+        if self.vector_index is not None:
+            rankings.append(self.vector_index.search_text(question, top_k))
+
+        scores: Dict[Chunk, float] = defaultdict(float)
+        for ranking in rankings:
+            for rank, (chunk, _) in enumerate(ranking):
+                scores[chunk] += 1 / (RRF_K + rank + 1)
+
+        return sorted(scores, key=scores.get, reverse=True)[:top_k]
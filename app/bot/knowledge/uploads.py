@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.bot import logger
+from app.bot.config import UPLOADS_DIR, ARCHIVE_MAX_FILES, ARCHIVE_MAX_TOTAL_SIZE, INGESTION_MAX_FILE_SIZE
+from app.bot.database.models.document import DocumentRecord
+from app.bot.database.repository import get_repository
+from app.bot.knowledge.extractors import ExtractionError, get_extractor
+from app.bot.knowledge.ingestion import IngestionPool
+from app.bot.knowledge.knowledge_base import DocumentEntry, KnowledgeBase, hash_file
+from app.bot.utils.singleton import singleton
+
+_COPY_BLOCK_SIZE = 1 << 20
+
+
+def commit_upload(tmp_path: str, name: str, uploads_dir: str = UPLOADS_DIR) -> Optional[str]:
+    """
+    Moves a downloaded file into the uploads directory, unless a document with the same contents
+    is already in the knowledge base. Blocking, run it in an executor.
+
+    :param tmp_path: The downloaded file, in the uploads directory.
+    :param name: File name of the document.
+    :param uploads_dir: The uploads directory.
+    :return: Name of the document with the same contents, None if the file was moved into place.
+    """
+    duplicate = KnowledgeBase().document_hashes.get(hash_file(tmp_path))
+    if duplicate is not None:
+        os.remove(tmp_path)
+        return duplicate
+
+    os.replace(tmp_path, os.path.join(uploads_dir, name))
+    return None
+
+
+async def index_upload(file_path: str, user_id: int) -> Optional[DocumentEntry]:
+    """
+    Adds an uploaded file to the knowledge base and the document catalog.
+
+    :param file_path: The file, already in the uploads directory.
+    :param user_id: Telegram id of the admin who uploaded it.
+    :return: The manifest entry or None if the format is not supported.
+    :raises ExtractionError: The text could not be extracted. The file is deleted and,
+        if it replaced a previous version, that version is removed from the knowledge base too.
+    """
+    name = os.path.basename(file_path)
+    loop = asyncio.get_running_loop()
+    knowledge_base = KnowledgeBase()
+    try:
+        # parsing happens in the ingestion pool, the executor thread only waits for it
+        entry = await loop.run_in_executor(None, knowledge_base.add_document, file_path)
+    except ExtractionError:
+        os.remove(file_path)
+        if await loop.run_in_executor(None, knowledge_base.remove_document, name):
+            get_repository().remove_document(name)
+        raise
+
+    if entry is not None:
+        get_repository().save_document(DocumentRecord(
+            name=entry.name, sha256=entry.sha256, size=entry.size, uploaded_by=user_id,
+        ))
+    return entry
+
+
+@dataclass
+class ArchiveReport:
+    archive: str
+    added: List[str] = field(default_factory=list)
+    replaced: List[str] = field(default_factory=list)
+    # (name in the archive, name of the document with the same contents)
+    duplicates: List[Tuple[str, str]] = field(default_factory=list)
+    # (name, reason) of entries that were not unpacked or not indexed
+    skipped: List[Tuple[str, str]] = field(default_factory=list)
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def _entry_name(info: zipfile.ZipInfo) -> str:
+    name = info.filename
+    if not info.flag_bits & 0x800:
+        # without the UTF-8 flag the name is in the OEM code page of the archiver, cp866 on Russian Windows
+        try:
+            name = name.encode('cp437').decode('cp866')
+        except UnicodeError:
+            pass
+    # folders are flattened, which also rules out names like ../../app/bot/config.py (zip slip)
+    return name.replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def _stream_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo, directory: str, max_size: int) -> Tuple[str, str]:
+    """
+    Copies an entry into a temporary file, hashing it on the way.
+    Sizes in the archive headers can lie, so the limit is checked against the bytes actually unpacked.
+
+    :return: Path to the temporary file and the sha256 of its contents.
+    :raises ValueError: The entry is bigger than max_size.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as dst, archive.open(info) as src:
+            while block := src.read(_COPY_BLOCK_SIZE):
+                size += len(block)
+                if size > max_size:
+                    raise ValueError(f"больше {max_size // (1024 * 1024)} МБ")
+                digest.update(block)
+                dst.write(block)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+
+def unpack_archive(archive_path: str, report: ArchiveReport, uploads_dir: str = UPLOADS_DIR,
+                   max_files: int = ARCHIVE_MAX_FILES, max_total_size: int = ARCHIVE_MAX_TOTAL_SIZE,
+                   max_file_size: int = INGESTION_MAX_FILE_SIZE) -> List[str]:
+    """
+    Unpacks the supported documents of a ZIP archive into the uploads directory. Blocking, run it in an executor.
+
+    Entries are streamed to disk one by one and moved into place only when complete. An entry
+    whose contents are already in the knowledge base, or earlier in the same archive, is dropped.
+    The limits guard against zip bombs.
+
+    :param archive_path: The archive.
+    :param report: Receives the outcome of every entry.
+    :param uploads_dir: Destination directory.
+    :param max_files: Maximal number of documents taken from one archive.
+    :param max_total_size: Maximal number of bytes unpacked from one archive.
+    :param max_file_size: Maximal size of one document.
+    :return: Paths of the new and replaced documents.
+    """
+    known: Dict[str, str] = KnowledgeBase().document_hashes
+    unpacked: List[str] = []
+    names: Set[str] = set()
+    total_size = 0
+
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                continue
+
+            name = _entry_name(info)
+            if not name or name.startswith('.'):
+                continue
+            if get_extractor(name) is None:
+                report.skipped.append((name, "формат не поддерживается"))
+                continue
+            if info.flag_bits & 0x1:
+                report.skipped.append((name, "файл зашифрован"))
+                continue
+            if name in names:
+                report.skipped.append((name, "имя уже встречалось в архиве"))
+                continue
+            if len(unpacked) >= max_files:
+                report.skipped.append((name, f"в архиве больше {max_files} документов"))
+                continue
+            if total_size + info.file_size > max_total_size:
+                report.skipped.append((name, "превышен общий размер распакованных файлов"))
+                continue
+
+            try:
+                tmp_path, sha256 = _stream_entry(archive, info, uploads_dir, max_file_size)
+            except (ValueError, zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as e:
+                report.skipped.append((name, str(e)))
+                continue
+
+            names.add(name)
+            total_size += os.path.getsize(tmp_path)
+
+            if sha256 in known:
+                os.remove(tmp_path)
+                report.duplicates.append((name, known[sha256]))
+                continue
+
+            destination = os.path.join(uploads_dir, name)
+            (report.replaced if os.path.exists(destination) else report.added).append(name)
+            os.replace(tmp_path, destination)
+            known[sha256] = name
+            unpacked.append(destination)
+
+    return unpacked
+
+
+ReportCallback = Callable[[ArchiveReport], Awaitable[None]]
+
+
+@singleton
+class ArchiveImporter:
+    """
+    Imports ZIP archives of documents in the background: unpacks them, then indexes the new documents
+    concurrently, as many at a time as the ingestion pool has workers, in one knowledge base batch.
+    The admin gets one report per archive.
+    """
+
+    def __init__(self):
+        self._background: Set[asyncio.Task] = set()
+
+    def start(self, archive_path: str, archive_name: str, user_id: int, on_done: ReportCallback) -> None:
+        """
+        :param archive_path: The downloaded archive, deleted when the import is over.
+        :param archive_name: Name of the archive for the report.
+        :param user_id: Telegram id of the admin who uploaded it.
+        :param on_done: Receives the report.
+        """
+        task = asyncio.create_task(self._safe_run(archive_path, archive_name, user_id, on_done))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def run(self, archive_path: str, archive_name: str, user_id: int) -> ArchiveReport:
+        report = ArchiveReport(archive=archive_name)
+        loop = asyncio.get_running_loop()
+        try:
+            paths = await loop.run_in_executor(None, unpack_archive, archive_path, report)
+        except zipfile.BadZipFile as e:
+            report.error = f"архив поврежден: {e}"
+            return report
+        finally:
+            os.remove(archive_path)
+
+        semaphore = asyncio.Semaphore(IngestionPool().workers)
+
+        async def index(path: str) -> None:
+            async with semaphore:
+                try:
+                    await index_upload(path, user_id)
+                except ExtractionError as e:
+                    name = os.path.basename(path)
+                    report.failed.append((name, str(e)))
+                    for names in (report.added, report.replaced):
+                        if name in names:
+                            names.remove(name)
+
+        knowledge_base = KnowledgeBase()
+        # the manifest and the snapshot are written once for the archive, not once per document
+        knowledge_base.begin_batch()
+        try:
+            await asyncio.gather(*(index(path) for path in paths))
+        finally:
+            await loop.run_in_executor(None, knowledge_base.end_batch)
+        logger.info(f"Archive {archive_name}: {len(report.added)} added, {len(report.replaced)} replaced, "
+                    f"{len(report.duplicates)} duplicates, {len(report.skipped)} skipped, {len(report.failed)} failed")
+        return report
+
+    async def _safe_run(self, archive_path: str, archive_name: str, user_id: int, on_done: ReportCallback) -> None:
+        try:
+            report = await self.run(archive_path, archive_name, user_id)
+        except Exception as e:
+            logger.exception(f"Import of archive {archive_name} failed: {e}")
+            report = ArchiveReport(archive=archive_name, error=str(e))
+
+        try:
+            await on_done(report)
+        except Exception as e:
+            logger.warning(f"Archive report failed: {e}")
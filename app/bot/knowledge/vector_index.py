@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.bot import logger
+from app.bot.knowledge.chunking import Chunk
+from app.bot.knowledge.embedders import BaseEmbedder
+from app.bot.utils.utils import atomic_write
+
+# rows multiplied per search step, bounds the memory touched by one matmul
+SEARCH_BLOCK_ROWS = 16384
+INITIAL_CAPACITY = 1024
+
+
+def text_fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class VectorIndex:
+    """
+    Embedded vector store, no external service required.
+
+    Layout of the index directory:
+        header.json      - embedder name and dimension, a mismatch resets the index
+        embeddings.f32   - float32 matrix (capacity x dim), memory-mapped, only the OS page cache holds it
+        rows.jsonl       - append-only log: one record per row, plus tombstone records for deleted documents
+
+    Deleting a document only tombstones its rows, the file is compacted once dead rows outnumber live ones.
+    """
+
+    def __init__(self, directory: str, embedder: BaseEmbedder):
+        self.directory = directory
+        self.embedder = embedder
+        self.dim = embedder.dim
+
+        self._header_path = os.path.join(directory, 'header.json')
+        self._matrix_path = os.path.join(directory, 'embeddings.f32')
+        self._log_path = os.path.join(directory, 'rows.jsonl')
+
+        self._lock = threading.RLock()
+        self._chunks: List[Chunk] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._documents: Dict[str, Tuple[str, List[int]]] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._capacity = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def fingerprint(self, document: str) -> Optional[str]:
+        """
+        Fingerprint of the text the document was indexed from, None if it is not indexed.
+        """
+        with self._lock:
+            indexed = self._documents.get(document)
+        return indexed[0] if indexed else None
+
+    def add_document(self, document: str, text: str, chunks: List[Chunk]) -> None:
+        """
+        Embeds and appends the chunks of a document. Documents that are already indexed with
+        the same text are skipped, so replaying the knowledge base on startup costs nothing.
+        """
+        fingerprint = text_fingerprint(text)
+        if self.fingerprint(document) == fingerprint:
+            return
+
+        vectors = self.embedder.embed([chunk.text for chunk in chunks]) if chunks else np.zeros((0, self.dim), np.float32)
+
+        with self._lock:
+            self._tombstone(document)
+
+            start = len(self._chunks)
+            self._ensure_capacity(start + len(chunks))
+            self._matrix[start:start + len(chunks)] = vectors
+            self._matrix.flush()
+
+            self._chunks.extend(chunks)
+            self._alive = np.concatenate([self._alive, np.ones(len(chunks), dtype=bool)])
+            self._documents[document] = (fingerprint, list(range(start, start + len(chunks))))
+
+            self._append_log([
+                {'row': start + offset, 'document': document, 'index': chunk.index, 'text': chunk.text,
+                 'fingerprint': fingerprint}
+                for offset, chunk in enumerate(chunks)
+            ] or [{'empty': document, 'fingerprint': fingerprint}])
+
+        logger.debug(f"Embedded {len(chunks)} chunks of {document}")
+
+    def remove_document(self, document: str) -> None:
+        with self._lock:
+            if self._tombstone(document):
+                self._maybe_compact()
+
+    def search(self, queries: np.ndarray, top_k: int) -> List[List[Tuple[Chunk, float]]]:
+        """
+        Batched top-k cosine search. The matrix is scanned in blocks, so only one block
+        of embeddings has to be resident at a time.
+
+        :param queries: Unit-length query vectors, shape (m, dim).
+        :param top_k: Number of results per query.
+        :return: For every query, (chunk, similarity) pairs best first.
+        """
+        queries = np.atleast_2d(queries).astype(np.float32, copy=False)
+
+        with self._lock:
+            count = len(self._chunks)
+            best_scores = np.full((queries.shape[0], 0), -np.inf, dtype=np.float32)
+            best_rows = np.zeros((queries.shape[0], 0), dtype=np.int64)
+
+            for start in range(0, count, SEARCH_BLOCK_ROWS):
+                end = min(start + SEARCH_BLOCK_ROWS, count)
+                scores = queries @ np.asarray(self._matrix[start:end]).T
+                scores[:, ~self._alive[start:end]] = -np.inf
+
+                rows = np.broadcast_to(np.arange(start, end), scores.shape)
+                best_scores = np.concatenate([best_scores, scores], axis=1)
+                best_rows = np.concatenate([best_rows, rows], axis=1)
+
+                if best_scores.shape[1] > top_k:
+                    keep = np.argpartition(-best_scores, top_k, axis=1)[:, :top_k]
+                    best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                    best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+            results = []
+            for scores, rows in zip(best_scores, best_rows):
+                order = np.argsort(-scores)
+                results.append([
+                    (self._chunks[rows[i]], float(scores[i])) for i in order if np.isfinite(scores[i])
+                ])
+            return results
+
+    def search_text(self, query: str, top_k: int) -> List[Tuple[Chunk, float]]:
+        return self.search(self.embedder.embed([query]), top_k)[0]
+
+    def _open(self) -> None:
+        header = {'embedder': self.embedder.name, 'dim': self.dim}
+
+        if os.path.exists(self._header_path):
+            with open(self._header_path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored != header:
+                logger.info(f"Vector index was built with {stored}, rebuilding for {header}")
+                self._reset()
+        atomic_write(self._header_path, json.dumps(header).encode('utf-8'))
+
+        self._replay_log()
+        self._capacity = max(INITIAL_CAPACITY, len(self._chunks))
+        self._map(self._capacity)
+
+    def _reset(self) -> None:
+        for path in (self._matrix_path, self._log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _replay_log(self) -> None:
+        if not os.path.exists(self._log_path):
+            return
+
+        alive = []
+        with open(self._log_path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if 'deleted' in record:
+                    self._tombstone(record['deleted'], log=False, alive=alive)
+                elif 'empty' in record:
+                    self._documents[record['empty']] = (record['fingerprint'], [])
+                else:
+                    document = record['document']
+                    self._chunks.append(Chunk(document=document, index=record['index'], text=record['text']))
+                    alive.append(True)
+                    self._documents.setdefault(document, (record['fingerprint'], []))[1].append(record['row'])
+
+        self._alive = np.array(alive, dtype=bool)
+
+    def _map(self, capacity: int) -> None:
+        size = capacity * self.dim * np.dtype(np.float32).itemsize
+        with open(self._matrix_path, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._capacity:
+            return
+
+        while self._capacity < rows:
+            self._capacity *= 2
+        self._matrix.flush()
+        self._matrix = None
+        self._map(self._capacity)
+
+    def _tombstone(self, document: str, log: bool = True, alive: Optional[list] = None) -> bool:
+        indexed = self._documents.pop(document, None)
+        if indexed is None:
+            return False
+
+        mask = self._alive if alive is None else alive
+        for row in indexed[1]:
+            mask[row] = False
+
+        if log:
+            self._append_log([{'deleted': document}])
+        return True
+
+    def _append_log(self, records: List[dict]) -> None:
+        with open(self._log_path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _maybe_compact(self) -> None:
+        dead = int((~self._alive).sum())
+        if dead < INITIAL_CAPACITY or dead < int(self._alive.sum()):
+            return
+
+        logger.info(f"Compacting vector index, dropping {dead} deleted rows")
+        live_rows = np.flatnonzero(self._alive)
+        vectors = np.array(self._matrix[live_rows])
+        chunks = [self._chunks[row] for row in live_rows]
+        fingerprints = {document: fingerprint for document, (fingerprint, _) in self._documents.items()}
+
+        self._matrix = None
+        self._reset()
+        self._chunks, self._documents = [], {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._capacity = max(INITIAL_CAPACITY, len(chunks))
+        self._map(self._capacity)
+
+        self._matrix[:len(chunks)] = vectors
+        self._matrix.flush()
+        self._chunks = chunks
+        self._alive = np.ones(len(chunks), dtype=bool)
+
+        records = []
+        for row, chunk in enumerate(chunks):
+            fingerprint = fingerprints[chunk.document]
+            self._documents.setdefault(chunk.document, (fingerprint, []))[1].append(row)
+            records.append({'row': row, 'document': chunk.document, 'index': chunk.index, 'text': chunk.text,
+                            'fingerprint': fingerprint})
+        for document, fingerprint in fingerprints.items():
+            if document not in self._documents:
+                self._documents[document] = (fingerprint, [])
+                records.append({'empty': document, 'fingerprint': fingerprint})
+        self._append_log(records)
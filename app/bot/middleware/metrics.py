@@ -0,0 +1,24 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.bot.utils.metrics import handler_duration
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Records the latency of every handler into the handler_duration_seconds histogram.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+
+        started = time.monotonic()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_duration.observe(time.monotonic() - started, handler=name)
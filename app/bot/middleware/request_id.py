@@ -0,0 +1,21 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.bot.utils.logs import request_id
+
+
+class RequestIdMiddleware(BaseMiddleware):
+    """
+    Tags the log records of an update with its update_id, including those of the tasks its handlers start.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        update = event if isinstance(event, Update) else data.get("event_update")
+        token = request_id.set(str(update.update_id) if update is not None else None)
+        try:
+            return await handler(event, data)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import tempfile
+
+import numpy as np
+
+from app.bot.config import FFMPEG_BINARY
+
+SAMPLE_RATE = 16000
+
+
+class AudioDecodeError(Exception):
+    """
+    ffmpeg could not decode the file.
+    """
+
+
+async def _run_ffmpeg(source: str, data: bytes = b"") -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG_BINARY, "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", source, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+        stdin=asyncio.subprocess.PIPE if data else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(data or None)
+    if process.returncode != 0:
+        raise AudioDecodeError(stderr.decode('utf-8', errors='replace').strip() or f"ffmpeg exited with {process.returncode}")
+    return stdout
+
+
+async def decode_audio(data: bytes) -> np.ndarray:
+    """
+    Decodes an audio file into 16 kHz mono float32 samples, the input format of Whisper.
+
+    The file is piped through ffmpeg in memory. Containers that need a seekable input
+    (an MP4/M4A with the index at the end) are retried from a temporary file.
+
+    :param data: Contents of the file, e.g. an OGG/Opus voice message.
+    :return: Samples in [-1, 1].
+    :raises AudioDecodeError: The file is not audio or ffmpeg is missing.
+    """
+    try:
+        pcm = await _run_ffmpeg("pipe:0", data)
+    except FileNotFoundError:
+        raise AudioDecodeError(f"{FFMPEG_BINARY} is not installed") from None
+    except AudioDecodeError:
+        fd, tmp_path = tempfile.mkstemp(prefix="audio-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            pcm = await _run_ffmpeg(tmp_path)
+        finally:
+            os.remove(tmp_path)
+
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
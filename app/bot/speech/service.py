@@ -0,0 +1,155 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+
+from app.bot import logger
+from app.bot.config import (TRANSCRIBER, TRANSCRIPTION_WORKERS, TRANSCRIPTION_MAX_QUEUE, TRANSCRIPTION_BATCH_SIZE,
+                            TRANSCRIPTION_BATCH_WINDOW)
+from app.bot.speech.transcribers import BaseTranscriber, create_transcriber
+from app.bot.utils.metrics import transcription_batch_size, transcription_duration
+from app.bot.utils.singleton import singleton
+
+
+class TranscriptionQueueFullError(Exception):
+    """
+    Too many voice questions are waiting for transcription.
+    """
+
+
+@dataclass
+class _Job:
+    clip: np.ndarray
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+@singleton
+class TranscriptionService:
+    """
+    Transcribes voice questions in a dedicated pool of worker threads.
+
+    Every worker loads its own copy of the model in the background at startup: Whisper is not safe for
+    concurrent transcribe calls, so a worker is a model, and more workers take more (GPU) memory. Clips wait
+    in a bounded queue. A worker takes the first waiting clip together with whatever arrives within
+    `batch_window`, up to `batch_size` clips, and transcribes them as one batch. On a GPU that costs
+    little more than a single clip. When the queue is full a question is rejected right away
+    instead of waiting for minutes.
+    """
+
+    def __init__(self, kind: str = TRANSCRIBER, workers: int = TRANSCRIPTION_WORKERS,
+                 max_queue: int = TRANSCRIPTION_MAX_QUEUE, batch_size: int = TRANSCRIPTION_BATCH_SIZE,
+                 batch_window: float = TRANSCRIPTION_BATCH_WINDOW):
+        """
+        Args:
+            kind (str): Transcriber, see create_transcriber.
+            workers (int): Batches transcribed at the same time, each worker with a model of its own.
+            max_queue (int): Clips that may wait for a worker.
+            batch_size (int): Largest batch.
+            batch_window (float): Seconds a worker waits for more clips after the first one.
+        """
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # one loading or loaded transcriber per worker
+        self._transcribers: List[asyncio.Future] = []
+        self._tasks: List[asyncio.Task] = []
+        # set when the model could not be loaded, voice questions are then turned away like with "none"
+        self._failed = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.kind != 'none' and not self._failed
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcriber")
+        # the bot answers text questions while the models are loading
+        self._transcribers = [loop.run_in_executor(self._executor, self._load) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._work(transcriber)) for transcriber in self._transcribers]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._queue.get_nowait().future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def transcribe(self, clip: np.ndarray) -> str:
+        """
+        :param clip: 16 kHz mono float32 samples.
+        :return: The transcript.
+        :raises TranscriptionQueueFullError: Too many clips are waiting.
+        """
+        if self._queue is None:
+            raise RuntimeError("Transcription service is not running")
+
+        job = _Job(clip, asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise TranscriptionQueueFullError(f"{self.max_queue} voice questions are already waiting") from None
+        return await job.future
+
+    def _load(self) -> BaseTranscriber:
+        started = time.monotonic()
+        try:
+            transcriber = create_transcriber(self.kind)
+        except Exception as e:
+            self._failed = True
+            logger.exception(f"Failed to load the transcriber, voice questions are turned off: {e}")
+            raise
+        logger.info(f"Transcriber {transcriber.name} loaded in {time.monotonic() - started:.1f} s")
+        return transcriber
+
+    async def _work(self, loading: asyncio.Future) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            if self.batch_size > 1:
+                await asyncio.sleep(self.batch_window)
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+            # the question may have been abandoned meanwhile, e.g. on shutdown
+            batch = [job for job in batch if not job.future.done()]
+            if not batch:
+                continue
+
+            try:
+                transcriber = await loading
+                transcripts = await loop.run_in_executor(
+                    self._executor, transcriber.transcribe, [job.clip for job in batch]
+                )
+            except Exception as e:
+                logger.warning(f"Transcription of {len(batch)} clips failed: {e}")
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                continue
+
+            transcription_batch_size.observe(len(batch))
+            finished_at = time.monotonic()
+            for job, transcript in zip(batch, transcripts):
+                transcription_duration.observe(finished_at - job.queued_at)
+                if not job.future.done():
+                    job.future.set_result(transcript)
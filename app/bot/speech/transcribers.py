@@ -0,0 +1,99 @@
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+from app.bot.config import TRANSCRIBER, WHISPER_MODEL, TRANSCRIPTION_LANGUAGE
+
+
+class BaseTranscriber(ABC):
+    """
+    Turns speech into text. Called from the worker threads of the transcription service only.
+    """
+
+    name: str
+
+    @abstractmethod
+    def transcribe(self, clips: List[np.ndarray]) -> List[str]:
+        """
+        Transcribes a batch of clips.
+
+        Args:
+            clips (List[np.ndarray]): 16 kHz mono float32 samples.
+
+        Returns:
+            List[str]: One transcript per clip.
+        """
+
+
+class StubTranscriber(BaseTranscriber):
+    """
+    Returns a fixed transcript. Needs no model weights, used in tests and on machines without a GPU.
+    """
+
+    name = "stub"
+
+    def __init__(self, text: str = "Как оформить отпуск?"):
+        self.text = text
+
+    def transcribe(self, clips: List[np.ndarray]) -> List[str]:
+        return [self.text if len(clip) else "" for clip in clips]
+
+
+class WhisperTranscriber(BaseTranscriber):
+    """
+    Speech recognition with openai-whisper.
+
+    Clips of up to 30 seconds (Whisper's window, most voice questions) are decoded together as
+    one batch of mel spectrograms, longer ones are transcribed one by one with the sliding window.
+    """
+
+    def __init__(self, model_name: str = WHISPER_MODEL, language: str = TRANSCRIPTION_LANGUAGE,
+                 device: Optional[str] = None):
+        import torch
+        import whisper
+
+        self.name = f"whisper-{model_name}"
+        self.language = language
+        self._torch = torch
+        self._whisper = whisper
+        self._model = whisper.load_model(model_name, device=device)
+        # fp16 is only supported on the GPU
+        self._fp16 = self._model.device.type == 'cuda'
+
+    def transcribe(self, clips: List[np.ndarray]) -> List[str]:
+        whisper = self._whisper
+        transcripts: List[Optional[str]] = [None] * len(clips)
+
+        short = [index for index, clip in enumerate(clips) if len(clip) <= whisper.audio.N_SAMPLES]
+        if short:
+            mels = self._torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(clips[index]), n_mels=self._model.dims.n_mels)
+                for index in short
+            ]).to(self._model.device)
+            options = whisper.DecodingOptions(language=self.language, fp16=self._fp16, without_timestamps=True)
+            for index, result in zip(short, whisper.decode(self._model, mels, options)):
+                transcripts[index] = result.text.strip()
+
+        for index, clip in enumerate(clips):
+            if transcripts[index] is None:
+                result = self._model.transcribe(clip, language=self.language, fp16=self._fp16)
+                transcripts[index] = result['text'].strip()
+
+        return transcripts
+
+
+def create_transcriber(kind: str = TRANSCRIBER) -> Optional[BaseTranscriber]:
+    """
+    Builds the transcriber selected in the config.
+
+    :param kind: "whisper", "stub" or "none".
+    :return: The transcriber, None if voice questions are turned off.
+    """
+    if kind == 'whisper':
+        return WhisperTranscriber()
+    if kind == 'stub':
+        return StubTranscriber()
+    if kind == 'none':
+        return None
+    raise ValueError(f"Unknown transcriber: {kind}")
@@ -0,0 +1,194 @@
+import asyncio
+import time
+from typing import Awaitable, Tuple
+
+from aiogram import Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from app.bot import logger
+from app.bot.api.http_client import HttpClient
+from app.bot.api.ollama.context_window import ContextWindow
+from app.bot.api.ollama.pool import OllamaPool
+from app.bot.api.ollama.warmup import ModelWarmer
+from app.bot.config import (METRICS_HOST, METRICS_PORT, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+                            WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS, STARTUP_WARMUP_TIMEOUT)
+from app.bot.database.repository import get_repository
+from app.bot.middleware.metrics import MetricsMiddleware
+from app.bot.middleware.request_id import RequestIdMiddleware
+from app.bot.utils.singleton import singleton
+
+from app.bot.handlers.staff import router as staff_router
+from app.bot.handlers.general import router as general_router
+from app.bot.handlers.feedback import router as feedback_router
+from app.bot.knowledge.catalog import Catalog
+from app.bot.knowledge.faq_matcher import FaqMatcher
+from app.bot.knowledge.ingestion import IngestionPool
+from app.bot.knowledge.knowledge_base import KnowledgeBase
+from app.bot.knowledge.retrieval import Retriever
+from app.bot.speech.service import TranscriptionService
+from app.bot.utils.answer_cache import AnswerCache
+from app.bot.utils.metrics import MetricsServer, startup_phase_duration
+
+
+@singleton
+class Startup:
+    _dp = Dispatcher()
+    _metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
+
+    async def start_polling(self):
+        from app.bot import bot
+        # polling and a webhook are mutually exclusive, a webhook left by an earlier run would block getUpdates
+        await bot.delete_webhook()
+        await self._dp.start_polling(bot)
+
+    def webhook_app(self) -> web.Application:
+        """
+        The aiohttp application that receives the updates Telegram pushes to WEBHOOK_URL + WEBHOOK_PATH.
+        The webhook is registered once the caches are warm and removed on shutdown.
+        """
+        from app.bot import bot
+
+        self._dp.startup.register(self.set_webhook)
+        self._dp.shutdown.register(self.delete_webhook)
+
+        app = web.Application()
+        # shutdown hooks run in this order: the dispatcher (deletes the webhook) first, then the bot session is closed
+        setup_application(app, self._dp, bot=bot)
+        SimpleRequestHandler(
+            dispatcher=self._dp, bot=bot, secret_token=WEBHOOK_SECRET or None,
+        ).register(app, path=WEBHOOK_PATH)
+        return app
+
+    def start_webhook(self):
+        """
+        Serves the webhook on WEBHOOK_HOST:WEBHOOK_PORT. Blocks until SIGINT/SIGTERM.
+
+        The bot runs as a single process: the FSM state of the users, the indexes, the caches and the
+        LLM concurrency limits live in its memory, so a second process would not share them.
+        """
+        app = self.webhook_app()
+        logger.info(f"Webhook listens on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, print=None)
+
+    async def set_webhook(self, bot):
+        if not WEBHOOK_URL:
+            raise RuntimeError("WEBHOOK_URL must be set in webhook mode")
+
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=self._dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info(f"Webhook is set to {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+
+    @staticmethod
+    async def delete_webhook(bot):
+        # updates that arrive until the next start stay queued on the Telegram side
+        await bot.delete_webhook()
+        logger.info("Webhook is deleted")
+
+    async def on_startup(self):
+        """
+        Warms everything the first requests would otherwise wait for before polling (or the webhook) starts:
+        the knowledge base snapshot and the retrieval index, the FAQ index, the speech model and the LLM.
+        The phases run concurrently, their durations go to the log and to startup_phase_seconds.
+        """
+        started = time.perf_counter()
+        if METRICS_PORT:
+            # served from the beginning, so a rolling restart can poll /ready
+            await self._metrics_server.start()
+        await HttpClient().start()
+        await get_repository().start()
+
+        durations = dict(await asyncio.gather(
+            self._timed("knowledge_base", self.prepare_knowledge_base()),
+            self._timed("faq", self.prepare_faq()),
+            self._timed("transcription", TranscriptionService().start()),
+            self._timed("model", self.warm_up_model()),
+        ))
+        durations["total"] = time.perf_counter() - started
+        startup_phase_duration.set(durations["total"], phase="total")
+
+        self._metrics_server.set_ready(True)
+        logger.info("Ready in " + ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in durations.items()))
+
+    async def on_shutdown(self):
+        self._metrics_server.set_ready(False)
+        # flushes the queued writes
+        await get_repository().close()
+        await TranscriptionService().close()
+        await OllamaPool().close()
+        await HttpClient().close()
+        await self._metrics_server.close()
+        IngestionPool().close()
+
+    @staticmethod
+    async def _timed(phase: str, awaitable: Awaitable) -> Tuple[str, float]:
+        started = time.perf_counter()
+        await awaitable
+        duration = time.perf_counter() - started
+        startup_phase_duration.set(duration, phase=phase)
+        return phase, duration
+
+    @staticmethod
+    async def prepare_faq():
+        faq = await get_repository().get_faq()
+        Catalog().set_faq(faq)
+        await asyncio.get_running_loop().run_in_executor(None, FaqMatcher().warm_up, faq)
+
+    @staticmethod
+    async def warm_up_model(timeout: float = STARTUP_WARMUP_TIMEOUT):
+        """
+        Loads the support models and primes their system prompt, waiting at most `timeout` seconds.
+        Ollama may still be starting, so a slow warm-up goes on in the background and does not hold the bot back.
+        """
+        await OllamaPool().start()
+        # prompts are counted with it from the first request on, and the warm-up counts its system prompt
+        await asyncio.get_running_loop().run_in_executor(None, ContextWindow().load_tokenizer)
+        if timeout <= 0:
+            for model in ModelWarmer().models:
+                ModelWarmer().schedule(model=model)
+            return
+
+        try:
+            # the warm-up itself is shielded, a timeout only stops waiting for it
+            await asyncio.wait_for(ModelWarmer().warm_up_all(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Model warm-up takes longer than {timeout:.0f} s, it goes on in the background")
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+
+    @staticmethod
+    async def prepare_knowledge_base():
+        """
+        Brings the extraction cache in line with the uploads directory before the first request,
+        builds the retrieval index and the document list from it and drops cached answers of older
+        knowledge base versions.
+        """
+        loop = asyncio.get_running_loop()
+        knowledge_base = KnowledgeBase()
+        await loop.run_in_executor(None, knowledge_base.sync)
+
+        catalog = Catalog()
+        catalog.set_documents(knowledge_base.documents)
+        knowledge_base.add_listener(catalog, replay=False)
+        await loop.run_in_executor(None, knowledge_base.add_listener, Retriever())
+
+        answer_cache = AnswerCache()
+        await loop.run_in_executor(None, answer_cache.invalidate, knowledge_base.version)
+        knowledge_base.add_listener(answer_cache, replay=False)
+
+
+    def register_routes(self):
+        self._dp.include_routers(*[general_router, staff_router, feedback_router])
+
+    def register_middlewares(self):
+        self._dp.update.outer_middleware(RequestIdMiddleware())
+        self._dp.message.middleware(MetricsMiddleware())
+        self._dp.callback_query.middleware(MetricsMiddleware())
+
+    def register_lifecycle(self):
+        self._dp.startup.register(self.on_startup)
+        self._dp.shutdown.register(self.on_shutdown)
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from app.bot import logger
+from app.bot.config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_PATH
+from app.bot.utils.metrics import cache_requests
+from app.bot.utils.singleton import singleton
+from app.bot.utils.utils import clean_text
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+
+def normalize_question(question: str) -> str:
+    """
+    Brings a question to the form used as the cache key: lowercase, no punctuation, single spaces.
+    """
+    text = _PUNCTUATION_RE.sub(' ', clean_text(question).lower())
+    return ' '.join(text.split())
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    kb_version: str
+    created_at: float
+
+
+@singleton
+class AnswerCache:
+    """
+    LRU cache of generated answers with a TTL.
+
+    Entries are keyed by the normalized question, the model and the knowledge base version,
+    so an answer is never served for a knowledge base it was not generated from. An optional
+    SQLite tier keeps entries across restarts. Subscribed to the KnowledgeBase to drop entries
+    of outdated versions.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 path: Optional[str] = ANSWER_CACHE_PATH):
+        """
+        Args:
+            max_entries (int): How many answers are kept in memory.
+            ttl (float): Seconds an answer stays valid.
+            path (str, optional): SQLite file of the disk tier, empty to keep the cache in memory only.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS answers '
+                '(key TEXT PRIMARY KEY, answer TEXT NOT NULL, kb_version TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(question: str, model: str, kb_version: str) -> str:
+        raw = f"{model}\0{kb_version}\0{normalize_question(question)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, question: str, model: str, kb_version: str) -> Optional[str]:
+        """
+        Returns the cached answer or None.
+        """
+        key = self.make_key(question, model, kb_version)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    'SELECT answer, kb_version, created_at FROM answers WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = CachedAnswer(*row)
+                    self._remember(key, entry)
+
+            if entry is None or now - entry.created_at > self.ttl:
+                if entry is not None:
+                    self._forget(key)
+                self.misses += 1
+                cache_requests.inc(cache="answer", result="miss")
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            cache_requests.inc(cache="answer", result="hit")
+            return entry.answer
+
+    def put(self, question: str, model: str, kb_version: str, answer: str) -> None:
+        key = self.make_key(question, model, kb_version)
+        entry = CachedAnswer(answer=answer, kb_version=kb_version, created_at=time.time())
+
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO answers (key, answer, kb_version, created_at) VALUES (?, ?, ?, ?)',
+                    (key, entry.answer, entry.kb_version, entry.created_at),
+                )
+                self._db.commit()
+
+    def invalidate(self, kb_version: str) -> None:
+        """
+        Drops every entry that was not generated from the given knowledge base version, and expired ones.
+        """
+        expired_before = time.time() - self.ttl
+
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry.kb_version != kb_version or entry.created_at < expired_before
+            ]
+            for key in stale:
+                del self._entries[key]
+
+            if self._db is not None:
+                cursor = self._db.execute(
+                    'DELETE FROM answers WHERE kb_version != ? OR created_at < ?', (kb_version, expired_before)
+                )
+                self._db.commit()
+                if cursor.rowcount or stale:
+                    logger.info(f"Answer cache: dropped {max(cursor.rowcount, len(stale))} outdated answers")
+
+    def document_added(self, name: str, text: str) -> None:
+        pass
+
+    def document_removed(self, name: str) -> None:
+        pass
+
+    def version_changed(self, version: str) -> None:
+        self.invalidate(version)
+
+    def _remember(self, key: str, entry: CachedAnswer) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _forget(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute('DELETE FROM answers WHERE key = ?', (key,))
+            self._db.commit()
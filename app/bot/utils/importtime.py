@@ -0,0 +1,80 @@
+import argparse
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, NamedTuple
+
+# packages requirements.txt pulls in that the bot only imports when they are used
+DEFERRED = ("sklearn", "scipy", "whisper", "torch", "FlagEmbedding", "transformers", "qdrant_client", "motor",
+            "beanie", "docx")
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def measure(module: str = "app.bot.startup") -> List[ImportTime]:
+    """
+    Imports the module in a fresh interpreter with `-X importtime`.
+
+    :param module: The module to import.
+    :return: Every module the import loaded, in the order of the report (a module follows its imports).
+    :raises RuntimeError: The import failed.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True)
+    if completed.returncode:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    times = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            times.append(ImportTime(match[3], int(match[1]), int(match[2])))
+    return times
+
+
+def by_package(times: List[ImportTime]) -> Dict[str, int]:
+    """
+    :return: Own import time of every top-level package in microseconds, the longest first.
+    """
+    totals: Dict[str, int] = defaultdict(int)
+    for entry in times:
+        totals[entry.module.split('.')[0]] += entry.self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def report(module: str = "app.bot.startup", top: int = 15) -> str:
+    """
+    A breakdown of the cold import of the module by package, like `python -X importtime` summed up.
+    """
+    times = measure(module)
+    total = sum(entry.self_us for entry in times)
+    packages = by_package(times)
+
+    lines = [f"import {module}: {total / 1e6:.2f} s, {len(times)} modules",
+             f"{'package':<30}{'seconds':>10}{'share':>8}"]
+    for package, microseconds in list(packages.items())[:top]:
+        lines.append(f"{package:<30}{microseconds / 1e6:>10.3f}{microseconds / total:>8.1%}")
+
+    loaded = [package for package in DEFERRED if package in packages]
+    if loaded:
+        lines.append(f"Imported eagerly, expected on first use: {', '.join(loaded)}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Where the import time of the bot goes.")
+    parser.add_argument("module", nargs="?", default="app.bot.startup")
+    parser.add_argument("--top", type=int, default=15, help="number of packages to list")
+    args = parser.parse_args()
+    print(report(args.module, args.top))
+
+
+if __name__ == "__main__":
+    main()
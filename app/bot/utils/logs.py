@@ -0,0 +1,223 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+from app.bot.config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_MAX_MESSAGE, LOG_SAMPLE_RATE, LOG_QUEUE_SIZE
+
+TEXT_FORMAT = "%(filename)s:%(lineno)d #%(levelname)-8s [%(asctime)s] - %(name)s%(request_tag)s - %(message)s"
+
+# id of the update being handled, set by RequestIdMiddleware and inherited by the tasks it starts
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# the directory that contains the app package, records of our modules are named by their path from here
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["BoundedQueueHandler"] = None
+
+
+def parse_levels(rules: List[str]) -> Dict[str, int]:
+    """
+    :param rules: "name=LEVEL" pairs, the name is a module (app.bot.handlers.general), a package or a logger.
+    :return: Level by name.
+    :raises ValueError: A rule is malformed or names an unknown level.
+    """
+    levels = {}
+    for rule in rules:
+        name, separator, level = rule.partition('=')
+        if not separator or not name.strip():
+            raise ValueError(f"Log level rule {rule!r} is not name=LEVEL")
+        levels[name.strip()] = _level(level)
+    return levels
+
+
+def _level(name: str) -> int:
+    level = logging.getLevelName(name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+
+@lru_cache(maxsize=1024)
+def _module_name(pathname: str) -> Optional[str]:
+    path = os.path.relpath(pathname, _ROOT)
+    if path.startswith('..') or not path.endswith('.py'):
+        return None
+    return path[:-3].replace(os.sep, '.').removesuffix('.__init__')
+
+
+class LevelFilter(logging.Filter):
+    """
+    Per-module levels. All modules of the bot log through the app.bot logger, so a record of ours is
+    matched by the module it comes from; records of libraries are matched by their logger name.
+    The longest matching name wins, LOG_LEVEL applies to everything else.
+    """
+
+    def __init__(self, default: int, levels: Dict[str, int]):
+        super().__init__()
+        self.default = default
+        self.levels = levels
+
+    def level_of(self, name: str) -> int:
+        while name:
+            if name in self.levels:
+                return self.levels[name]
+            name = name.rpartition('.')[0]
+        return self.default
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.levels:
+            return record.levelno >= self.default
+        name = record.name
+        if name.split('.')[0] == 'app':
+            name = _module_name(record.pathname) or name
+        return record.levelno >= self.level_of(name)
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamps records with the request id while they are still in the task that logged them.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hands records over to the writer thread, so logging never waits for the terminal or the disk.
+
+    The message is formatted here, in the thread that logged it: arguments may change later.
+    Messages over `max_message` characters are cut, except for a `sample_rate` share of them, which are kept
+    whole for diagnostics. When the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_message: int = LOG_MAX_MESSAGE,
+                 sample_rate: float = LOG_SAMPLE_RATE):
+        super().__init__(log_queue)
+        self.max_message = max_message
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self.truncated = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if 0 < self.max_message < len(message) and random.random() >= self.sample_rate:
+            message = f"{message[:self.max_message]}… [{len(message) - self.max_message} more characters]"
+            self.truncated += 1
+
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = message
+        record.message = message
+        # tracebacks and arguments may not be picklable or may hold large objects alive
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        rid = getattr(record, 'request_id', None)
+        record.request_tag = f" [{rid}]" if rid else ""
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log collectors.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': _module_name(record.pathname) or record.module,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        rid = getattr(record, 'request_id', None)
+        if rid:
+            entry['request_id'] = rid
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level: str = LOG_LEVEL, rules: List[str] = LOG_LEVELS, fmt: str = LOG_FORMAT,
+                      stream=None) -> None:
+    """
+    Routes every record through a bounded queue to a writer thread.
+
+    :param level: Level of everything that is not named in `rules`.
+    :param rules: "name=LEVEL" overrides, see `parse_levels`.
+    :param fmt: "text" or "json".
+    :param stream: Where the writer thread writes, stderr by default.
+    """
+    global _listener, _handler
+
+    default = _level(level)
+    levels = parse_levels(rules)
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter(TEXT_FORMAT))
+
+    _handler = BoundedQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(LevelFilter(default, levels))
+    _handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    # the loggers let through the most verbose level asked for anywhere, the filter does the rest
+    root.setLevel(min([default, *levels.values()]))
+    for name, name_level in levels.items():
+        if name.split('.')[0] != 'app':
+            logging.getLogger(name).setLevel(name_level)
+
+    _listener = QueueListener(_handler.queue, output)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Writes out the queued records and stops the writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def truncated_records() -> int:
+    return _handler.truncated if _handler is not None else 0
+
+
+atexit.register(stop_logging)
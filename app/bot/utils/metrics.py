@@ -0,0 +1,266 @@
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from aiohttp import web
+
+from app.bot import logger
+from app.bot.utils.logs import dropped_records, truncated_records
+
+LabelValues = Tuple[str, ...]
+MetricT = TypeVar('MetricT', bound='_Metric')
+
+# seconds, from a cached answer up to a long generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 100, 150)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Metric whose samples are read from the owning component on every scrape.
+    """
+
+    def __init__(self, name: str, documentation: str, type_name: str,
+                 callback: Callable[[], Dict[LabelValues, float]], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.type_name = type_name
+        self.callback = callback
+
+    def _samples(self) -> List[str]:
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.debug(f"Metric {self.name} callback failed: {e}")
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: MetricT) -> MetricT:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+llm_time_to_first_token = registry.register(Histogram(
+    "llm_time_to_first_token_seconds", "Time from sending a generation to its first token.", ["model"]))
+llm_generation_duration = registry.register(Histogram(
+    "llm_generation_duration_seconds", "Wall time of a whole generation.", ["model"]))
+llm_tokens_per_second = registry.register(Histogram(
+    "llm_tokens_per_second", "Decoding speed reported by Ollama (eval_count / eval_duration).", ["model"],
+    buckets=RATE_BUCKETS))
+llm_prompt_eval_tokens = registry.register(Counter(
+    "llm_prompt_eval_tokens_total", "Prompt tokens evaluated by Ollama (prompt_eval_count).", ["model"]))
+llm_prompt_eval_seconds = registry.register(Counter(
+    "llm_prompt_eval_seconds_total", "Time Ollama spent evaluating prompts (prompt_eval_duration).", ["model"]))
+llm_eval_tokens = registry.register(Counter(
+    "llm_eval_tokens_total", "Tokens generated by Ollama (eval_count).", ["model"]))
+llm_eval_seconds = registry.register(Counter(
+    "llm_eval_seconds_total", "Time Ollama spent generating tokens (eval_duration).", ["model"]))
+
+llm_request_failures = registry.register(Counter(
+    "llm_request_failures_total", "Failed requests to the LLM backends, by the reason.", ["endpoint", "reason"]))
+llm_retries = registry.register(Counter(
+    "llm_retries_total", "Non-streaming LLM requests sent again after a failure.", ["model"]))
+llm_route_decisions = registry.register(Counter(
+    "llm_route_decisions_total", "Questions routed to each model, by the reason of the choice.", ["model", "reason"]))
+
+llm_queue_wait = registry.register(Histogram(
+    "llm_queue_wait_seconds", "Time a generation waited for a scheduler slot.", ["priority"]))
+
+telegram_request_duration = registry.register(Histogram(
+    "telegram_request_duration_seconds", "Latency of message edits and sends made while streaming.", ["method"]))
+telegram_retry_after = registry.register(Counter(
+    "telegram_retry_after_total", "Bot API calls rejected with RetryAfter (429).", ["method"]))
+
+handler_duration = registry.register(Histogram(
+    "handler_duration_seconds", "Latency of update handlers.", ["handler"]))
+
+transcription_batch_size = registry.register(Histogram(
+    "transcription_batch_size", "Voice clips transcribed in one batch.", buckets=(1, 2, 4, 8, 16, 32)))
+transcription_duration = registry.register(Histogram(
+    "transcription_duration_seconds", "Time from queueing a voice clip to its transcript."))
+
+cache_requests = registry.register(Counter(
+    "cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"]))
+
+log_records_dropped = registry.register(CallbackMetric(
+    "log_records_dropped_total", "Log records dropped because the writer thread fell behind.", "counter",
+    lambda: {(): dropped_records()}))
+log_records_truncated = registry.register(CallbackMetric(
+    "log_records_truncated_total", "Log messages cut to LOG_MAX_MESSAGE characters.", "counter",
+    lambda: {(): truncated_records()}))
+
+startup_phase_duration = registry.register(Gauge(
+    "startup_phase_seconds", "Duration of the startup phases of the last start.", ["phase"]))
+bot_ready = registry.register(Gauge(
+    "bot_ready", "1 once the caches are warm and updates are served, 0 while starting or stopping."))
+
+
+def record_generation_stats(model: str, result: dict) -> None:
+    """
+    Records the statistics Ollama puts into the final response (or the last streamed chunk).
+
+    :param model: The model the generation ran on.
+    :param result: The response object with done == True.
+    """
+    prompt_eval_count = result.get('prompt_eval_count', 0)
+    eval_count = result.get('eval_count', 0)
+    # durations are reported in nanoseconds
+    prompt_eval_duration = result.get('prompt_eval_duration', 0) / 1e9
+    eval_duration = result.get('eval_duration', 0) / 1e9
+
+    llm_prompt_eval_tokens.inc(prompt_eval_count, model=model)
+    llm_prompt_eval_seconds.inc(prompt_eval_duration, model=model)
+    llm_eval_tokens.inc(eval_count, model=model)
+    llm_eval_seconds.inc(eval_duration, model=model)
+
+    if eval_count and eval_duration:
+        llm_tokens_per_second.observe(eval_count / eval_duration, model=model)
+
+
+class MetricsServer:
+    """
+    Small aiohttp server exposing the registry in the Prometheus text format on /metrics
+    and the readiness of the bot on /ready (200 or 503), for probes during rolling restarts.
+    """
+
+    def __init__(self, host: str, port: int, metrics: MetricsRegistry = registry):
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self.app = web.Application()
+        self.app.router.add_get('/metrics', self._handle_metrics)
+        self.app.router.add_get('/ready', self._handle_ready)
+        self.ready = False
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics are served on http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def set_ready(self, ready: bool) -> None:
+        self.ready = ready
+        bot_ready.set(1 if ready else 0)
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.metrics.render().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def _handle_ready(self, request: web.Request) -> web.Response:
+        if self.ready:
+            return web.Response(text="ready\n")
+        return web.Response(status=503, text="starting\n")
@@ -9,4 +9,6 @@ def singleton(cls: Callable):
             instances[cls] = cls(*args, **kwargs)
         return instances[cls]
 
+    # the class itself, for benchmarks that need separate instances
+    get_instance.__wrapped__ = cls
     return get_instance
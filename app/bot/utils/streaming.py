@@ -0,0 +1,267 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message, InlineKeyboardMarkup
+
+from app.bot import logger
+from app.bot.config import TELEGRAM_GLOBAL_RATE, TELEGRAM_EDIT_INTERVAL
+from app.bot.utils.metrics import telegram_request_duration, telegram_retry_after
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Telegram rejects a message with unbalanced markup, generated text may have a stray * or _
+_MARKUP_ERROR = "can't parse entities"
+
+
+class TokenBucket:
+    """
+    Token bucket shared by all streams, keeps the bot under the global Bot API rate limit.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float, optional): Burst size. Defaults to one second worth of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+telegram_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE)
+
+
+def _split_at_limit(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> tuple[str, str]:
+    """
+    Splits text into a head that fits into one message and the rest, preferring line and word boundaries.
+    """
+    cut = text.rfind('\n', limit // 2, limit)
+    if cut == -1:
+        cut = text.rfind(' ', limit // 2, limit)
+    if cut == -1:
+        cut = limit
+    return text[:cut], text[cut:].lstrip()
+
+
+async def answer_with_fallback(message: Message, text: str,
+                               reply_markup: Optional[InlineKeyboardMarkup] = None) -> Message:
+    """
+    Sends generated text in the parse mode of the bot, or as plain text if Telegram rejects its markup,
+    the same way a streamed answer is shown.
+    """
+    try:
+        return await message.answer(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if _MARKUP_ERROR not in e.message:
+            raise
+        logger.debug(f"Markup of a message rejected, sending it as plain text: {e.message}")
+        return await message.answer(text, reply_markup=reply_markup, parse_mode=None)
+
+
+async def edit_with_fallback(message: Message, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+    """
+    Edits a message to generated text like `answer_with_fallback` sends it.
+    """
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if _MARKUP_ERROR not in e.message:
+            raise
+        logger.debug(f"Markup of a message rejected, showing it as plain text: {e.message}")
+        await message.edit_text(text, reply_markup=reply_markup, parse_mode=None)
+
+
+class StreamingMessage:
+    """
+    Streams generated text into a Telegram message.
+
+    Chunks are coalesced and the message is edited at most once per TELEGRAM_EDIT_INTERVAL,
+    every edit waits for the global token bucket. Edits that would not change the message are
+    skipped, RetryAfter is honored, and text beyond the 4096 character limit continues in new messages.
+
+    Usage:
+        async with StreamingMessage(placeholder) as stream:
+            async for chunk in ollama.stream_response():
+                stream.append(chunk)
+            await stream.finish(reply_markup=keyboard)
+    """
+
+    def __init__(self, message: Message, bucket: TokenBucket = telegram_bucket,
+                 edit_interval: float = TELEGRAM_EDIT_INTERVAL):
+        """
+        Args:
+            message (Message): Already sent placeholder message that will be edited.
+            bucket (TokenBucket): Global rate limiter.
+            edit_interval (float): Minimal number of seconds between edits of this stream.
+        """
+        self.bucket = bucket
+        self.edit_interval = edit_interval
+
+        self._messages: List[Message] = [message]
+        self._sent_text = message.text or ""
+        self._completed: List[str] = []
+        self._buffer = ""
+        self._status: Optional[str] = None
+        self._continuation_pending = False
+
+        self._dirty = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._next_edit_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def text(self) -> str:
+        """
+        Everything appended so far.
+        """
+        return ''.join(self._completed) + self._buffer
+
+    @property
+    def messages(self) -> List[Message]:
+        return list(self._messages)
+
+    async def __aenter__(self) -> "StreamingMessage":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._closing.set()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def append(self, chunk: str) -> None:
+        self._buffer += chunk
+        self._dirty.set()
+
+    def set_status(self, status: str) -> None:
+        """
+        Shows a service text (e.g. the queue position) until the first chunk arrives.
+        """
+        self._status = status
+        if not self.text:
+            self._dirty.set()
+
+    async def finish(self, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        """
+        Flushes the remaining text and attaches the keyboard to the last message.
+        """
+        self._closing.set()
+        self._dirty.set()
+        if self._task is not None:
+            # lets an edit that is already in flight complete, a pending wait is interrupted
+            await self._task
+
+        # the last edit keeps the interval too, otherwise it is the one Telegram answers with RetryAfter
+        delay = self._next_edit_at - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._flush(reply_markup=reply_markup)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self._dirty.wait()
+            if self._closing.is_set():
+                return
+
+            delay = self._next_edit_at - loop.time()
+            if delay > 0:
+                # chunks arriving meanwhile are coalesced into this edit
+                try:
+                    await asyncio.wait_for(self._closing.wait(), delay)
+                    return
+                except asyncio.TimeoutError:
+                    pass
+
+            self._dirty.clear()
+            await self._flush()
+            self._next_edit_at = loop.time() + self.edit_interval
+
+    async def _flush(self, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        while len(self._buffer) > TELEGRAM_MESSAGE_LIMIT:
+            head, tail = _split_at_limit(self._buffer, TELEGRAM_MESSAGE_LIMIT)
+            consumed = len(self._buffer) - len(tail)
+            await self._write(head)
+            # chunks appended during the edit are at the end of the buffer, keep them
+            self._completed.append(self._buffer[:consumed])
+            self._buffer = self._buffer[consumed:]
+            # the continuation message is sent once there is text for it
+            self._continuation_pending = True
+
+        text = self._buffer if self.text else self._status
+        if text and text.strip():
+            await self._write(text, reply_markup=reply_markup)
+
+    async def _write(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        if self._continuation_pending:
+            await self._send(text, reply_markup=reply_markup)
+            self._continuation_pending = False
+        else:
+            await self._edit(text, reply_markup=reply_markup)
+
+    async def _edit(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        if text == self._sent_text and reply_markup is None:
+            return
+
+        message = self._messages[-1]
+        await self._request("edit", lambda parse_mode: message.edit_text(
+            text, reply_markup=reply_markup, parse_mode=parse_mode))
+        self._sent_text = text
+
+    async def _send(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        message = self._messages[-1]
+        sent = await self._request("send", lambda parse_mode: message.answer(
+            text, reply_markup=reply_markup, parse_mode=parse_mode))
+
+        self._messages.append(sent)
+        self._sent_text = text
+
+    async def _request(self, method: str, call: Callable[[Optional[str]], Awaitable[Any]]) -> Any:
+        """
+        Makes an edit or a send with the parse mode of the bot, so a continuation renders like the first message.
+        Waits for the token bucket and honors RetryAfter.
+
+        :param method: "edit" or "send", the label of the metrics.
+        :param call: Makes the request with the given parse mode.
+        :return: The result of the call, None if the edit did not change the message.
+        """
+        message = self._messages[-1]
+        parse_mode = message.bot.default.parse_mode if message.bot else None
+
+        while True:
+            await self.bucket.acquire()
+            started = time.monotonic()
+            try:
+                result = await call(parse_mode)
+                telegram_request_duration.observe(time.monotonic() - started, method=method)
+                return result
+            except TelegramRetryAfter as e:
+                telegram_retry_after.inc(method=method)
+                logger.debug(f"{method.capitalize()} rate limited, retrying after {e.retry_after} second")
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if method == "edit" and "message is not modified" in e.message:
+                    return None
+                if _MARKUP_ERROR in e.message and parse_mode is not None:
+                    # unfinished markup in the middle of a stream, show it as plain text for now
+                    parse_mode = None
+                    continue
+                raise
@@ -0,0 +1,44 @@
+import os
+
+# the configuration is read on import, so it is set before anything from app.bot is imported
+os.environ.setdefault('BOT_TOKEN', '123456:test')
+os.environ.setdefault('EMBEDDER', 'none')
+os.environ.setdefault('METRICS_PORT', '0')
+
+from dataclasses import dataclass  # noqa: E402
+from typing import Callable, Dict, List  # noqa: E402
+
+import pytest  # noqa: E402
+
+from app.tests.corpus import generate_corpus  # noqa: E402
+
+
+@dataclass
+class Corpus:
+    size: int
+    uploads_dir: str
+    names: List[str]
+
+
+@pytest.fixture(scope='session')
+def corpus_factory(tmp_path_factory) -> Callable[[int], Corpus]:
+    """
+    Synthetic DOCX corpora by number of documents, generated once per session.
+    """
+    corpora: Dict[int, Corpus] = {}
+
+    def get(size: int) -> Corpus:
+        if size not in corpora:
+            uploads_dir = str(tmp_path_factory.mktemp(f"corpus{size}"))
+            corpora[size] = Corpus(size, uploads_dir, generate_corpus(uploads_dir, size))
+        return corpora[size]
+
+    return get
+
+
+@pytest.fixture(scope='session', autouse=True)
+def ingestion_pool():
+    from app.bot.knowledge.ingestion import IngestionPool
+
+    yield IngestionPool()
+    IngestionPool().close()
@@ -0,0 +1,110 @@
+import os
+import random
+import zipfile
+from typing import List
+from xml.sax.saxutils import escape
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+_DOCUMENT = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>{body}</w:body></w:document>"""
+
+_WORDS = ("договор", "сотрудник", "отпуск", "заработная", "плата", "работодатель", "обязан", "предоставить",
+          "ежегодный", "оплачиваемый", "порядок", "выплаты", "премия", "условия", "труда", "охрана", "смена",
+          "график", "компенсация", "профсоюз", "соглашение", "стороны", "срок", "действия", "норма", "часов")
+
+# paragraphs per document: most documents are short, a few are long
+SIZES = (2, 5, 10, 20, 50, 200)
+SIZE_WEIGHTS = (10, 25, 30, 20, 10, 5)
+
+
+def _paragraph(text: str) -> str:
+    return f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(text)}</w:t></w:r></w:p>"
+
+
+def _table(rows: List[List[str]]) -> str:
+    cells = ''.join(
+        "<w:tr>" + ''.join(f"<w:tc>{_paragraph(cell)}</w:tc>" for cell in row) + "</w:tr>" for row in rows
+    )
+    return f"<w:tbl>{cells}</w:tbl>"
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 20))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def write_docx(path: str, paragraphs: int, rng: random.Random) -> None:
+    """
+    Writes a minimal Word document: paragraphs of a few sentences and a table every 20 paragraphs.
+    Packed by hand, python-docx takes too long for corpora of thousands of files.
+    """
+    body = []
+    for index in range(paragraphs):
+        body.append(_paragraph(' '.join(_sentence(rng) for _ in range(rng.randint(1, 4)))))
+        if index % 20 == 19:
+            body.append(_table([[rng.choice(_WORDS), str(rng.randint(1, 1000))] for _ in range(5)]))
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _RELS)
+        archive.writestr('word/document.xml', _DOCUMENT.format(body=''.join(body)))
+
+
+def generate_corpus(directory: str, documents: int, seed: int = 0) -> List[str]:
+    """
+    Fills the directory with synthetic DOCX documents of varying sizes, the same ones for the same seed.
+
+    :return: File names of the documents.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    for index in range(documents):
+        name = f"document_{index:05d}.docx"
+        write_docx(os.path.join(directory, name), rng.choices(SIZES, SIZE_WEIGHTS)[0], rng)
+        names.append(name)
+    return names
+
+
+def sync_peak_rss(uploads_dir: str, cache_dir: str) -> int:
+    """
+    Extracts the corpus into an empty cache and reads the knowledge base version, meant to run in a fresh process.
+
+    :return: Peak RSS of the process in bytes. Extraction itself runs in the ingestion workers and is not included.
+    """
+    from app.bot.knowledge.ingestion import IngestionPool
+    from app.bot.knowledge.knowledge_base import KnowledgeBase
+
+    knowledge_base = KnowledgeBase.__wrapped__(uploads_dir, cache_dir)
+    knowledge_base.sync()
+    assert knowledge_base.version
+    IngestionPool().close()
+    return peak_rss()
+
+
+def peak_rss() -> int:
+    """
+    :return: Peak RSS of this process in bytes.
+    """
+    # ru_maxrss survives exec, a process spawned by a big one would report the peak of its parent
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+
+    import resource
+
+    # kilobytes on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
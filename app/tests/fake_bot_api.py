@@ -0,0 +1,129 @@
+import json
+import math
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+
+
+@dataclass
+class BotApiCall:
+    method: str
+    chat_id: Optional[int]
+    # time.monotonic() the call arrived
+    at: float
+    text: Optional[str] = None
+    reply_markup: Optional[dict] = None
+    # False for calls answered with a 429
+    ok: bool = True
+
+
+class FakeBotApi:
+    """
+    Local stand-in for the Telegram Bot API, TELEGRAM_API_SERVER of the bot under test.
+
+    Answers the methods the support flow uses and records every call. Messages and edits are rate
+    limited like Telegram does it: at most `global_rate` per second for the bot and one edit per
+    `chat_interval` seconds per chat, anything faster gets a 429 with retry_after.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_interval: float = 1.0):
+        """
+        Args:
+            global_rate (float): Messages and edits per second for the whole bot.
+            chat_interval (float): Seconds between two edits in one chat.
+        """
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.calls: List[BotApiCall] = []
+
+        self._writes: Deque[float] = deque()
+        self._last_edit: Dict[int, float] = {}
+        self._message_ids: Dict[int, int] = defaultdict(int)
+        self._texts: Dict[tuple, str] = {}
+
+        self.app = web.Application()
+        self.app.router.add_post('/bot{token}/{method}', self.handle)
+
+    def chat_calls(self, chat_id: int, method: Optional[str] = None) -> List[BotApiCall]:
+        return [call for call in self.calls if call.chat_id == chat_id and (method is None or call.method == method)]
+
+    @property
+    def rate_limited(self) -> int:
+        return sum(1 for call in self.calls if not call.ok)
+
+    def count(self, method: str) -> int:
+        return sum(1 for call in self.calls if call.method == method and call.ok)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        chat_id = int(params['chat_id']) if 'chat_id' in params else None
+        reply_markup = params.get('reply_markup')
+        if isinstance(reply_markup, str):
+            reply_markup = json.loads(reply_markup)
+        call = BotApiCall(method, chat_id, time.monotonic(), params.get('text'), reply_markup)
+        self.calls.append(call)
+
+        if method in ('sendMessage', 'editMessageText'):
+            retry_after = self._retry_after(chat_id if method == 'editMessageText' else None, call.at)
+            if retry_after:
+                call.ok = False
+                return web.json_response({
+                    'ok': False, 'error_code': 429, 'description': f"Too Many Requests: retry after {retry_after}",
+                    'parameters': {'retry_after': retry_after},
+                }, status=429)
+
+        if method == 'sendMessage':
+            self._message_ids[chat_id] += 1
+            message_id = self._message_ids[chat_id]
+            self._texts[(chat_id, message_id)] = call.text
+            return self._ok(self._message(chat_id, message_id, call.text))
+        if method == 'editMessageText':
+            key = (chat_id, int(params['message_id']))
+            if self._texts.get(key) == call.text and reply_markup is None:
+                return web.json_response({
+                    'ok': False, 'error_code': 400,
+                    'description': "Bad Request: message is not modified: specified new message content and "
+                                   "reply markup are exactly the same as a current content and reply markup of the message",
+                }, status=400)
+            self._texts[key] = call.text
+            return self._ok(self._message(chat_id, key[1], call.text))
+        if method == 'getMe':
+            return self._ok(BOT_USER)
+        # sendChatAction, answerCallbackQuery, setWebhook, deleteWebhook, editMessageReplyMarkup
+        return self._ok(True)
+
+    def _retry_after(self, edited_chat_id: Optional[int], now: float) -> int:
+        while self._writes and now - self._writes[0] >= 1:
+            self._writes.popleft()
+        if len(self._writes) >= self.global_rate:
+            return 1
+
+        last = self._last_edit.get(edited_chat_id)
+        if last is not None and now - last < self.chat_interval:
+            return max(1, math.ceil(self.chat_interval - (now - last)))
+
+        self._writes.append(now)
+        if edited_chat_id is not None:
+            self._last_edit[edited_chat_id] = now
+        return 0
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+    @staticmethod
+    def _message(chat_id: int, message_id: int, text: Optional[str]) -> dict:
+        return {
+            'message_id': message_id, 'date': int(time.time()), 'text': text or "",
+            'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER,
+        }
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from aiohttp import web
+
+# words the fake answers are made of, one token each
+_WORDS = ("Для", "этого", "откройте", "раздел", "настроек", "и", "выберите", "нужный", "пункт", "меню,",
+          "затем", "подтвердите", "изменения.", "Если", "ошибка", "повторяется,", "обратитесь", "в", "поддержку.")
+
+
+@dataclass
+class FakeOllamaStats:
+    requests: int = 0
+    streamed: int = 0
+    errors: int = 0
+    tokens: int = 0
+    max_in_flight: int = 0
+
+
+class FakeOllama:
+    """
+    Local stand-in for Ollama: /api/generate streams NDJSON at a fixed rate, /api/tags and /api/ps
+    list the models.
+
+    A generation waits for one of `parallel` slots (OLLAMA_NUM_PARALLEL), then for the first token delay,
+    then streams `answer_tokens` tokens at `token_rate` tokens per second. A share of the requests
+    fails with a 500 before the first token.
+    """
+
+    def __init__(self, models: Sequence[str] = (), token_rate: float = 30.0, first_token_delay: float = 0.5,
+                 answer_tokens: int = 200, error_rate: float = 0.0, parallel: int = 4, seed: Optional[int] = None):
+        """
+        Args:
+            models (Sequence[str]): Models the fake has pulled.
+            token_rate (float): Tokens per second of one stream.
+            first_token_delay (float): Seconds from taking a slot to the first token, the prompt evaluation.
+            answer_tokens (int): Tokens of an answer, num_predict of the request caps them.
+            error_rate (float): Share of the generations answered with a 500.
+            parallel (int): Generations running at once, the rest wait.
+            seed (int, optional): Seed of the error draws.
+        """
+        self.models: List[str] = []
+        self.pull(*models)
+        self.token_rate = token_rate
+        self.first_token_delay = first_token_delay
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.stats = FakeOllamaStats()
+
+        self._slots = asyncio.Semaphore(parallel)
+        self._in_flight = 0
+        self._loaded: List[str] = []
+        self._random = random.Random(seed)
+
+        self.app = web.Application()
+        self.app.router.add_post('/api/generate', self.generate)
+        self.app.router.add_get('/api/tags', self.tags)
+        self.app.router.add_get('/api/ps', self.ps)
+
+    def pull(self, *models: str) -> None:
+        for model in models:
+            tag = model if ':' in model else f"{model}:latest"
+            if model and tag not in self.models:
+                self.models.append(tag)
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({'models': [{'name': model} for model in self.models]})
+
+    async def ps(self, request: web.Request) -> web.Response:
+        return web.json_response({'models': [{'name': model} for model in self._loaded]})
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        data = await request.json()
+        model = data.get('model', '')
+        self.stats.requests += 1
+
+        if self._random.random() < self.error_rate:
+            self.stats.errors += 1
+            return web.json_response({'error': 'fake failure'}, status=500)
+
+        tag = model if ':' in model else f"{model}:latest"
+        if tag not in self.models:
+            return web.json_response({'error': f"model '{model}' not found"}, status=404)
+
+        prompt_tokens = (len(data.get('system', '')) + len(data.get('prompt', ''))) // 3
+        num_predict = data.get('options', {}).get('num_predict', -1)
+        tokens = self.answer_tokens if num_predict is None or num_predict < 0 else min(self.answer_tokens, num_predict)
+
+        async with self._slots:
+            self._in_flight += 1
+            self.stats.max_in_flight = max(self.stats.max_in_flight, self._in_flight)
+            try:
+                started = time.perf_counter()
+                await asyncio.sleep(self.first_token_delay)
+                if tag not in self._loaded:
+                    self._loaded.append(tag)
+
+                if 'prompt' not in data:
+                    # a load request, like the warm-up sends
+                    return web.json_response({'model': model, 'response': '', 'done': True})
+                if not data.get('stream', True):
+                    await asyncio.sleep(tokens / self.token_rate)
+                    self.stats.tokens += tokens
+                    return web.json_response(self._final_chunk(model, self._text(tokens), prompt_tokens, tokens, started))
+
+                self.stats.streamed += 1
+                response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+                await response.prepare(request)
+                try:
+                    for index in range(tokens):
+                        chunk = {'model': model, 'response': _WORDS[index % len(_WORDS)] + ' ', 'done': False}
+                        await response.write(json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b'\n')
+                        self.stats.tokens += 1
+                        await asyncio.sleep(1 / self.token_rate)
+                    final = self._final_chunk(model, "", prompt_tokens, tokens, started)
+                    await response.write(json.dumps(final).encode('utf-8') + b'\n')
+                    await response.write_eof()
+                except ConnectionResetError:
+                    # the bot gave up on the stream, e.g. a deadline passed
+                    pass
+                return response
+            finally:
+                self._in_flight -= 1
+
+    @staticmethod
+    def _text(tokens: int) -> str:
+        return ' '.join(_WORDS[index % len(_WORDS)] for index in range(tokens))
+
+    def _final_chunk(self, model: str, response: str, prompt_tokens: int, tokens: int, started: float) -> dict:
+        duration = int((time.perf_counter() - started) * 1e9)
+        return {
+            'model': model,
+            'response': response,
+            'done': True,
+            'context': list(range(prompt_tokens + tokens)),
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(self.first_token_delay * 1e9),
+            'eval_count': tokens,
+            'eval_duration': max(duration - int(self.first_token_delay * 1e9), 1),
+            'total_duration': duration,
+        }
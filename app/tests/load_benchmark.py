@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from app.tests.fake_bot_api import FakeBotApi, BotApiCall
+from app.tests.fake_ollama import FakeOllama
+
+# the placeholder and the queue position start with it, anything else in the message is the answer
+STATUS_PREFIX = "Успешно!"
+
+QUESTIONS = (
+    "Как сбросить пароль от личного кабинета?",
+    "Где посмотреть статус заявки?",
+    "Как изменить реквизиты компании в договоре?",
+    "Сколько стоит подключение дополнительного пользователя?",
+    "Не приходит письмо с подтверждением регистрации, что делать?",
+    "Как выгрузить отчет за прошлый месяц в Excel и можно ли настроить автоматическую отправку "
+    "этого отчета бухгалтеру каждую неделю по понедельникам?",
+    "Подскажите, пожалуйста: как продлить лицензию? И можно ли перенести ее на другой компьютер?",
+    "1. Как добавить сотрудника?\n2. Как ограничить ему доступ к отчетам?\n3. Как удалить его потом?",
+)
+
+# far from the staff id in the config, so no simulated user is an admin
+FIRST_USER_ID = 10_000
+
+
+@dataclass
+class QuestionResult:
+    user_id: int
+    question: str
+    # seconds from the start of the run
+    started: float
+    latency: float
+    answered: bool
+    # seconds from the question to the first edit that shows answer text
+    time_to_first_token: Optional[float]
+    edits: int
+    rate_limited: int
+
+
+async def serve(app: web.Application) -> Tuple[web.AppRunner, str]:
+    """
+    Serves the app on a free local port.
+
+    :return: The runner, to clean it up, and the base URL.
+    """
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def prepare_environment(workdir: str, ollama_url: str, api_url: str, documents: Optional[str] = None) -> None:
+    """
+    Points the configuration of the bot to the fakes and to a scratch directory. Must run before
+    anything from app.bot is imported, the configuration is read on import.
+    """
+    os.environ.setdefault('BOT_TOKEN', '123456:benchmark')
+    os.environ['TELEGRAM_API_SERVER'] = api_url
+    os.environ['OLLAMA_BACKENDS'] = ollama_url
+    os.environ['DATABASE_BACKEND'] = 'sqlite'
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'bot.sqlite3')
+    os.environ['CACHE_DIR'] = os.path.join(workdir, 'cache')
+    os.environ.setdefault('EMBEDDER', 'hashing')
+    os.environ.setdefault('TRANSCRIBER', 'none')
+    os.environ.setdefault('METRICS_PORT', '0')
+
+    uploads = os.path.join(workdir, 'uploads')
+    os.makedirs(uploads, exist_ok=True)
+    if documents:
+        for name in os.listdir(documents):
+            if os.path.isfile(os.path.join(documents, name)):
+                shutil.copy(os.path.join(documents, name), uploads)
+
+    # the bot runs from app/bot, UPLOADS_DIR is relative to it
+    bot_dir = os.path.join(workdir, 'app', 'bot')
+    os.makedirs(bot_dir, exist_ok=True)
+    os.chdir(bot_dir)
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        # nearest rank
+        return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+    return {'p50': rank(0.5), 'p95': rank(0.95), 'p99': rank(0.99),
+            'mean': sum(ordered) / len(ordered), 'max': ordered[-1]}
+
+
+class LoadGenerator:
+    """
+    Simulated users going through the support flow: the support button, then questions.
+
+    Updates are fed into the dispatcher of the bot, so the real routers, middlewares and handlers
+    answer them; what the users see is read back from the fake Bot API.
+    """
+
+    def __init__(self, dispatcher, bot, api: FakeBotApi, users: int, questions_per_user: int = 1,
+                 think_time: float = 1.0, ramp_up: float = 0.0, seed: Optional[int] = None):
+        """
+        Args:
+            dispatcher (Dispatcher): Dispatcher of the bot with the routers registered.
+            bot (Bot): Bot whose session points to the fake Bot API.
+            api (FakeBotApi): The fake Bot API.
+            users (int): Simulated users, all active at once after the ramp-up.
+            questions_per_user (int): Questions each user asks one after another.
+            think_time (float): Seconds between an answer and the next question of a user.
+            ramp_up (float): Seconds over which the users arrive.
+            seed (int, optional): Seed of the question choice.
+        """
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.api = api
+        self.users = users
+        self.questions_per_user = questions_per_user
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+        self.results: List[QuestionResult] = []
+        # exceptions that escaped the handlers, by type
+        self.errors: Counter = Counter()
+
+        self._random = random.Random(seed)
+        self._update_ids = itertools.count(1)
+        self._started = 0.0
+
+    async def run(self) -> List[QuestionResult]:
+        self._started = time.monotonic()
+        await asyncio.gather(*(self._user(index) for index in range(self.users)))
+        return self.results
+
+    async def _user(self, index: int) -> None:
+        user_id = FIRST_USER_ID + index
+        if self.users > 1:
+            await asyncio.sleep(self.ramp_up * index / (self.users - 1))
+
+        for number in range(self.questions_per_user):
+            await self._feed({'callback_query': {
+                'id': str(next(self._update_ids)), 'chat_instance': str(user_id), 'data': 'support_button',
+                'from': self._user_json(user_id), 'message': self._bot_message(user_id),
+            }})
+            await asyncio.sleep(self.think_time)
+
+            # unique, so the answer cache does not answer instead of the model
+            question = f"{self._random.choice(QUESTIONS)} (№{user_id}-{number})"
+            await self._ask(user_id, question)
+
+    async def _ask(self, user_id: int, question: str) -> None:
+        started = time.monotonic()
+        await self._feed({'message': {
+            'message_id': next(self._update_ids), 'date': int(time.time()), 'text': question,
+            'chat': {'id': user_id, 'type': 'private'}, 'from': self._user_json(user_id),
+        }})
+        finished = time.monotonic()
+
+        calls = [call for call in self.api.chat_calls(user_id) if started <= call.at <= finished]
+        edits = [call for call in calls if call.method == 'editMessageText' and call.ok]
+        first_token = next((call.at - started for call in edits if not (call.text or "").startswith(STATUS_PREFIX)),
+                           None)
+        answered = any(call.reply_markup for call in edits)
+
+        self.results.append(QuestionResult(
+            user_id=user_id, question=question, started=started - self._started, latency=finished - started,
+            answered=answered, time_to_first_token=first_token if answered else None, edits=len(edits),
+            rate_limited=sum(1 for call in calls if not call.ok),
+        ))
+
+    async def _feed(self, update: dict) -> None:
+        update['update_id'] = next(self._update_ids)
+        try:
+            await self.dispatcher.feed_raw_update(self.bot, update)
+        except Exception as e:
+            # polling would log it and go on, so does the user
+            self.errors[type(e).__name__] += 1
+
+    @staticmethod
+    def _user_json(user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+
+    @staticmethod
+    def _bot_message(chat_id: int) -> dict:
+        return {'message_id': 0, 'date': int(time.time()), 'text': "menu", 'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'Benchmark'}}
+
+
+def summarize(results: List[QuestionResult], errors: Dict[str, int], calls: List[BotApiCall], ollama: FakeOllama,
+              duration: float, config: dict) -> dict:
+    answered = [result for result in results if result.answered]
+    edits = sum(1 for call in calls if call.method == 'editMessageText' and call.ok)
+
+    return {
+        'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': config,
+        'duration': duration,
+        'questions': len(results),
+        'answered': len(answered),
+        'failed': len(results) - len(answered),
+        'handler_errors': dict(errors),
+        # answers per second over the whole run
+        'throughput': len(answered) / duration if duration else 0.0,
+        'latency': percentiles([result.latency for result in answered]),
+        'time_to_first_token': percentiles([result.time_to_first_token for result in answered
+                                            if result.time_to_first_token is not None]),
+        'telegram': {
+            'messages': sum(1 for call in calls if call.method == 'sendMessage' and call.ok),
+            'edits': edits,
+            'edits_per_answer': edits / len(answered) if answered else None,
+            'rate_limited': sum(1 for call in calls if not call.ok),
+        },
+        'ollama': asdict(ollama.stats),
+    }
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """
+    :return: Lines with the change of the headline numbers against an earlier run.
+    """
+    lines = []
+    for path in (('throughput',), ('latency', 'p50'), ('latency', 'p95'), ('latency', 'p99'),
+                 ('time_to_first_token', 'p50'), ('time_to_first_token', 'p95'), ('telegram', 'rate_limited'),
+                 ('failed',)):
+        old, new = baseline, current
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+            new = new.get(key) if isinstance(new, dict) else None
+        if old is None or new is None:
+            continue
+        change = f" ({(new - old) / old:+.0%})" if old else ""
+        lines.append(f"{'.'.join(path)}: {old:.3f} -> {new:.3f}{change}")
+    return lines
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    ollama = FakeOllama(token_rate=args.token_rate, first_token_delay=args.first_token_delay,
+                        answer_tokens=args.answer_tokens, error_rate=args.error_rate, parallel=args.parallel,
+                        seed=args.seed)
+    api = FakeBotApi(global_rate=args.telegram_rate, chat_interval=args.chat_interval)
+    ollama_runner, ollama_url = await serve(ollama.app)
+    api_runner, api_url = await serve(api.app)
+
+    workdir = tempfile.mkdtemp(prefix='load-benchmark-')
+    cwd = os.getcwd()
+    os.environ['LOG_LEVEL'] = args.log_level
+    prepare_environment(workdir, ollama_url, api_url, args.documents)
+
+    # the configuration is read on import, so the bot is imported once the environment points to the fakes
+    from app.bot import bot
+    from app.bot.config import SMALL_LLM_MODEL, LARGE_LLM_MODEL, LLM_CONCURRENCY, TELEGRAM_EDIT_INTERVAL
+    from app.bot.startup import Startup
+
+    ollama.pull(SMALL_LLM_MODEL, LARGE_LLM_MODEL)
+
+    startup = Startup()
+    startup.register_routes()
+    startup.register_middlewares()
+    await startup.on_startup()
+    try:
+        generator = LoadGenerator(startup._dp, bot, api, users=args.users, questions_per_user=args.questions,
+                                  think_time=args.think_time, ramp_up=args.ramp_up, seed=args.seed)
+        started = time.monotonic()
+        results = await generator.run()
+        duration = time.monotonic() - started
+    finally:
+        await startup.on_shutdown()
+        await bot.session.close()
+        await api_runner.cleanup()
+        await ollama_runner.cleanup()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'log_level')}
+    config.update(llm_concurrency=LLM_CONCURRENCY, edit_interval=TELEGRAM_EDIT_INTERVAL)
+    return summarize(results, generator.errors, api.calls, ollama, duration, config)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load benchmark of the support flow against fake Ollama and Bot API")
+    parser.add_argument('--users', type=int, default=20, help="simulated users, active at once")
+    parser.add_argument('--questions', type=int, default=1, help="questions per user")
+    parser.add_argument('--think-time', type=float, default=1.0, help="seconds between the answer and the next question")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="seconds over which the users arrive")
+    parser.add_argument('--token-rate', type=float, default=30.0, help="tokens per second of one Ollama stream")
+    parser.add_argument('--first-token-delay', type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument('--answer-tokens', type=int, default=200, help="tokens of an answer")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of generations failing with a 500")
+    parser.add_argument('--parallel', type=int, default=4, help="generations Ollama runs at once")
+    parser.add_argument('--telegram-rate', type=float, default=30.0, help="messages and edits per second per bot")
+    parser.add_argument('--chat-interval', type=float, default=1.0, help="seconds between edits in one chat")
+    parser.add_argument('--documents', help="directory with knowledge base documents to upload")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='load-benchmark.json', help="JSON file for the results")
+    parser.add_argument('--baseline', help="results of an earlier run to compare with")
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """
+    Runs the benchmark and saves the results as JSON, e.g.
+
+        LLM_CONCURRENCY=4 python -m app.tests.load_benchmark --users 50 --output results.json --baseline before.json
+
+    Settings of the bot other than its endpoints and directories are taken from the environment as usual.
+    """
+    args = parse_args(argv)
+    args.output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    summary = asyncio.run(run_benchmark(args))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    latency, first_token, telegram = summary['latency'], summary['time_to_first_token'], summary['telegram']
+    print(f"{summary['answered']}/{summary['questions']} answered in {summary['duration']:.1f} s, "
+          f"{summary['throughput']:.2f} answers/s")
+    if latency['p50'] is not None:
+        print(f"latency p50/p95/p99: {latency['p50']:.2f}/{latency['p95']:.2f}/{latency['p99']:.2f} s, "
+              f"first token p50/p95/p99: {first_token['p50']:.2f}/{first_token['p95']:.2f}/{first_token['p99']:.2f} s")
+    print(f"{telegram['edits']} edits, {telegram['rate_limited']} rate limited, results saved to {args.output}")
+    if baseline is not None:
+        print('\n'.join(compare(summary, baseline)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+from app.bot.api.ollama.context_window import ContextWindow
+
+BUCKETS = [2048, 4096, 8192, 16384]
+
+
+def window(**kwargs) -> ContextWindow:
+    return ContextWindow.__wrapped__(buckets=BUCKETS, tokenizer="", **kwargs)
+
+
+def test_smallest_sufficient_bucket():
+    context_window = window()
+
+    assert context_window.num_ctx("qwen2", 1500) == 2048
+    assert context_window.num_ctx("qwen2", 3000) == 4096
+    assert context_window.num_ctx("qwen2", 100_000) == 16384
+    assert context_window.num_ctx("qwen2", 10_000, limit=8192) == 8192
+
+
+def test_loaded_bucket_is_kept_per_backend():
+    context_window = window()
+    context_window.loaded("http://gpu-1:11434/api/generate", "qwen2", 8192)
+
+    assert context_window.num_ctx("qwen2", 1500, backend="http://gpu-1:11434/api/generate") == 8192
+    # the other backend has not loaded the model with the big bucket, nor has the other model
+    assert context_window.num_ctx("qwen2", 1500, backend="http://gpu-2:11434/api/generate") == 2048
+    assert context_window.num_ctx("llama3", 1500, backend="http://gpu-1:11434/api/generate") == 2048
+    # a bucket over the limit would not fit
+    assert context_window.num_ctx("qwen2", 1500, limit=4096, backend="http://gpu-1:11434/api/generate") == 2048
+
+
+def test_unloaded_bucket_is_forgotten():
+    context_window = window(keep_alive="0")
+    context_window.loaded("http://gpu-1:11434/api/generate", "qwen2", 8192)
+
+    assert context_window.loaded_num_ctx("http://gpu-1:11434/api/generate", "qwen2") is None
+    assert context_window.num_ctx("qwen2", 1500, backend="http://gpu-1:11434/api/generate") == 2048
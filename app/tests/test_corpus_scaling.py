@@ -0,0 +1,174 @@
+import itertools
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import pytest
+
+from app.bot.database.models.faq import FaqEntry, FaqSet
+from app.bot.knowledge.catalog import Catalog, DOCUMENTS, FAQ
+from app.bot.knowledge.context import assemble_prompt
+from app.bot.knowledge.knowledge_base import KnowledgeBase
+from app.bot.knowledge.retrieval import Retriever
+from app.tests.corpus import sync_peak_rss
+
+# 10000 takes a few minutes, BENCHMARK_CORPUS_SIZES=10,100,1000,10000 includes it (the nightly CI run does)
+CORPUS_SIZES = [int(size) for size in os.environ.get('BENCHMARK_CORPUS_SIZES', '10,100,1000').split(',')]
+# multiplies the budgets, for slow CI runners
+SLOWDOWN = float(os.environ.get('BENCHMARK_SLOWDOWN', '1'))
+
+QUESTION = "Какой порядок выплаты премии и компенсации за работу в выходные по коллективному договору?"
+
+
+@dataclass
+class Budget:
+    """
+    Allowed median of a benchmark: a fixed part and a part per document. The budgets are several times
+    the timings of a laptop, so they catch a change in complexity (a linear step turning quadratic)
+    rather than noise. Compare saved runs for small regressions:
+
+        pytest app/tests --benchmark-autosave
+        pytest app/tests --benchmark-compare --benchmark-compare-fail=median:25%
+    """
+    base: float
+    per_document: float
+
+    def limit(self, documents: int) -> float:
+        return (self.base + self.per_document * documents) * SLOWDOWN
+
+
+COLD_EXTRACTION = Budget(base=5.0, per_document=0.02)
+WARM_EXTRACTION = Budget(base=0.2, per_document=0.0005)
+SNAPSHOT_ASSEMBLY = Budget(base=0.1, per_document=0.001)
+RETRIEVAL_INDEXING = Budget(base=0.1, per_document=0.005)
+PROMPT_ASSEMBLY = Budget(base=0.02, per_document=0.0002)
+KEYBOARD = Budget(base=0.01, per_document=0.00002)
+# bytes: the interpreter with the bot imported, plus the manifest in memory
+PEAK_RSS = Budget(base=300 * 2 ** 20, per_document=60 * 2 ** 10)
+
+
+def check_budget(benchmark, budget: Budget, documents: int) -> None:
+    if benchmark.stats is None:
+        # --benchmark-disable
+        return
+
+    median = benchmark.stats.stats.median
+    limit = budget.limit(documents)
+    assert median <= limit, f"median of {median:.4f} s is over the budget of {limit:.4f} s for {documents} documents"
+
+
+@pytest.fixture(scope='session')
+def warm_knowledge_base(corpus_factory, tmp_path_factory):
+    """
+    Knowledge bases with the whole corpus extracted, by number of documents.
+    """
+    caches = {}
+
+    def get(size: int) -> KnowledgeBase:
+        if size not in caches:
+            caches[size] = str(tmp_path_factory.mktemp(f"cache{size}"))
+            KnowledgeBase.__wrapped__(corpus_factory(size).uploads_dir, caches[size]).sync()
+        return KnowledgeBase.__wrapped__(corpus_factory(size).uploads_dir, caches[size])
+
+    return get
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_cold_extraction(benchmark, corpus_factory, tmp_path, size):
+    corpus = corpus_factory(size)
+    rounds = itertools.count()
+
+    def setup():
+        cache_dir = str(tmp_path / f"cache{next(rounds)}")
+        return (KnowledgeBase.__wrapped__(corpus.uploads_dir, cache_dir),), {}
+
+    benchmark.pedantic(lambda knowledge_base: knowledge_base.sync(), setup=setup, rounds=1 if size >= 1000 else 3)
+    check_budget(benchmark, COLD_EXTRACTION, size)
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_warm_extraction(benchmark, corpus_factory, warm_knowledge_base, size):
+    cache_dir = warm_knowledge_base(size).cache_dir
+
+    def sync():
+        # a restart: the manifest is loaded, every file is compared by size and mtime
+        KnowledgeBase.__wrapped__(corpus_factory(size).uploads_dir, cache_dir).sync()
+
+    benchmark(sync)
+    check_budget(benchmark, WARM_EXTRACTION, size)
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_peak_rss(benchmark, corpus_factory, tmp_path, size):
+    def run() -> int:
+        # a fresh process, the peak of this one is left over from the earlier tests
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            return executor.submit(sync_peak_rss, corpus_factory(size).uploads_dir, str(tmp_path / "cache")).result()
+
+    # the time is that of a cold start, the interesting number is the peak in extra_info
+    peak = benchmark.pedantic(run, rounds=1)
+    benchmark.extra_info['peak_rss_mb'] = round(peak / 2 ** 20, 1)
+    limit = PEAK_RSS.limit(size)
+    assert peak <= limit, f"peak RSS of {peak / 2 ** 20:.0f} MB is over {limit / 2 ** 20:.0f} MB for {size} documents"
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_snapshot_assembly(benchmark, warm_knowledge_base, size):
+    knowledge_base = warm_knowledge_base(size)
+
+    # hashes the manifest and writes the snapshot
+    snapshot = benchmark(knowledge_base._rebuild_snapshot)
+    assert snapshot['documents'] == size
+    check_budget(benchmark, SNAPSHOT_ASSEMBLY, size)
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_retrieval_indexing(benchmark, warm_knowledge_base, size):
+    def setup():
+        return (warm_knowledge_base(size), Retriever.__wrapped__()), {}
+
+    # chunks every document and adds it to the lexical index, like a startup does
+    benchmark.pedantic(lambda knowledge_base, retriever: knowledge_base.add_listener(retriever), setup=setup,
+                       rounds=1 if size >= 1000 else 3)
+    check_budget(benchmark, RETRIEVAL_INDEXING, size)
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_prompt_assembly(benchmark, warm_knowledge_base, size):
+    retriever = Retriever.__wrapped__()
+    warm_knowledge_base(size).add_listener(retriever)
+
+    assembled = benchmark(lambda: assemble_prompt(QUESTION, retriever.search(QUESTION)))
+    assert assembled.passages
+    check_budget(benchmark, PROMPT_ASSEMBLY, size)
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_documents_keyboard(benchmark, corpus_factory, size):
+    names = corpus_factory(size).names
+
+    def build():
+        # a fresh catalog renders every page it is asked for
+        catalog = Catalog.__wrapped__()
+        catalog.set_documents(names)
+        catalog.documents_keyboard(1)
+        return catalog.documents_keyboard(math.ceil(size / catalog.page_sizes[DOCUMENTS]))
+
+    assert benchmark(build).inline_keyboard
+    check_budget(benchmark, KEYBOARD, size)
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_faq_keyboard(benchmark, size):
+    faq = FaqSet(entries=[FaqEntry(title=f"Вопрос {index}?", answer="Ответ.") for index in range(size)])
+
+    def build():
+        catalog = Catalog.__wrapped__()
+        catalog.set_faq(faq)
+        catalog.faq_keyboard(1)
+        return catalog.faq_keyboard(math.ceil(size / catalog.page_sizes[FAQ]))
+
+    assert benchmark(build).inline_keyboard
+    check_budget(benchmark, KEYBOARD, size)
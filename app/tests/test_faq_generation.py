@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import random
+
+from app.bot.knowledge import faq_generation
+from app.bot.knowledge.faq_generation import FaqGenerator, _FragmentState
+from app.bot.knowledge.knowledge_base import KnowledgeBase
+from app.tests.corpus import write_docx
+
+
+def generator_for(tmp_path, monkeypatch, documents: int = 3, **kwargs) -> FaqGenerator:
+    uploads_dir = tmp_path / "uploads"
+    uploads_dir.mkdir()
+    for index in range(documents):
+        write_docx(str(uploads_dir / f"{index}.docx"), 20, random.Random(index))
+    knowledge_base = KnowledgeBase.__wrapped__(str(uploads_dir), str(tmp_path / "cache"))
+    knowledge_base.sync()
+    monkeypatch.setattr(faq_generation, 'KnowledgeBase', lambda: knowledge_base)
+
+    return FaqGenerator.__wrapped__(state_path=str(tmp_path / "faq_job.json"), chunk_size=500, **kwargs)
+
+
+def test_state_is_saved_on_an_interval(tmp_path, monkeypatch):
+    generator = generator_for(tmp_path, monkeypatch, save_interval=3600)
+    generated = []
+    saves = []
+
+    async def generate(user_id, chunk, previous):
+        generated.append(chunk)
+        return _FragmentState(status="failed", attempts=1)
+
+    save_state = generator._save_state
+
+    async def counting_save_state(results, finished, kb_version):
+        saves.append(finished)
+        await save_state(results, finished, kb_version)
+
+    monkeypatch.setattr(generator, '_generate', generate)
+    monkeypatch.setattr(generator, '_save_state', counting_save_state)
+
+    async def report(progress):
+        pass
+
+    faq = asyncio.run(generator.run(user_id=1, on_progress=report))
+
+    assert len(generated) > 3
+    assert faq.entries == []
+    # once at the end, not once per fragment
+    assert saves == [False]
+    with open(generator.state_path, encoding='utf-8') as f:
+        assert len(json.load(f)['fragments']) == len(generated)
+
+
+def test_done_fragments_are_resumed(tmp_path, monkeypatch):
+    generator = generator_for(tmp_path, monkeypatch, save_interval=0)
+    calls = []
+
+    async def generate(user_id, chunk, previous):
+        calls.append(chunk)
+        # every other fragment fails, the next run retries only those
+        return _FragmentState(status="done" if len(calls) % 2 else "failed", attempts=1)
+
+    monkeypatch.setattr(generator, '_generate', generate)
+
+    async def report(progress):
+        pass
+
+    async def run_twice():
+        await generator.run(user_id=1, on_progress=report)
+        first_run = len(calls)
+        await generator.run(user_id=1, on_progress=report)
+        return first_run
+
+    first_run = asyncio.run(run_twice())
+
+    assert os.path.exists(generator.state_path)
+    assert len(calls) - first_run == first_run // 2
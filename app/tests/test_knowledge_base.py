@@ -0,0 +1,104 @@
+import json
+import os
+import random
+import threading
+
+import pytest
+
+from app.bot.knowledge.knowledge_base import KnowledgeBase
+from app.tests.corpus import write_docx
+
+
+class RecordingListener:
+    """
+    Records the changes it gets and whether the knowledge base could be read by another thread meanwhile.
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase):
+        self.knowledge_base = knowledge_base
+        self.events = []
+        self.lock_was_free = []
+
+    def _record(self, *event) -> None:
+        self.events.append(event)
+        reader = threading.Thread(target=lambda: self.knowledge_base.documents)
+        reader.start()
+        reader.join(1)
+        self.lock_was_free.append(not reader.is_alive())
+
+    def document_added(self, name: str, text: str) -> None:
+        self._record('added', name)
+
+    def document_removed(self, name: str) -> None:
+        self._record('removed', name)
+
+    def version_changed(self, version: str) -> None:
+        self._record('version', version)
+
+
+@pytest.fixture
+def knowledge_base(tmp_path):
+    uploads_dir = tmp_path / "uploads"
+    uploads_dir.mkdir()
+    return KnowledgeBase.__wrapped__(str(uploads_dir), str(tmp_path / "cache"))
+
+
+def upload(knowledge_base: KnowledgeBase, name: str, seed: int = 0) -> str:
+    path = os.path.join(knowledge_base.uploads_dir, name)
+    write_docx(path, 3, random.Random(seed))
+    return path
+
+
+def test_listeners_are_notified_outside_the_lock(knowledge_base):
+    listener = RecordingListener(knowledge_base)
+    knowledge_base.add_listener(listener)
+
+    knowledge_base.add_document(upload(knowledge_base, "a.docx"))
+    knowledge_base.add_document(upload(knowledge_base, "a.docx", seed=1))
+    knowledge_base.remove_document("a.docx")
+
+    assert [event for event in listener.events if event[0] != 'version'] == \
+        [('added', 'a.docx'), ('removed', 'a.docx'), ('added', 'a.docx'), ('removed', 'a.docx')]
+    assert all(listener.lock_was_free)
+    assert listener.events[-1] == ('version', knowledge_base.version)
+
+
+def test_sync_reports_the_new_version_once_after_its_documents(knowledge_base):
+    knowledge_base.sync()
+    listener = RecordingListener(knowledge_base)
+    knowledge_base.add_listener(listener)
+
+    for index in range(3):
+        upload(knowledge_base, f"{index}.docx", seed=index)
+    knowledge_base.sync()
+
+    assert [event[0] for event in listener.events] == ['added', 'added', 'added', 'version']
+    assert listener.events[-1] == ('version', knowledge_base.version)
+
+
+def test_replay_sends_the_documents_in_order(knowledge_base):
+    upload(knowledge_base, "b.docx", seed=2)
+    upload(knowledge_base, "a.docx", seed=1)
+    knowledge_base.sync()
+
+    listener = RecordingListener(knowledge_base)
+    knowledge_base.add_listener(listener)
+
+    assert listener.events == [('added', 'a.docx'), ('added', 'b.docx')]
+
+
+def test_snapshot_keeps_only_the_version(knowledge_base):
+    upload(knowledge_base, "a.docx")
+    knowledge_base.sync()
+    version = knowledge_base.version
+
+    with open(os.path.join(knowledge_base.cache_dir, 'snapshot.json'), encoding='utf-8') as f:
+        snapshot = json.load(f)
+    assert snapshot['version'] == version
+    assert 'text' not in snapshot
+
+    knowledge_base.add_document(upload(knowledge_base, "b.docx", seed=1))
+    assert knowledge_base.version != version
+
+    reopened = KnowledgeBase.__wrapped__(knowledge_base.uploads_dir, knowledge_base.cache_dir)
+    assert reopened.version == knowledge_base.version
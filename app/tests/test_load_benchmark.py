@@ -0,0 +1,32 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from app.tests.load_benchmark import parse_args, run_benchmark
+
+USERS = 3
+QUESTIONS = 2
+TIMEOUT = 120
+
+
+def load_run(argv: List[str]) -> dict:
+    """
+    Runs the load benchmark with the given command line arguments and returns its summary.
+    Meant for a fresh process: the configuration is read when app.bot is imported.
+    """
+    return asyncio.run(run_benchmark(parse_args(argv)))
+
+
+def test_load_generator_answers_every_user():
+    argv = ['--users', str(USERS), '--questions', str(QUESTIONS), '--think-time', '1',
+            '--token-rate', '200', '--first-token-delay', '0.05', '--answer-tokens', '40']
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        summary = executor.submit(load_run, argv).result(timeout=TIMEOUT)
+
+    assert summary['questions'] == USERS * QUESTIONS
+    assert summary['answered'] == USERS * QUESTIONS
+    assert summary['handler_errors'] == {}
+    assert summary['telegram']['rate_limited'] == 0
+    assert summary['ollama']['streamed'] == USERS * QUESTIONS
+    assert summary['latency']['p50'] is not None
@@ -0,0 +1,64 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from app.bot.utils import logs
+
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    yield stream
+    # back to the configuration of the bot
+    logs.configure_logging()
+
+
+def records(stream: io.StringIO):
+    logs.stop_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_json_with_request_id(output):
+    logs.configure_logging("INFO", [], "json", output)
+    logger = logging.getLogger("app.bot")
+
+    token = logs.request_id.set("42")
+    try:
+        logger.info("answered")
+    finally:
+        logs.request_id.reset(token)
+    logger.info("idle")
+
+    first, second = records(output)
+    assert first["message"] == "answered" and first["request_id"] == "42"
+    assert first["module"] == "app.tests.test_logs"
+    assert "request_id" not in second
+
+
+def test_levels_by_module_and_logger(output):
+    logs.configure_logging("WARNING", ["app.tests=DEBUG", "aiogram=ERROR"], "json", output)
+
+    logging.getLogger("app.bot").debug("ours")
+    logging.getLogger("aiogram.event").warning("library")
+    logging.getLogger("aiohttp").info("other")
+
+    assert [record["message"] for record in records(output)] == ["ours"]
+
+
+def test_long_messages_are_cut_unless_sampled():
+    handler = logs.BoundedQueueHandler(queue.Queue(), max_message=10, sample_rate=0)
+    record = logging.LogRecord("app.bot", logging.DEBUG, __file__, 1, "%s", ("x" * 100,), None)
+    assert handler.prepare(record).getMessage() == "x" * 10 + "… [90 more characters]"
+
+    handler.sample_rate = 1
+    assert handler.prepare(record).getMessage() == "x" * 100
+
+
+def test_full_queue_drops_records():
+    handler = logs.BoundedQueueHandler(queue.Queue(1))
+    for _ in range(3):
+        handler.handle(logging.LogRecord("app.bot", logging.INFO, __file__, 1, "message", None, None))
+    assert handler.dropped == 2
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from app.bot.api.ollama.resilience import CircuitBreaker, CircuitOpenError, CircuitState, retry_delay
+
+RESET_TIMEOUT = 0.05
+
+
+def breaker(failure_threshold: int = 3) -> CircuitBreaker:
+    return CircuitBreaker("http://ollama:11434", failure_threshold=failure_threshold, reset_timeout=RESET_TIMEOUT)
+
+
+def fail(circuit: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        circuit.before_request()
+        circuit.record_failure()
+
+
+def test_circuit_opens_after_consecutive_failures():
+    circuit = breaker()
+
+    fail(circuit, 2)
+    circuit.before_request()
+    circuit.record_success()
+    fail(circuit, 2)
+    assert circuit.state == CircuitState.CLOSED
+
+    fail(circuit, 1)
+    assert circuit.state == CircuitState.OPEN
+    assert not circuit.available
+    with pytest.raises(CircuitOpenError):
+        circuit.before_request()
+
+
+def test_half_open_trial_closes_or_reopens_the_circuit():
+    circuit = breaker()
+    fail(circuit, 3)
+    time.sleep(RESET_TIMEOUT)
+    assert circuit.state == CircuitState.HALF_OPEN
+
+    # a single trial request is let through
+    circuit.before_request()
+    with pytest.raises(CircuitOpenError):
+        circuit.before_request()
+
+    circuit.record_failure()
+    assert circuit.state == CircuitState.OPEN
+
+    time.sleep(RESET_TIMEOUT)
+    circuit.before_request()
+    circuit.record_success()
+    assert circuit.state == CircuitState.CLOSED
+    assert circuit.available
+
+
+def test_cancelled_trial_lets_the_next_request_through():
+    circuit = breaker()
+    fail(circuit, 3)
+    time.sleep(RESET_TIMEOUT)
+
+    circuit.before_request()
+    circuit.record_cancel()
+
+    assert circuit.available
+    circuit.before_request()
+
+
+def test_retries_of_one_request_count_once():
+    circuit = breaker(failure_threshold=2)
+
+    circuit.before_request()
+    circuit.record_failure()
+    for _ in range(3):
+        circuit.before_request()
+        circuit.record_failure(repeated=True)
+
+    assert circuit.state == CircuitState.CLOSED
+
+
+def test_retry_delay_grows_with_full_jitter():
+    delays = [[retry_delay(attempt, base=0.5) for _ in range(200)] for attempt in range(3)]
+
+    for attempt, samples in enumerate(delays):
+        assert all(0 <= delay <= 0.5 * 2 ** attempt for delay in samples)
+        # jittered, not the same delay for every client
+        assert len(set(samples)) > 1
+    assert max(delays[2]) > 0.5 * 2
@@ -0,0 +1,31 @@
+from app.bot.api.ollama.router import ModelRouter
+
+LONG_QUESTION = "Расскажите подробно " + "как оформить отпуск и что для этого нужно " * 10
+
+
+def router(**kwargs) -> ModelRouter:
+    options = dict(small_model="small", large_model="large", max_words=20, max_parts=2,
+                   large_max_in_flight=4, ttft_slo=2.0, slo_window=60)
+    options.update(kwargs)
+    return ModelRouter.__wrapped__(**options)
+
+
+def test_slow_large_model_falls_back_to_the_small_one():
+    model_router = router()
+    assert model_router.route(LONG_QUESTION).model == "large"
+
+    for _ in range(3):
+        model_router.observe_first_token("large", 5.0)
+
+    assert model_router.route(LONG_QUESTION).reason == "large_slo"
+
+
+def test_cold_load_does_not_count_against_the_slo():
+    model_router = router()
+
+    model_router.observe_first_token("large", 30.0, load_seconds=28.0)
+    for _ in range(3):
+        model_router.observe_first_token("large", 0.5, load_seconds=0.01)
+
+    assert model_router.recent_latency("large") == 0.5
+    assert model_router.route(LONG_QUESTION).model == "large"
@@ -0,0 +1,32 @@
+import asyncio
+
+import aiohttp
+
+from app.bot.utils.importtime import DEFERRED, by_package, measure
+from app.bot.utils.metrics import MetricsServer, MetricsRegistry
+
+
+def test_heavy_packages_are_imported_on_first_use():
+    packages = by_package(measure("app.bot.startup"))
+
+    assert "aiogram" in packages
+    assert not [package for package in DEFERRED if package in packages]
+
+
+def test_ready_endpoint():
+    async def run():
+        server = MetricsServer("127.0.0.1", 0, MetricsRegistry())
+        await server.start()
+        port = server._runner.addresses[0][1]
+        statuses = []
+        try:
+            async with aiohttp.ClientSession() as session:
+                for ready in (False, True, False):
+                    server.set_ready(ready)
+                    async with session.get(f"http://127.0.0.1:{port}/ready") as response:
+                        statuses.append(response.status)
+        finally:
+            await server.close()
+        return statuses
+
+    assert asyncio.run(run()) == [503, 200, 503]
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List, Optional
+
+from aiogram.exceptions import TelegramBadRequest
+
+from app.bot.utils.streaming import StreamingMessage, TokenBucket, answer_with_fallback, edit_with_fallback
+
+EDIT_INTERVAL = 0.3
+# a parse mode that is not passed is the default of the bot, like in aiogram
+BOT_DEFAULT = object()
+
+
+class FakeMessage:
+    """
+    Records the edits and sends of a stream with the loop time they were made at.
+    """
+
+    def __init__(self, calls: List[tuple], text: str = "…", markdown_errors: int = 0):
+        self.text = text
+        self.bot = SimpleNamespace(default=SimpleNamespace(parse_mode="Markdown"))
+        self.calls = calls
+        self.markdown_errors = markdown_errors
+
+    def _check(self, parse_mode) -> Optional[str]:
+        if parse_mode is BOT_DEFAULT:
+            parse_mode = self.bot.default.parse_mode
+        if parse_mode is not None and self.markdown_errors:
+            self.markdown_errors -= 1
+            raise TelegramBadRequest(method=None, message="Bad Request: can't parse entities")
+        return parse_mode
+
+    async def edit_text(self, text: str, reply_markup=None, parse_mode=BOT_DEFAULT):
+        parse_mode = self._check(parse_mode)
+        self.calls.append(("edit", self, text, parse_mode, asyncio.get_running_loop().time()))
+        self.text = text
+
+    async def answer(self, text: str, reply_markup=None, parse_mode=BOT_DEFAULT):
+        parse_mode = self._check(parse_mode)
+        self.calls.append(("send", self, text, parse_mode, asyncio.get_running_loop().time()))
+        return FakeMessage(self.calls, text)
+
+
+def stream(message: FakeMessage) -> StreamingMessage:
+    return StreamingMessage(message, bucket=TokenBucket(1000), edit_interval=EDIT_INTERVAL)
+
+
+def test_final_edit_keeps_the_interval():
+    async def run():
+        calls = []
+        async with stream(FakeMessage(calls)) as streaming:
+            streaming.append("Первая часть ответа.")
+            await asyncio.sleep(0.05)
+            streaming.append(" Вторая часть.")
+            await streaming.finish(reply_markup=object())
+        return calls
+
+    calls = asyncio.run(run())
+
+    assert [call[2] for call in calls] == ["Первая часть ответа.", "Первая часть ответа. Вторая часть."]
+    assert calls[1][4] - calls[0][4] >= EDIT_INTERVAL * 0.95
+
+
+def test_continuation_uses_the_parse_mode_of_the_bot():
+    async def run():
+        calls = []
+        async with stream(FakeMessage(calls)) as streaming:
+            streaming.append("слово " * 1000)
+            await streaming.finish()
+        return calls, streaming.messages
+
+    calls, messages = asyncio.run(run())
+
+    assert len(messages) == 2
+    assert [(call[0], call[3]) for call in calls] == [("edit", "Markdown"), ("send", "Markdown")]
+
+
+def test_send_falls_back_to_plain_text_like_an_edit():
+    async def run():
+        calls = []
+        message = FakeMessage(calls)
+        async with stream(message) as streaming:
+            message.markdown_errors = 2
+            streaming.append("*незакрытая разметка " + "слово " * 1000)
+            await streaming.finish()
+        return calls
+
+    calls = asyncio.run(run())
+
+    assert [(call[0], call[3]) for call in calls] == [("edit", None), ("send", None)]
+
+
+def test_cached_answer_falls_back_to_plain_text():
+    async def run():
+        calls = []
+        message = FakeMessage(calls, markdown_errors=1)
+        await answer_with_fallback(message, "*незакрытая разметка")
+        return calls
+
+    calls = asyncio.run(run())
+
+    assert [(call[0], call[2], call[3]) for call in calls] == [("send", "*незакрытая разметка", None)]
+
+
+def test_faq_entry_with_a_stray_underscore_is_shown_as_plain_text():
+    async def run():
+        calls = []
+        message = FakeMessage(calls, markdown_errors=1)
+        await edit_with_fallback(message, "*Отпуск*\n\nЗаявление по форме T_6")
+        return calls
+
+    calls = asyncio.run(run())
+
+    assert [(call[0], call[3]) for call in calls] == [("edit", None)]
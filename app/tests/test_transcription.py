@@ -0,0 +1,147 @@
+import asyncio
+import io
+import math
+import shutil
+import struct
+import threading
+import wave
+
+import numpy as np
+import pytest
+
+from app.bot.config import FFMPEG_BINARY
+from app.bot.speech import service as service_module
+from app.bot.speech.audio import AudioDecodeError, SAMPLE_RATE, decode_audio
+from app.bot.speech.service import TranscriptionQueueFullError, TranscriptionService
+
+CLIP = np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+
+def stub_service(**kwargs) -> TranscriptionService:
+    options = dict(kind='stub', workers=1, max_queue=8, batch_size=4, batch_window=0.05)
+    options.update(kwargs)
+    return TranscriptionService.__wrapped__(**options)
+
+
+async def record_batches(service: TranscriptionService, release: threading.Event = None) -> list:
+    """
+    Wraps the loaded transcribers, returns the list the batch sizes are appended to.
+    """
+    sizes = []
+
+    for transcriber in await asyncio.gather(*service._transcribers):
+        def recording(clips, transcribe=transcriber.transcribe):
+            if release is not None:
+                release.wait(5)
+            sizes.append(len(clips))
+            return transcribe(clips)
+
+        transcriber.transcribe = recording
+    return sizes
+
+
+def wav(seconds: float, rate: int = 8000, channels: int = 2) -> bytes:
+    frames = b''.join(
+        struct.pack('<h', int(8000 * math.sin(2 * math.pi * 440 * index / rate))) * channels
+        for index in range(int(seconds * rate))
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(frames)
+    return buffer.getvalue()
+
+
+def test_clips_arriving_together_are_one_batch():
+    async def run():
+        service = stub_service()
+        await service.start()
+        try:
+            sizes = await record_batches(service)
+            transcripts = await asyncio.gather(*(service.transcribe(CLIP) for _ in range(3)))
+            # an empty clip gets an empty transcript
+            transcripts.append(await service.transcribe(np.zeros(0, dtype=np.float32)))
+        finally:
+            await service.close()
+        return sizes, transcripts
+
+    sizes, transcripts = asyncio.run(run())
+
+    assert sizes == [3, 1]
+    assert transcripts == ["Как оформить отпуск?"] * 3 + [""]
+
+
+def test_full_queue_rejects_right_away():
+    async def run():
+        service = stub_service(max_queue=1, batch_size=1)
+        await service.start()
+        release = threading.Event()
+        try:
+            await record_batches(service, release)
+            # the worker takes the first clip and blocks on it, the second one waits in the queue
+            first = asyncio.create_task(service.transcribe(CLIP))
+            await asyncio.sleep(0.05)
+            second = asyncio.create_task(service.transcribe(CLIP))
+            await asyncio.sleep(0)
+
+            with pytest.raises(TranscriptionQueueFullError):
+                await service.transcribe(CLIP)
+
+            release.set()
+            return await asyncio.gather(first, second)
+        finally:
+            release.set()
+            await service.close()
+
+    assert asyncio.run(run()) == ["Как оформить отпуск?"] * 2
+
+
+def test_failed_model_turns_voice_questions_off(monkeypatch):
+    def broken(kind):
+        raise RuntimeError("no weights")
+
+    monkeypatch.setattr(service_module, 'create_transcriber', broken)
+
+    async def run():
+        service = stub_service()
+        await service.start()
+        try:
+            with pytest.raises(RuntimeError):
+                await service.transcribe(CLIP)
+        finally:
+            await service.close()
+        return service.enabled
+
+    assert asyncio.run(run()) is False
+
+
+def test_every_worker_has_its_own_model():
+    async def run():
+        service = stub_service(workers=3)
+        await service.start()
+        try:
+            transcribers = await asyncio.gather(*service._transcribers)
+        finally:
+            await service.close()
+        return transcribers
+
+    transcribers = asyncio.run(run())
+
+    assert len({id(transcriber) for transcriber in transcribers}) == 3
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BINARY) is None, reason="ffmpeg is not installed")
+def test_decode_audio_resamples_to_16khz_mono():
+    clip = asyncio.run(decode_audio(wav(0.5)))
+
+    assert clip.dtype == np.float32
+    assert abs(len(clip) - SAMPLE_RATE // 2) < SAMPLE_RATE // 100
+    assert 0.1 < np.abs(clip).max() <= 1
+
+
+@pytest.mark.skipif(shutil.which(FFMPEG_BINARY) is None, reason="ffmpeg is not installed")
+def test_decode_audio_rejects_other_files():
+    with pytest.raises(AudioDecodeError):
+        asyncio.run(decode_audio(b"not audio at all"))
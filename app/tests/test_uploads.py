@@ -0,0 +1,72 @@
+import asyncio
+import functools
+import random
+import zipfile
+
+from app.bot.knowledge import uploads
+from app.bot.knowledge.knowledge_base import KnowledgeBase
+from app.bot.knowledge.uploads import ArchiveImporter
+from app.tests.corpus import write_docx
+
+DOCUMENTS = 5
+
+
+class Repository:
+    def __init__(self):
+        self.saved = []
+
+    def save_document(self, record) -> None:
+        self.saved.append(record.name)
+
+    def remove_document(self, name: str) -> None:
+        pass
+
+
+class VersionListener:
+    def __init__(self):
+        self.added = []
+        self.versions = []
+
+    def document_added(self, name: str, text: str) -> None:
+        self.added.append(name)
+
+    def document_removed(self, name: str) -> None:
+        pass
+
+    def version_changed(self, version: str) -> None:
+        self.versions.append(version)
+
+
+def test_archive_is_imported_in_one_batch(tmp_path, monkeypatch):
+    uploads_dir = tmp_path / "uploads"
+    uploads_dir.mkdir()
+    knowledge_base = KnowledgeBase.__wrapped__(str(uploads_dir), str(tmp_path / "cache"))
+    knowledge_base.sync()
+    listener = VersionListener()
+    knowledge_base.add_listener(listener)
+
+    repository = Repository()
+    monkeypatch.setattr(uploads, 'KnowledgeBase', lambda: knowledge_base)
+    monkeypatch.setattr(uploads, 'get_repository', lambda: repository)
+    monkeypatch.setattr(uploads, 'unpack_archive', functools.partial(uploads.unpack_archive, uploads_dir=str(uploads_dir)))
+
+    rebuilds = []
+    rebuild_snapshot = knowledge_base._rebuild_snapshot
+    monkeypatch.setattr(knowledge_base, '_rebuild_snapshot', lambda: rebuilds.append(1) or rebuild_snapshot())
+
+    archive_path = tmp_path / "documents.zip"
+    with zipfile.ZipFile(archive_path, 'w') as archive:
+        for index in range(DOCUMENTS):
+            document = tmp_path / f"{index}.docx"
+            write_docx(str(document), 3, random.Random(index))
+            archive.write(document, f"docs/{index}.docx")
+
+    report = asyncio.run(ArchiveImporter.__wrapped__().run(str(archive_path), "documents.zip", user_id=1))
+
+    assert sorted(report.added) == [f"{index}.docx" for index in range(DOCUMENTS)]
+    assert sorted(repository.saved) == sorted(report.added)
+    assert sorted(listener.added) == sorted(report.added)
+    # the snapshot is rebuilt and the new version reported once for the whole archive
+    assert len(rebuilds) == 1
+    assert listener.versions == [knowledge_base.version]
+    assert len(knowledge_base.documents) == DOCUMENTS
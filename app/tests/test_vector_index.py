@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+from app.bot.knowledge import vector_index
+from app.bot.knowledge.chunking import Chunk
+from app.bot.knowledge.embedders import HashingEmbedder
+from app.bot.knowledge.vector_index import VectorIndex
+
+DOCUMENTS = {
+    "vacation.docx": ["Ежегодный оплачиваемый отпуск предоставляется сотруднику", "График отпусков на год"],
+    "salary.docx": ["Заработная плата выплачивается дважды в месяц", "Премия по итогам квартала"],
+    "safety.docx": ["Охрана труда и инструктаж на рабочем месте"],
+}
+
+
+def chunks_of(document: str):
+    return [Chunk(document=document, index=index, text=text) for index, text in enumerate(DOCUMENTS[document])]
+
+
+def fill(index: VectorIndex) -> None:
+    for document, texts in DOCUMENTS.items():
+        index.add_document(document, "\n\n".join(texts), chunks_of(document))
+
+
+def log_records(index: VectorIndex):
+    with open(os.path.join(index.directory, 'rows.jsonl'), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return VectorIndex(str(tmp_path / "vectors"), HashingEmbedder())
+
+
+def test_search_returns_the_best_chunks_first(index):
+    fill(index)
+
+    results = index.search_text("когда выплачивается заработная плата", top_k=2)
+
+    assert [chunk.document for chunk, _ in results][0] == "salary.docx"
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1]
+
+
+def test_append_skips_unchanged_documents(index):
+    fill(index)
+    records = len(log_records(index))
+
+    fill(index)
+
+    assert len(log_records(index)) == records
+    assert len(index) == len(DOCUMENTS)
+
+
+def test_changed_document_replaces_its_rows(index):
+    fill(index)
+
+    index.add_document("safety.docx", "Пожарная безопасность", [Chunk("safety.docx", 0, "Пожарная безопасность")])
+
+    texts = [chunk.text for chunk, _ in index.search_text("безопасность охрана труда", top_k=10)]
+    assert "Пожарная безопасность" in texts
+    assert "Охрана труда и инструктаж на рабочем месте" not in texts
+
+
+def test_removed_document_is_tombstoned(index):
+    fill(index)
+
+    index.remove_document("salary.docx")
+
+    assert index.fingerprint("salary.docx") is None
+    assert {"deleted": "salary.docx"} in log_records(index)
+    assert all(chunk.document != "salary.docx" for chunk, _ in index.search_text("заработная плата", top_k=10))
+
+
+def test_reopening_replays_the_log(index):
+    fill(index)
+    index.remove_document("vacation.docx")
+    expected = index.search_text("премия", top_k=3)
+
+    reopened = VectorIndex(index.directory, HashingEmbedder())
+
+    assert len(reopened) == len(DOCUMENTS) - 1
+    assert reopened.fingerprint("salary.docx") == index.fingerprint("salary.docx")
+    assert [(chunk, round(score, 5)) for chunk, score in reopened.search_text("премия", top_k=3)] == \
+        [(chunk, round(score, 5)) for chunk, score in expected]
+
+
+def test_other_embedder_resets_the_index(index):
+    fill(index)
+
+    reopened = VectorIndex(index.directory, HashingEmbedder(dim=128))
+
+    assert len(reopened) == 0
+    assert reopened.search_text("премия", top_k=3) == []
+
+
+def test_compaction_drops_dead_rows(index, monkeypatch):
+    monkeypatch.setattr(vector_index, 'INITIAL_CAPACITY', 2)
+    fill(index)
+
+    index.remove_document("vacation.docx")
+    index.remove_document("salary.docx")
+
+    # four dead rows of five, the log is rewritten with the live one only
+    records = log_records(index)
+    assert [record['document'] for record in records] == ["safety.docx"]
+    assert records[0]['row'] == 0
+
+    reopened = VectorIndex(index.directory, HashingEmbedder())
+    assert [chunk.document for chunk, _ in reopened.search_text("охрана труда", top_k=5)] == ["safety.docx"]
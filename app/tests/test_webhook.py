@@ -0,0 +1,99 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+
+from app.tests.fake_bot_api import FakeBotApi
+from app.tests.fake_ollama import FakeOllama
+from app.tests.load_benchmark import LoadGenerator, prepare_environment, serve
+
+SECRET = "webhook-secret"
+USER_ID = 500
+ANSWER_TIMEOUT = 60
+
+
+def webhook_flow(workdir: str) -> dict:
+    """
+    Runs the bot in webhook mode against the fakes and goes through the support flow over HTTP.
+    Meant for a fresh process: the configuration is read when app.bot is imported.
+    """
+    return asyncio.run(_webhook_flow(workdir))
+
+
+async def _webhook_flow(workdir: str) -> dict:
+    ollama = FakeOllama(token_rate=200, first_token_delay=0.05, answer_tokens=40)
+    api = FakeBotApi()
+    ollama_runner, ollama_url = await serve(ollama.app)
+    api_runner, api_url = await serve(api.app)
+
+    os.environ['WEBHOOK_URL'] = "https://bot.example.com"
+    os.environ['WEBHOOK_SECRET'] = SECRET
+    prepare_environment(workdir, ollama_url, api_url)
+
+    from app.bot.config import SMALL_LLM_MODEL, LARGE_LLM_MODEL, WEBHOOK_PATH
+    from app.bot.startup import Startup
+
+    ollama.pull(SMALL_LLM_MODEL, LARGE_LLM_MODEL)
+    startup = Startup()
+    startup.register_routes()
+    startup.register_middlewares()
+    startup.register_lifecycle()
+    # the startup hooks (warm-up, setWebhook) run while the runner is set up
+    webhook_runner, webhook_url = await serve(startup.webhook_app())
+    methods_at_start = [call.method for call in api.calls]
+
+    statuses = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            async def post(update: dict, secret: str = SECRET) -> None:
+                async with session.post(webhook_url + WEBHOOK_PATH, json=update,
+                                        headers={'X-Telegram-Bot-Api-Secret-Token': secret}) as response:
+                    statuses.append(response.status)
+
+            await post({'update_id': 1, 'callback_query': {
+                'id': "1", 'chat_instance': str(USER_ID), 'data': 'support_button',
+                'from': LoadGenerator._user_json(USER_ID), 'message': LoadGenerator._bot_message(USER_ID),
+            }})
+            question = {'update_id': 2, 'message': {
+                'message_id': 2, 'date': int(time.time()), 'text': "Как оформить отпуск?",
+                'chat': {'id': USER_ID, 'type': 'private'}, 'from': LoadGenerator._user_json(USER_ID),
+            }}
+            await post(question, secret="wrong")
+            await post(question)
+
+            # updates are handled in the background, the answer is done once the keyboard is attached
+            deadline = time.monotonic() + ANSWER_TIMEOUT
+            while not any(call.reply_markup for call in api.chat_calls(USER_ID, 'editMessageText')):
+                if time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(0.05)
+    finally:
+        await webhook_runner.cleanup()
+        await api_runner.cleanup()
+        await ollama_runner.cleanup()
+
+    edits = [call for call in api.chat_calls(USER_ID, 'editMessageText') if call.ok]
+    return {
+        'methods_at_start': methods_at_start,
+        'methods': [call.method for call in api.calls],
+        'statuses': statuses,
+        'answer': edits[-1].text if edits and edits[-1].reply_markup else None,
+        'rate_limited': api.rate_limited,
+        'generations': ollama.stats.streamed,
+    }
+
+
+def test_support_flow_over_the_webhook(tmp_path):
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        result = executor.submit(webhook_flow, str(tmp_path)).result(timeout=ANSWER_TIMEOUT * 2)
+
+    assert 'setWebhook' in result['methods_at_start']
+    # a wrong secret token is rejected before the dispatcher sees the update
+    assert result['statuses'] == [200, 401, 200]
+    assert result['answer']
+    assert result['generations'] == 1
+    assert result['rate_limited'] == 0
+    assert result['methods'][-1] == 'deleteWebhook'